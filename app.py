@@ -1,84 +1,2073 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, g, has_app_context, has_request_context, Response
 import mysql.connector
-from functools import wraps
+from functools import wraps, lru_cache
 from mysql.connector import Error
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 import os
-from werkzeug.utils import secure_filename
-from datetime import datetime
+import threading
+import time
+import gzip
+import base64
+import json
+import queue
+import re
+import csv
+import io
+import hashlib
+import bisect
+import heapq
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from collections import deque, Counter, OrderedDict
+from datetime import datetime, timedelta
+from collections.abc import MutableMapping
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
 from authlib.integrations.flask_client import OAuth
+from jinja2 import FileSystemBytecodeCache, TemplateError, nodes
+from jinja2.ext import Extension
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    from PIL import Image, ImageOps, ImageSequence
+except ImportError:
+    Image = None
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)
+
+def instance_secret_key():
+    # Fallback when SECRET_KEY is unset: generated once and kept in the
+    # instance folder, so restarts and every worker sign cookies alike.
+    path = os.path.join(app.instance_path, 'secret_key')
+    try:
+        os.makedirs(app.instance_path, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError as e:
+        print(f"Error persisting secret key, sessions will not survive a restart: {e}")
+        return secrets.token_hex(32)
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    return key
+
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or instance_secret_key()
 UPLOAD_FOLDER = 'static/uploads/profile_pics'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-app.config['GOOGLE_CLIENT_ID'] = os.environ.get('GOOGLE_CLIENT_ID', 'YOUR_GOOGLE_CLIENT_ID_HERE')
-app.config['GOOGLE_CLIENT_SECRET'] = os.environ.get('GOOGLE_CLIENT_SECRET', 'YOUR_GOOGLE_CLIENT_SECRET_HERE')
-app.config['FACEBOOK_CLIENT_ID'] = os.environ.get('FACEBOOK_CLIENT_ID', 'YOUR_FACEBOOK_CLIENT_ID_HERE')
-app.config['FACEBOOK_CLIENT_SECRET'] = os.environ.get('FACEBOOK_CLIENT_SECRET', 'YOUR_FACEBOOK_CLIENT_SECRET_HERE')
-app.config['SERVER_NAME'] = '127.0.0.1:5000'
+app.config['GOOGLE_CLIENT_ID'] = os.environ.get('GOOGLE_CLIENT_ID', 'YOUR_GOOGLE_CLIENT_ID_HERE')
+app.config['GOOGLE_CLIENT_SECRET'] = os.environ.get('GOOGLE_CLIENT_SECRET', 'YOUR_GOOGLE_CLIENT_SECRET_HERE')
+app.config['FACEBOOK_CLIENT_ID'] = os.environ.get('FACEBOOK_CLIENT_ID', 'YOUR_FACEBOOK_CLIENT_ID_HERE')
+app.config['FACEBOOK_CLIENT_SECRET'] = os.environ.get('FACEBOOK_CLIENT_SECRET', 'YOUR_FACEBOOK_CLIENT_SECRET_HERE')
+# Unset by default so the app answers on whatever host it is reached by.
+app.config['SERVER_NAME'] = os.environ.get('SERVER_NAME') or None
+
+oauth = OAuth(app)
+
+app.config['DB_HOST'] = os.environ.get('DB_HOST', 'localhost')
+app.config['DB_USER'] = os.environ.get('DB_USER', 'root')
+app.config['DB_PASSWORD'] = os.environ.get('DB_PASSWORD', '@uttej123*')
+app.config['DB_NAME'] = os.environ.get('DB_NAME', 'lumoradb')
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_POOL_MAX_OVERFLOW'] = int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+app.config['DB_POOL_PRE_PING'] = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+app.config['DB_POOL_WARM'] = int(os.environ.get('DB_POOL_WARM', app.config['DB_POOL_SIZE']))
+# Read replicas as "host[:port]" entries, e.g. DB_REPLICAS=10.0.0.5,10.0.0.6:3307;
+# they share the primary's user, password and database name.
+app.config['DB_REPLICAS'] = [h.strip() for h in os.environ.get('DB_REPLICAS', '').split(',') if h.strip()]
+app.config['REPLICA_MAX_LAG'] = float(os.environ.get('REPLICA_MAX_LAG', 5))
+app.config['REPLICA_CHECK_INTERVAL'] = float(os.environ.get('REPLICA_CHECK_INTERVAL', 2))
+app.config['REPLICA_RETRY_INTERVAL'] = float(os.environ.get('REPLICA_RETRY_INTERVAL', 10))
+app.config['READ_YOUR_WRITES_WINDOW'] = float(os.environ.get('READ_YOUR_WRITES_WINDOW', 10))
+app.config['CATALOG_TTL'] = int(os.environ.get('CATALOG_TTL', 300))
+app.config['CATALOG_VERSION_CHECK_INTERVAL'] = float(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', 5))
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+app.config['QUERY_STATS_WINDOW'] = int(os.environ.get('QUERY_STATS_WINDOW', 500))
+app.config['ORDER_CACHE_SIZE'] = int(os.environ.get('ORDER_CACHE_SIZE', 2048))
+app.config['ORDER_CACHE_ACTIVE_TTL'] = float(os.environ.get('ORDER_CACHE_ACTIVE_TTL', 5))
+app.config['REDIS_URL'] = os.environ.get('REDIS_URL')
+app.config['CART_COUNT_TTL'] = int(os.environ.get('CART_COUNT_TTL', 600))
+# Without Redis each worker caches its own counts and only the worker that
+# handled a cart change forgets its copy, so keep the others' short-lived.
+app.config['CART_COUNT_LOCAL_TTL'] = int(os.environ.get('CART_COUNT_LOCAL_TTL', 5))
+app.config['ORDER_WORKER_MODE'] = os.environ.get('ORDER_WORKER_MODE', 'thread')
+app.config['ORDER_WORKER_THREADS'] = int(os.environ.get('ORDER_WORKER_THREADS', 1))
+app.config['ORDER_QUEUE_BATCH_SIZE'] = int(os.environ.get('ORDER_QUEUE_BATCH_SIZE', 20))
+app.config['ORDER_QUEUE_POLL_INTERVAL'] = float(os.environ.get('ORDER_QUEUE_POLL_INTERVAL', 1))
+app.config['ORDER_QUEUE_MAX_ATTEMPTS'] = int(os.environ.get('ORDER_QUEUE_MAX_ATTEMPTS', 5))
+app.config['SSE_HEARTBEAT'] = float(os.environ.get('SSE_HEARTBEAT', 15))
+app.config['SSE_SUBSCRIBER_BUFFER'] = int(os.environ.get('SSE_SUBSCRIBER_BUFFER', 100))
+# Streams end after this many seconds and the browser reconnects, so a sync
+# worker thread is never held by one page indefinitely.
+app.config['SSE_MAX_LIFETIME'] = float(os.environ.get('SSE_MAX_LIFETIME', 300))
+# Every process with open streams polls order_events this often, so events
+# published by another worker or the order-worker process reach its streams.
+app.config['ORDER_EVENT_POLL_INTERVAL'] = float(os.environ.get('ORDER_EVENT_POLL_INTERVAL', 0.5))
+app.config['ORDER_EVENT_RETENTION'] = int(os.environ.get('ORDER_EVENT_RETENTION', 3600))
+app.config['MENU_CACHE_CONTROL'] = os.environ.get('MENU_CACHE_CONTROL', 'public, max-age=0, must-revalidate')
+app.config['IMAGE_STORE'] = os.environ.get('IMAGE_STORE', 'static/uploads/images')
+app.config['IMAGE_WIDTHS'] = tuple(int(w) for w in os.environ.get('IMAGE_WIDTHS', '96,320,640').split(','))
+app.config['IMAGE_QUALITY'] = int(os.environ.get('IMAGE_QUALITY', 80))
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'kv' if app.config['REDIS_URL'] else 'mysql')
+app.config['SESSION_LIFETIME'] = int(os.environ.get('SESSION_LIFETIME', 7 * 86400))
+app.config['SESSION_CACHE_SIZE'] = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+# Seconds a loaded session may be served from this process's memory. Other
+# workers' writes (a logout included) are not seen until the entry expires,
+# so leave it at 0 unless the app runs as a single process.
+app.config['SESSION_CACHE_TTL'] = float(os.environ.get('SESSION_CACHE_TTL', 0))
+app.config['SESSION_PURGE_INTERVAL'] = float(os.environ.get('SESSION_PURGE_INTERVAL', 300))
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no')
+app.config['RATE_LIMIT_MAX_KEYS'] = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+# Number of reverse proxies in front of the app. Each one appends to
+# X-Forwarded-For, so the client is that many hops from the end; 0 means the
+# app is reached directly and the header is ignored (it is client-supplied).
+app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+# "<requests>/<seconds>" per bucket; any policy can be overridden with
+# RATE_LIMIT_<NAME>, e.g. RATE_LIMIT_LOGIN_IP=20/60.
+app.config['RATE_LIMITS'] = {
+    name: os.environ.get(f'RATE_LIMIT_{name.upper()}', default) for name, default in {
+        'global_ip': '600/60',
+        'login_ip': '20/60',
+        'login_account': '5/300',
+        'signup_ip': '5/600',
+        'admin_login_ip': '5/60',
+        'password_reset_ip': '5/600',
+        'contact_ip': '5/600',
+        'cart_client': '120/60',
+        'checkout_user': '10/60',
+        'menu_ip': '240/60',
+    }.items()
+}
+app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get('FRAGMENT_CACHE_SIZE', 256))
+app.config['FRAGMENT_CACHE_TTL'] = float(os.environ.get('FRAGMENT_CACHE_TTL', 0)) or None
+app.config['FRAGMENT_LANGUAGES'] = ('en', 'hi', 'te')
+app.config['ASSET_PIPELINE'] = os.environ.get('ASSET_PIPELINE', '1').lower() not in ('0', 'false', 'no')
+app.config['ASSET_CACHE_CONTROL'] = os.environ.get('ASSET_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+app.config['WARM_UP'] = os.environ.get('WARM_UP', '1').lower() not in ('0', 'false', 'no')
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja-cache'))
+
+
+class PoolTimeout(Error):
+    pass
+
+
+SQL_NORMALIZERS = [
+    (re.compile(r"'(?:''|[^'\\]|\\.)*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+'), '(...)'),
+    (re.compile(r'(?:WHEN \? THEN \?\s*)+', re.IGNORECASE), 'WHEN ? THEN ? '),
+    (re.compile(r'\s+'), ' '),
+]
+
+def sql_fingerprint(sql):
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode('utf-8', 'replace')
+    for pattern, replacement in SQL_NORMALIZERS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+def record_query(sql, elapsed):
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms >= app.config['SLOW_QUERY_MS']:
+        app.logger.warning(json.dumps({'event': 'slow_query', 'ms': round(elapsed_ms, 2), 'sql': sql_fingerprint(sql),
+                                       'endpoint': request.endpoint if has_request_context() else None}))
+    if not has_app_context():
+        return
+    stats = g.get('query_stats')
+    if stats is None:
+        return
+    fingerprint = sql_fingerprint(sql)
+    stats['count'] += 1
+    stats['time'] += elapsed_ms
+    stats['fingerprints'][fingerprint] += 1
+    if elapsed_ms > stats['slowest_ms']:
+        stats['slowest_ms'] = elapsed_ms
+        stats['slowest'] = fingerprint
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+        return False
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+
+class PooledConnection:
+    def __init__(self, pool, conn, created_at, request_scoped=False):
+        self._pool = pool
+        self._conn = conn
+        self._created_at = created_at
+        self._request_scoped = request_scoped
+        self.replica = None
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise Error("Connection has already been returned to the pool.")
+        return getattr(self._conn, name)
+
+    def is_connected(self):
+        return self._conn is not None and self._conn.is_connected()
+
+    def cursor(self, *args, **kwargs):
+        if self._conn is None:
+            raise Error("Connection has already been returned to the pool.")
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        if self._conn is None:
+            raise Error("Connection has already been returned to the pool.")
+        self._conn.commit()
+        if has_app_context():
+            g.db_wrote = True
+
+    def close(self):
+        # Request-scoped connections are shared by the context processor and the
+        # view, so they go back to the pool at app-context teardown instead.
+        if not self._request_scoped:
+            self.release()
+
+    def release(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool.release(conn, self._created_at)
+
+
+class ConnectionPool:
+    def __init__(self, size=5, max_overflow=10, timeout=5, recycle=1800, pre_ping=True, **connect_args):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.connect_args = connect_args
+        self._idle = deque()
+        self._cond = threading.Condition()
+        self._open = 0
+        self._in_use = 0
+        self._stats = {'checkouts': 0, 'waits': 0, 'wait_time': 0.0, 'max_wait': 0.0,
+                       'timeouts': 0, 'connects': 0, 'recycled': 0, 'ping_failures': 0}
+
+    def _connect(self):
+        conn = mysql.connector.connect(connection_timeout=5, **self.connect_args)
+        self._count('connects')
+        return conn, time.monotonic()
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def acquire(self, request_scoped=False):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        entry = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(msg=f"Timed out after {self.timeout}s waiting for a pooled connection.")
+                waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_time = time.monotonic() - started
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += wait_time
+                self._stats['max_wait'] = max(self._stats['max_wait'], wait_time)
+
+        try:
+            if entry is not None:
+                conn, created_at = entry
+                if self.recycle and time.monotonic() - created_at > self.recycle:
+                    self._count('recycled')
+                    self._discard(conn)
+                    entry = None
+                elif self.pre_ping and not conn.is_connected():
+                    self._count('ping_failures')
+                    self._discard(conn)
+                    entry = None
+            if entry is None:
+                conn, created_at = self._connect()
+        except Error:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn, created_at, request_scoped)
+
+    def release(self, conn, created_at):
+        healthy = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Error:
+            healthy = False
+        with self._cond:
+            self._in_use -= 1
+            if healthy and len(self._idle) < self.size:
+                self._idle.append((conn, created_at))
+                conn = None
+            else:
+                self._open -= 1
+            self._cond.notify()
+        if conn is not None:
+            self._discard(conn)
+
+    def warm(self, count):
+        # Opens connections ahead of traffic so the first requests skip the
+        # handshake; they go straight back to the idle list.
+        conns = []
+        try:
+            for _ in range(min(count, self.size)):
+                conns.append(self.acquire())
+        except Error as e:
+            print(f"Error warming connection pool: {e}")
+        for conn in conns:
+            conn.release()
+        return len(conns)
+
+    def dispose(self):
+        # Closes idle connections, e.g. in a pre-fork master, so no worker
+        # inherits a socket that another process is also using.
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(size=self.size, max_overflow=self.max_overflow, open=self._open,
+                         in_use=self._in_use, idle=len(self._idle))
+        stats['avg_wait'] = stats['wait_time'] / stats['waits'] if stats['waits'] else 0.0
+        return stats
+
+
+db_pool = ConnectionPool(
+    size=app.config['DB_POOL_SIZE'],
+    max_overflow=app.config['DB_POOL_MAX_OVERFLOW'],
+    timeout=app.config['DB_POOL_TIMEOUT'],
+    recycle=app.config['DB_POOL_RECYCLE'],
+    pre_ping=app.config['DB_POOL_PRE_PING'],
+    host=app.config['DB_HOST'],
+    user=app.config['DB_USER'],
+    password=app.config['DB_PASSWORD'],
+    database=app.config['DB_NAME'],
+)
+
+
+class ReplicaRouter:
+    # Hands out read-only connections from healthy replicas, round-robin. A
+    # replica is skipped while it lags more than max_lag, has replication
+    # stopped or cannot be reached; callers then read from the primary.
+    def __init__(self, pools, max_lag=5, check_interval=2, retry_interval=10):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.replicas = [{'name': name, 'pool': pool, 'healthy': True, 'lag': None, 'error': None,
+                          'checked_at': None, 'checking': False} for name, pool in pools]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._stats = {'replica_reads': 0, 'primary_reads': 0, 'pinned_reads': 0, 'lag_checks': 0, 'failovers': 0}
+
+    def count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _read_lag(self, cur):
+        try:
+            cur.execute("SHOW REPLICA STATUS")
+        except Error:
+            cur.execute("SHOW SLAVE STATUS")  # MySQL before 8.0.22
+        rows = cur.fetchall()
+        if not rows:
+            # Not replicating at all, e.g. a standalone read-only copy.
+            return 0.0
+        lags = [row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master')) for row in rows]
+        # NULL means the replication threads are stopped.
+        return None if None in lags else float(max(lags))
+
+    def _check(self, replica):
+        lag, error = None, None
+        try:
+            conn = replica['pool'].acquire()
+            try:
+                with conn.cursor(dictionary=True) as cur:
+                    lag = self._read_lag(cur)
+            finally:
+                conn.release()
+            if lag is None:
+                error = "replication stopped"
+            elif lag > self.max_lag:
+                error = f"lagging {lag:.0f}s"
+        except Error as e:
+            error = str(e)
+        if error and replica['healthy']:
+            print(f"Replica {replica['name']} taken out of rotation: {error}")
+        with self._lock:
+            self._stats['lag_checks'] += 1
+            replica.update(healthy=error is None, lag=lag, error=error, checked_at=time.monotonic(), checking=False)
+
+    def _due(self, replica, now):
+        if replica['checking']:
+            return False
+        if replica['checked_at'] is None:
+            return True
+        interval = self.check_interval if replica['healthy'] else self.retry_interval
+        return now - replica['checked_at'] >= interval
+
+    def acquire(self, request_scoped=False):
+        # Returns None when no replica can serve the read.
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = self.replicas[self._next % len(self.replicas)]
+                self._next += 1
+                check = self._due(replica, time.monotonic())
+                if check:
+                    replica['checking'] = True
+            if check:
+                self._check(replica)
+            if not replica['healthy']:
+                continue
+            try:
+                conn = replica['pool'].acquire(request_scoped)
+            except Error as e:
+                print(f"Replica {replica['name']} unreachable: {e}")
+                with self._lock:
+                    replica.update(healthy=False, error=str(e), checked_at=time.monotonic())
+                    self._stats['failovers'] += 1
+                continue
+            conn.replica = replica['name']
+            self.count('replica_reads')
+            return conn
+        return None
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica['pool'].dispose()
+
+    def warm(self, count):
+        return sum(replica['pool'].warm(count) for replica in self.replicas)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['replicas'] = [{'name': r['name'], 'healthy': r['healthy'], 'lag': r['lag'], 'error': r['error'],
+                                  'pool': r['pool'].stats()} for r in self.replicas]
+        return stats
+
+
+def replica_pool(spec):
+    host, _, port = spec.partition(':')
+    return spec, ConnectionPool(
+        size=app.config['DB_POOL_SIZE'],
+        max_overflow=app.config['DB_POOL_MAX_OVERFLOW'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        recycle=app.config['DB_POOL_RECYCLE'],
+        pre_ping=app.config['DB_POOL_PRE_PING'],
+        host=host,
+        port=int(port or 3306),
+        user=app.config['DB_USER'],
+        password=app.config['DB_PASSWORD'],
+        database=app.config['DB_NAME'],
+    )
+
+replica_router = ReplicaRouter(
+    [replica_pool(spec) for spec in app.config['DB_REPLICAS']],
+    max_lag=app.config['REPLICA_MAX_LAG'],
+    check_interval=app.config['REPLICA_CHECK_INTERVAL'],
+    retry_interval=app.config['REPLICA_RETRY_INTERVAL'],
+)
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS catalog_version (
+        id TINYINT PRIMARY KEY,
+        version BIGINT NOT NULL
+    )
+    """,
+    "INSERT IGNORE INTO catalog_version (id, version) VALUES (1, 1)",
+    """
+    CREATE TABLE IF NOT EXISTS checkout_requests (
+        idempotency_key VARCHAR(64) PRIMARY KEY,
+        user_id INT NOT NULL,
+        order_id INT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_jobs (
+        job_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL,
+        kind VARCHAR(32) NOT NULL,
+        status VARCHAR(16) NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        available_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+        created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+        finished_at DATETIME(3) NULL,
+        last_error VARCHAR(255) NULL,
+        KEY idx_order_jobs_claim (status, available_at, job_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_events (
+        event_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+        KEY idx_order_events_created (created_at)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS kitchen_tickets (
+        ticket_id INT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL UNIQUE,
+        summary TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_order_summary (
+        user_id INT PRIMARY KEY,
+        order_count INT NOT NULL DEFAULT 0,
+        lifetime_spend DECIMAL(12, 2) NOT NULL DEFAULT 0,
+        last_order_id INT NULL,
+        last_order_at DATETIME NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sales_hourly (
+        bucket_hour DATETIME PRIMARY KEY,
+        order_count INT NOT NULL DEFAULT 0,
+        items_sold INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(14, 2) NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_sales_daily (
+        day DATE NOT NULL,
+        product_id INT NOT NULL,
+        units INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS category_sales_daily (
+        day DATE NOT NULL,
+        category VARCHAR(50) NOT NULL,
+        units INT NOT NULL DEFAULT 0,
+        revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, category)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS active_users_daily (
+        day DATE NOT NULL,
+        user_id INT NOT NULL,
+        PRIMARY KEY (day, user_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id VARCHAR(64) NOT NULL PRIMARY KEY,
+        data MEDIUMTEXT NOT NULL,
+        expires_at DATETIME NOT NULL,
+        KEY idx_sessions_expires (expires_at)
+    )
+    """,
+    "ALTER TABLE order_items ADD COLUMN product_name VARCHAR(255) NULL",
+    "ALTER TABLE order_items ADD COLUMN product_image VARCHAR(255) NULL",
+    "CREATE INDEX idx_profile_created ON profile (created_at, user_id)",
+    "CREATE INDEX idx_profile_username ON profile (username)",
+    "CREATE INDEX idx_orders_user_created ON orders (user_id, created_at, order_id, status, total_amount)",
+    "CREATE INDEX idx_products_category_name ON products (category, name, product_id)",
+    "CREATE INDEX idx_products_type_category_name ON products (type, category, name, product_id)",
+]
+# Duplicate column / duplicate key name: the change is already in place.
+IGNORED_SCHEMA_ERRORS = {1060, 1061}
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def ensure_schema():
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        conn = db_pool.acquire()
+        try:
+            with conn.cursor() as cur:
+                for statement in SCHEMA_STATEMENTS:
+                    try:
+                        cur.execute(statement)
+                    except Error as e:
+                        if e.errno not in IGNORED_SCHEMA_ERRORS:
+                            raise
+            conn.commit()
+            _schema_ready = True
+        finally:
+            conn.release()
+
+@app.cli.command('migrate')
+def migrate_command():
+    # Some statements add columns and indexes to orders, products and
+    # order_items, which can rebuild those tables; run this once per deploy,
+    # before starting the app, never from a request.
+    ensure_schema()
+    print(f"Applied {len(SCHEMA_STATEMENTS)} schema statements.")
+
+PRIMARY_PIN_COOKIE = 'primary_until'
+
+def pinned_to_primary():
+    # Read-your-writes: set after this client's last write, see pin_writers_to_primary.
+    if has_app_context() and g.get('db_wrote'):
+        return True
+    if not has_request_context():
+        return False
+    try:
+        until = float(request.cookies.get(PRIMARY_PIN_COOKIE, 0))
+    except ValueError:
+        return False
+    now = time.time()
+    # The cookie is client-supplied; never honour more than one window (with
+    # a second of slack for the rounding in pin_writers_to_primary).
+    return now < until <= now + app.config['READ_YOUR_WRITES_WINDOW'] + 1
+
+def get_read_connection(request_scoped=True):
+    if pinned_to_primary():
+        replica_router.count('pinned_reads')
+        return None
+    if not request_scoped or not has_app_context():
+        return replica_router.acquire()
+    if 'db_replica_conn' not in g:
+        conn = replica_router.acquire(request_scoped=True)
+        if conn is None:
+            return None
+        g.db_replica_conn = conn
+    return g.db_replica_conn
+
+def get_db_connection(request_scoped=True, readonly=False):
+    # readonly=True may return a replica connection; pass it only for reads
+    # that tolerate up to REPLICA_MAX_LAG of staleness.
+    try:
+        if readonly and replica_router.replicas:
+            conn = get_read_connection(request_scoped)
+            if conn is not None:
+                return conn
+            replica_router.count('primary_reads')
+        if not request_scoped or not has_app_context():
+            return db_pool.acquire()
+        if 'db_conn' not in g:
+            g.db_conn = db_pool.acquire(request_scoped=True)
+        return g.db_conn
+    except Error as e:
+        print(f"DB connection error: {e}")
+        return None
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    for key in ('db_conn', 'db_replica_conn'):
+        conn = g.pop(key, None)
+        if conn is not None:
+            conn.release()
+
+@app.after_request
+def pin_writers_to_primary(response):
+    # Replicas serving reads are at most REPLICA_MAX_LAG behind, so a client
+    # that just wrote reads from the primary until the window has passed. A
+    # cookie of its own, so pinning never costs a session write.
+    if g.get('db_wrote') and replica_router.replicas:
+        window = app.config['READ_YOUR_WRITES_WINDOW']
+        response.set_cookie(PRIMARY_PIN_COOKIE, f"{time.time() + window:.3f}", max_age=int(window + 0.999),
+                            httponly=True, secure=app.config['SESSION_COOKIE_SECURE'],
+                            samesite=app.config['SESSION_COOKIE_SAMESITE'])
+    return response
+
+
+class QueryStatsAggregator:
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._fingerprints = {}
+
+    def add(self, endpoint, stats, total_ms, n_plus_one):
+        with self._lock:
+            samples = self._endpoints.setdefault(endpoint, {'requests': 0, 'n_plus_one': 0, 'samples': deque(maxlen=self.window)})
+            samples['requests'] += 1
+            samples['n_plus_one'] += 1 if n_plus_one else 0
+            samples['samples'].append((stats['count'], stats['time'], total_ms))
+            for fingerprint, count in stats['fingerprints'].items():
+                entry = self._fingerprints.setdefault(fingerprint, {'calls': 0, 'endpoints': set()})
+                entry['calls'] += count
+                entry['endpoints'].add(endpoint)
+
+    def snapshot(self, top=20):
+        with self._lock:
+            endpoints = {}
+            for endpoint, data in self._endpoints.items():
+                samples = list(data['samples'])
+                queries = sorted(s[0] for s in samples)
+                db_ms = sorted(s[1] for s in samples)
+                total_ms = sorted(s[2] for s in samples)
+                endpoints[endpoint] = {
+                    'requests': data['requests'],
+                    'n_plus_one_requests': data['n_plus_one'],
+                    'window': len(samples),
+                    'queries_avg': round(sum(queries) / len(samples), 2),
+                    'queries_max': queries[-1],
+                    'db_ms_avg': round(sum(db_ms) / len(samples), 2),
+                    'db_ms_p95': round(db_ms[int(0.95 * (len(samples) - 1))], 2),
+                    'total_ms_p95': round(total_ms[int(0.95 * (len(samples) - 1))], 2),
+                }
+            fingerprints = sorted(self._fingerprints.items(), key=lambda item: item[1]['calls'], reverse=True)[:top]
+            return {
+                'endpoints': endpoints,
+                'top_queries': [{'sql': sql, 'calls': data['calls'], 'endpoints': sorted(data['endpoints'])}
+                                for sql, data in fingerprints],
+            }
+
+
+query_stats = QueryStatsAggregator(window=app.config['QUERY_STATS_WINDOW'])
+
+@app.before_request
+def start_query_stats():
+    g.request_started = time.perf_counter()
+    g.query_stats = {'count': 0, 'time': 0.0, 'slowest': None, 'slowest_ms': 0.0, 'fingerprints': Counter()}
+
+@app.after_request
+def report_query_stats(response):
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+    total_ms = (time.perf_counter() - g.request_started) * 1000
+    endpoint = request.endpoint or 'unknown'
+    repeated = [(sql, n) for sql, n in stats['fingerprints'].items() if n > app.config['N_PLUS_ONE_THRESHOLD']]
+
+    timing = f'db;dur={stats["time"]:.2f};desc="{stats["count"]} queries", app;dur={total_ms:.2f}'
+    existing = response.headers.get('Server-Timing')
+    response.headers['Server-Timing'] = f"{existing}, {timing}" if existing else timing
+
+    query_stats.add(endpoint, stats, total_ms, bool(repeated))
+    log = {'event': 'request', 'endpoint': endpoint, 'method': request.method, 'status': response.status_code,
+           'ms': round(total_ms, 2), 'queries': stats['count'], 'db_ms': round(stats['time'], 2),
+           'slowest_ms': round(stats['slowest_ms'], 2), 'slowest_sql': stats['slowest']}
+    app.logger.info(json.dumps(log))
+    for sql, n in repeated:
+        app.logger.warning(json.dumps({'event': 'n_plus_one', 'endpoint': endpoint, 'sql': sql, 'count': n}))
+    return response
+
+
+class CatalogCache:
+    def __init__(self, ttl=300, version_check_interval=5):
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self.version = 0
+        self._lock = threading.RLock()
+        self._products = None
+        self._by_id = {}
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self.listeners = []
+
+    def _is_fresh(self, now):
+        return (self._products is not None
+                and now - self._loaded_at < self.ttl
+                and now - self._checked_at < self.version_check_interval)
+
+    def _read_version(self, cur):
+        cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+        row = cur.fetchone()
+        return row['version'] if row else 0
+
+    def _load(self, conn):
+        with conn.cursor(dictionary=True) as cur:
+            version = self._read_version(cur)
+            if conn.replica and self._products is not None and version < self.version:
+                # A lagging replica; keep the newer copy this process already has.
+                self._checked_at = time.monotonic()
+                return
+            cur.execute("SELECT * FROM products ORDER BY category, name")
+            products = cur.fetchall()
+        now = time.monotonic()
+        self._products = products
+        self._by_id = {p['product_id']: p for p in products}
+        self.version = version
+        self._loaded_at = self._checked_at = now
+
+    def _refresh(self):
+        if self._is_fresh(time.monotonic()):
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._is_fresh(now):
+                return
+            conn = get_db_connection(readonly=True)
+            if not conn:
+                return
+            try:
+                if self._products is None or now - self._loaded_at >= self.ttl:
+                    self._load(conn)
+                else:
+                    with conn.cursor(dictionary=True) as cur:
+                        version = self._read_version(cur)
+                    self._checked_at = now
+                    if version != self.version:
+                        self._load(conn)
+            except Error as e:
+                print(f"Error loading catalog: {e}")
+            finally:
+                if conn.is_connected(): conn.close()
+
+    def products(self):
+        self._refresh()
+        return self._products
+
+    def snapshot(self):
+        self._refresh()
+        with self._lock:
+            return self.version, self._products
+
+    def _lookup(self, by_id, product_id):
+        try:
+            return by_id.get(int(product_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, product_id):
+        self._refresh()
+        return self._lookup(self._by_id, product_id)
+
+    def get_many(self, product_ids):
+        self._refresh()
+        by_id = self._by_id
+        found = {}
+        for product_id in product_ids:
+            product = self._lookup(by_id, product_id)
+            if product:
+                found[str(product_id)] = product
+        return found
+
+    def bump_version(self, cur):
+        cur.execute("UPDATE catalog_version SET version = LAST_INSERT_ID(version + 1) WHERE id = 1")
+        return cur.lastrowid
+
+    def invalidate(self):
+        # Marks the copy stale rather than dropping it: readers keep the old
+        # snapshot until the next _refresh() has loaded and swapped in a new one.
+        with self._lock:
+            self._loaded_at = self._checked_at = 0.0
+
+    def upsert(self, version, product):
+        with self._lock:
+            if self._products is None or version != self.version + 1:
+                self.invalidate()
+                return
+            by_id = dict(self._by_id)
+            by_id[product['product_id']] = product
+            self._set(by_id, version)
+            self._notify('upsert', version, product)
+
+    def remove(self, version, product_id):
+        with self._lock:
+            if self._products is None or version != self.version + 1:
+                self.invalidate()
+                return
+            by_id = dict(self._by_id)
+            by_id.pop(product_id, None)
+            self._set(by_id, version)
+            self._notify('remove', version, product_id)
+
+    def _notify(self, action, version, payload):
+        for listener in self.listeners:
+            try:
+                listener(action, version, payload)
+            except Exception as e:
+                print(f"Error in catalog listener: {e}")
+
+    def _set(self, by_id, version):
+        # Swap in new objects rather than mutating, so readers holding the old
+        # list keep a consistent snapshot.
+        self._products = sorted(by_id.values(), key=lambda p: (p['category'] or '', p['name'] or ''))
+        self._by_id = by_id
+        self.version = version
+
+
+catalog = CatalogCache(
+    ttl=app.config['CATALOG_TTL'],
+    version_check_interval=app.config['CATALOG_VERSION_CHECK_INTERVAL'],
+)
+
+# Endpoint overrides (GOOGLE_TOKEN_URL, FACEBOOK_USERINFO_URL, ...) let both
+# serving modes run against local stub providers.
+OAUTH_PROVIDERS = {
+    'google': {
+        'access_token_url': os.environ.get('GOOGLE_TOKEN_URL', 'https://accounts.google.com/o/oauth2/token'),
+        'authorize_url': os.environ.get('GOOGLE_AUTHORIZE_URL', 'https://accounts.google.com/o/oauth2/auth'),
+        'userinfo_endpoint': os.environ.get('GOOGLE_USERINFO_URL', 'https://openidconnect.googleapis.com/v1/userinfo'),
+        'api_base_url': 'https://www.googleapis.com/oauth2/v1/',
+        'client_kwargs': {'scope': 'openid email profile'},
+        'server_metadata_url': None if 'GOOGLE_TOKEN_URL' in os.environ else 'https://accounts.google.com/.well-known/openid-configuration',
+    },
+    'facebook': {
+        'access_token_url': os.environ.get('FACEBOOK_TOKEN_URL', 'https://graph.facebook.com/oauth/access_token'),
+        'authorize_url': os.environ.get('FACEBOOK_AUTHORIZE_URL', 'https://www.facebook.com/dialog/oauth'),
+        'userinfo_endpoint': os.environ.get('FACEBOOK_USERINFO_URL', 'https://graph.facebook.com/me?fields=id,name,email,picture{url}'),
+        'api_base_url': 'https://graph.facebook.com/',
+        'client_kwargs': {'scope': 'email'},
+    },
+}
+
+_oauth_lock = threading.Lock()
+
+def oauth_client(provider):
+    # Providers are registered on first use, keeping them off the cold-start
+    # path of workers that never handle a social login.
+    client = oauth.create_client(provider)
+    if client is None:
+        with _oauth_lock:
+            client = oauth.create_client(provider)
+            if client is None:
+                oauth.register(
+                    name=provider,
+                    client_id=app.config[f'{provider.upper()}_CLIENT_ID'],
+                    client_secret=app.config[f'{provider.upper()}_CLIENT_SECRET'],
+                    **OAUTH_PROVIDERS[provider]
+                )
+                client = oauth.create_client(provider)
+    return client
+
+def social_profile(provider, user_info):
+    if provider == 'facebook':
+        picture = (user_info.get('picture') or {}).get('data', {}).get('url')
+    else:
+        picture = user_info.get('picture')
+    return user_info.get('email'), user_info.get('name'), picture
+
+
+class LocalKVStore:
+    # In-process stand-in for the handful of Redis commands the app uses, so
+    # the same calls work whether or not REDIS_URL is configured.
+    SWEEP_EVERY = 1000
+
+    def __init__(self):
+        self._data = {}
+        # Reentrant, so transaction() can hold it across the calls it wraps.
+        self._lock = threading.RLock()
+        self._writes = 0
+
+    def _entry(self, key, now):
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _sweep(self, now):
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0:
+            expired = [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]
+            for key in expired:
+                del self._data[key]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entry(key, time.monotonic())
+            return entry[0] if entry else None
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            now = time.monotonic()
+            self._data[key] = (value, now + ex if ex else None)
+            self._sweep(now)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        # Redis runs func under WATCH and retries it on a conflicting write;
+        # holding the store lock across it has the same effect in process.
+        with self._lock:
+            value = func(self)
+        return value if value_from_callable else []
+
+    def multi(self):
+        # Pipeline API used inside transaction(); commands here run at once.
+        pass
+
+
+if redis and app.config['REDIS_URL']:
+    kv_store = redis.Redis.from_url(app.config['REDIS_URL'], decode_responses=True)
+else:
+    kv_store = LocalKVStore()
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+class ServerSession(SessionMixin, MutableMapping):
+    # Only the id arrives with the request; the stored data is fetched the
+    # first time a view actually reads the session, so requests that never
+    # touch it (static files, the menu, rate-limited rejections) cost nothing.
+    def __init__(self, store, sid=None):
+        self.store = store
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.loaded_user = None
+        self.expires_at = None
+        # Keys set or deleted by this request; saving applies only these.
+        self.changed = set()
+        # The request's cookie names no live session and should be cleared.
+        self.stale_cookie = False
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.accessed = True
+            record = self.store.load(self.sid) if self.sid else None
+            if record is None:
+                self.stale_cookie = self.stale_cookie or self.sid is not None
+                self.sid, self.new, self._data = None, True, {}
+            else:
+                self._data, self.expires_at = record
+            self.loaded_user = self._data.get('user_id')
+        return self._data
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.changed.add(key)
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.changed.add(key)
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class MySQLSessionBackend:
+    def load(self, sid):
+        conn = get_db_connection()
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT data, expires_at FROM sessions WHERE session_id = %s AND expires_at > NOW()", (sid,))
+                return cur.fetchone()
+        finally:
+            if conn.is_connected(): conn.close()
+
+    def _write(self, query, params):
+        # Not the request's connection: a session write must not commit
+        # whatever the view left open in its transaction.
+        conn = get_db_connection(request_scoped=False)
+        if not conn:
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+            conn.commit()
+        except Error as e:
+            conn.rollback()
+            print(f"Error saving session: {e}")
+        finally:
+            conn.close()
+
+    def save(self, sid, merge, expires_at):
+        # merge(stored payload or None) returns the payload to write, or None
+        # to leave the row alone; the row stays locked while it runs.
+        conn = get_db_connection(request_scoped=False)
+        if not conn:
+            return
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT data FROM sessions WHERE session_id = %s AND expires_at > NOW() FOR UPDATE", (sid,))
+                row = cur.fetchone()
+                payload = merge(row[0] if row else None)
+                if payload is not None:
+                    cur.execute("""
+                        INSERT INTO sessions (session_id, data, expires_at) VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE data = VALUES(data), expires_at = VALUES(expires_at)
+                    """, (sid, payload, expires_at))
+            conn.commit()
+        except Error as e:
+            conn.rollback()
+            print(f"Error saving session: {e}")
+        finally:
+            conn.close()
+
+    def delete(self, sid):
+        self._write("DELETE FROM sessions WHERE session_id = %s", (sid,))
+
+    def purge(self):
+        self._write("DELETE FROM sessions WHERE expires_at <= NOW() LIMIT 1000", ())
+
+
+class KVSessionBackend:
+    # Works against Redis or the LocalKVStore stand-in; expiry is the key TTL.
+    def __init__(self, store):
+        self.store = store
+
+    def load(self, sid):
+        value = self.store.get(f"session:{sid}")
+        if value is None:
+            return None
+        payload, expires_at = json.loads(value)
+        return payload, datetime.fromisoformat(expires_at)
+
+    def save(self, sid, merge, expires_at):
+        # Same contract as MySQLSessionBackend.save; WATCH makes Redis retry
+        # merge if another worker wrote the session in between.
+        key = f"session:{sid}"
+        ttl = max(int((expires_at - datetime.now()).total_seconds()), 1)
+
+        def apply(pipe):
+            value = pipe.get(key)
+            payload = merge(json.loads(value)[0] if value else None)
+            pipe.multi()
+            if payload is not None:
+                pipe.set(key, json.dumps([payload, expires_at.isoformat()]), ex=ttl)
+
+        self.store.transaction(apply, key)
+
+    def delete(self, sid):
+        self.store.delete(f"session:{sid}")
+
+    def purge(self):
+        pass
+
+
+class SessionStore:
+    # Optional per-process LRU in front of the durable backend, for single
+    # process deployments (see SESSION_CACHE_TTL).
+    def __init__(self, backend, cache_size=10000, cache_ttl=5, lifetime=86400, purge_interval=300):
+        self.backend = backend
+        self.cache = LRUCache(maxsize=cache_size)
+        self.cache_ttl = cache_ttl
+        self.lifetime = lifetime
+        self.purge_interval = purge_interval
+        self.serializer = TaggedJSONSerializer()
+        self._lock = threading.Lock()
+        self._stats = Counter()
+        self._purged_at = time.monotonic()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def load(self, sid):
+        entry = self.cache.get(sid) if self.cache_ttl else None
+        if entry is None:
+            entry = self.backend.load(sid)
+            if entry is None:
+                return None
+            if self.cache_ttl:
+                self.cache.set(sid, entry, ttl=self.cache_ttl)
+        payload, expires_at = entry
+        if expires_at <= datetime.now():
+            self.cache.delete(sid)
+            return None
+        return self.serializer.loads(payload), expires_at
+
+    def save(self, sid, data, changes=None):
+        # With changes=None the session is new and written whole. Otherwise
+        # only the changed keys are applied to the stored copy, so concurrent
+        # requests on one session keep each other's writes, and a session
+        # deleted meanwhile (a logout in another tab) stays deleted; then
+        # None is returned.
+        written = []
+
+        def merge(stored):
+            if changes is None:
+                payload = self.serializer.dumps(dict(data))
+            elif stored is None or not changes:
+                payload = stored
+            else:
+                current = self.serializer.loads(stored)
+                for key in changes:
+                    if key in data:
+                        current[key] = data[key]
+                    else:
+                        current.pop(key, None)
+                payload = self.serializer.dumps(current)
+            written[:] = [payload]
+            return payload
+
+        expires_at = datetime.now() + timedelta(seconds=self.lifetime)
+        self.backend.save(sid, merge, expires_at)
+        if written == [None]:
+            self.cache.delete(sid)
+            return None
+        if written and self.cache_ttl:
+            self.cache.set(sid, (written[0], expires_at), ttl=self.cache_ttl)
+        self._count('writes')
+        self._maybe_purge()
+        return expires_at
+
+    def touch(self, session):
+        # Sliding expiry without a write per request: only extend once half
+        # of the lifetime has been used up.
+        if session.expires_at and (session.expires_at - datetime.now()).total_seconds() < self.lifetime / 2:
+            self.save(session.sid, session.data, changes=())
+            self._count('touches')
+
+    def delete(self, sid):
+        self.backend.delete(sid)
+        self.cache.delete(sid)
+        self._count('deletes')
+
+    def _maybe_purge(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._purged_at < self.purge_interval:
+                return
+            self._purged_at = now
+        self.backend.purge()
+
+    def stats(self):
+        with self._lock:
+            counts = {key: self._stats[key] for key in ('writes', 'touches', 'deletes')}
+        return {'backend': type(self.backend).__name__, **counts, 'cache': self.cache.stats()}
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        session = ServerSession(self.store, cookie if cookie and len(cookie) <= 64 else None)
+        session.stale_cookie = bool(cookie) and session.sid is None
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.loaded or not session:
+            if session.loaded and session.sid:
+                self.store.delete(session.sid)
+            if session.stale_cookie or (session.loaded and session.sid):
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            self.store.touch(session)
+            return
+        changes = session.changed
+        if session.sid and session.get('user_id') != session.loaded_user:
+            # New id on login/logout so a pre-login id can't be fixed on a victim.
+            self.store.delete(session.sid)
+            session.sid = None
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+            changes = None
+        if self.store.save(session.sid, session.data, changes) is None:
+            response.delete_cookie(name, domain=domain, path=path)
+            return
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+if app.config['SESSION_BACKEND'] == 'mysql':
+    session_backend = MySQLSessionBackend()
+else:
+    session_backend = KVSessionBackend(kv_store)
+
+session_store = SessionStore(
+    session_backend,
+    cache_size=app.config['SESSION_CACHE_SIZE'],
+    cache_ttl=app.config['SESSION_CACHE_TTL'],
+    lifetime=app.config['SESSION_LIFETIME'],
+    purge_interval=app.config['SESSION_PURGE_INTERVAL'],
+)
+app.session_interface = ServerSessionInterface(session_store)
+
+@app.cli.command('purge-sessions')
+def purge_sessions_command():
+    session_backend.purge()
+
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry)}
+"""
+
+def parse_rate(rate):
+    requests, seconds = rate.split('/')
+    return int(requests), float(requests) / float(seconds)
+
+
+class TokenBucketLimiter:
+    # Buckets live in process unless Redis is configured, in which case a Lua
+    # script does the refill-and-take atomically so all workers share them.
+    # In-process buckets are per worker, so with N workers a client gets up
+    # to N times each limit; production deployments should set REDIS_URL.
+    def __init__(self, policies, redis_client=None, max_keys=100000):
+        self.policies = {name: parse_rate(rate) for name, rate in policies.items()}
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT) if redis_client is not None else None
+        self.admitted = Counter()
+        self.rejected = Counter()
+
+    def _take_local(self, key, capacity, rate):
+        with self._lock:
+            now = time.monotonic()
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry = (1 - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._sweep_buckets(now)
+            return retry == 0.0, retry
+
+    def _sweep_buckets(self, now):
+        # A bucket that has refilled completely carries no state worth keeping.
+        for key, (tokens, ts) in list(self._buckets.items()):
+            capacity, rate = self.policies[key.split(':', 1)[0]]
+            if tokens + (now - ts) * rate >= capacity:
+                del self._buckets[key]
+        if len(self._buckets) > self.max_keys:
+            # Still full under a wide spray of keys: start over rather than
+            # paying for a sweep on every request.
+            self._buckets.clear()
+
+    def take(self, policy, identity):
+        capacity, rate = self.policies[policy]
+        key = f"{policy}:{identity}"
+        if self._script is not None:
+            try:
+                allowed, retry = self._script(keys=[f"ratelimit:{key}"], args=[capacity, rate])
+                allowed, retry = bool(int(allowed)), float(retry)
+            except redis.RedisError as e:
+                # Fail open: a limiter outage should not take the site down.
+                print(f"Rate limiter error: {e}")
+                allowed, retry = True, 0.0
+        else:
+            allowed, retry = self._take_local(key, capacity, rate)
+        with self._lock:
+            (self.admitted if allowed else self.rejected)[policy] += 1
+        return allowed, retry
+
+    def stats(self):
+        with self._lock:
+            policies = {policy: {'capacity': capacity, 'per_second': round(rate, 4),
+                                 'admitted': self.admitted[policy], 'rejected': self.rejected[policy]}
+                        for policy, (capacity, rate) in self.policies.items()}
+            return {'backend': 'redis' if self._script is not None else 'local',
+                    'tracked_keys': len(self._buckets), 'policies': policies}
+
+
+rate_limiter = TokenBucketLimiter(
+    app.config['RATE_LIMITS'],
+    redis_client=None if isinstance(kv_store, LocalKVStore) else kv_store,
+    max_keys=app.config['RATE_LIMIT_MAX_KEYS'],
+)
+
+if app.config['TRUSTED_PROXIES']:
+    # Rewrites REMOTE_ADDR (and the scheme) from the hops our own proxies
+    # added, so per-IP limits key on the client rather than the proxy.
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
+
+def client_ip():
+    return request.remote_addr or 'unknown'
+
+def client_identity():
+    # A cookie costs nothing to mint, so only one that resolves to a signed-in
+    # session earns its own (per-account) bucket; everyone else is keyed on
+    # the IP. The session read happens after global_ip has passed, and the
+    # cart views load the session anyway.
+    if request.cookies.get(app.session_interface.get_cookie_name(app)):
+        user_id = session.get('user_id')
+        if user_id is not None:
+            return f"user:{user_id}"
+    return f"ip:{client_ip()}"
+
+def login_account():
+    if request.method == 'POST' and request.form.get('form_type') == 'login':
+        return request.form.get('login-identifier', '').strip().lower() or None
+    return None
+
+def login_ip():
+    return client_ip() if login_account() else None
+
+def signup_ip():
+    if request.method == 'POST' and request.form.get('form_type') == 'signup':
+        return client_ip()
+    return None
+
+def post_ip():
+    return client_ip() if request.method == 'POST' else None
+
+def post_identity():
+    return client_identity() if request.method == 'POST' else None
+
+# endpoint -> [(policy, identity function)]; an identity of None skips the
+# policy for that request (e.g. GETs of a form page).
+RATE_LIMITED_ENDPOINTS = {
+    'auth_handler': [('login_ip', login_ip), ('login_account', login_account), ('signup_ip', signup_ip)],
+    'admin_login_page': [('admin_login_ip', post_ip)],
+    'forgot_password_page': [('password_reset_ip', post_ip)],
+    'contact_page': [('contact_ip', post_ip)],
+    'add_to_cart': [('cart_client', client_identity)],
+    'bulk_update_cart': [('cart_client', client_identity)],
+    'update_cart': [('cart_client', client_identity)],
+    'remove_from_cart': [('cart_client', client_identity)],
+    'checkout_page': [('checkout_user', post_identity)],
+    'get_canteen_menu': [('menu_ip', client_ip)],
+    'search_canteen_menu': [('menu_ip', client_ip)],
+}
+RATE_LIMIT_EXEMPT = ('static', 'dist_asset')
+
+@app.before_request
+def enforce_rate_limits():
+    # Runs ahead of every view, so a rejected request never touches the pool
+    # or a password hash.
+    if not app.config['RATE_LIMIT_ENABLED'] or request.endpoint in RATE_LIMIT_EXEMPT:
+        return None
+    checks = [('global_ip', client_ip)] + RATE_LIMITED_ENDPOINTS.get(request.endpoint, [])
+    for policy, identity in checks:
+        key = identity()
+        if key is None:
+            continue
+        allowed, retry = rate_limiter.take(policy, key)
+        if not allowed:
+            retry_after = max(int(retry + 0.999), 1)
+            app.logger.warning(json.dumps({'event': 'rate_limited', 'policy': policy, 'endpoint': request.endpoint,
+                                           'ip': client_ip(), 'retry_after': retry_after}))
+            response = jsonify(success=False, message="Too many requests. Please try again later.")
+            response.status_code = 429
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+    return None
+
+
+def static_path(url):
+    # Product images are stored as '/static/...' URLs and profile pictures as
+    # paths relative to the static folder; normalize both to the latter.
+    if not url or url.startswith(('http://', 'https://', '//', 'data:')):
+        return ''
+    url = url.lstrip('/')
+    return url[len('static/'):] if url.startswith('static/') else url
+
+
+class ImagePipeline:
+    # Uploads are stored once per content hash under IMAGE_STORE. The upload
+    # request writes the metadata-stripped original, so the returned path is
+    # servable at once; only the resized WebP variants are built on a small
+    # thread pool.
+    FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'gif': 'GIF', 'webp': 'WEBP'}
+    # Variants may be built by another process, so a partial set is looked
+    # up again after this many seconds.
+    RECHECK_SECONDS = 30
+
+    def __init__(self, root, widths, quality=80, workers=2):
+        self.root = root
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.workers = workers
+        self.processed = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._variants = LRUCache(maxsize=4096)
+        # Stored paths are relative to the static folder, like profile_picture_url.
+        self.url_prefix = os.path.relpath(os.path.abspath(root), app.static_folder).replace('\\', '/')
+
+    def _paths(self, digest, ext):
+        name = f"{digest[:2]}/{digest}.{ext}"
+        return os.path.join(self.root, name), f"{self.url_prefix}/{name}"
+
+    def _variant_name(self, path, width):
+        return f"{os.path.splitext(path)[0]}-{width}.webp"
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-pipeline')
+        return self._executor.submit(fn, *args)
+
+    def store(self, data, ext, background=True):
+        ext = ext.lower().lstrip('.')
+        if ext == 'jpeg':
+            ext = 'jpg'
+        digest = hashlib.sha256(data).hexdigest()
+        path, rel = self._paths(digest, ext)
+        if os.path.exists(path):
+            with self._lock:
+                self.deduplicated += 1
+            return rel
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Concurrent uploads of the same bytes may both get here; each write
+        # is an atomic replace with identical content, so that is harmless.
+        self._write_original(path, data)
+        if Image is None:
+            return rel
+        with self._lock:
+            if path in self._pending:
+                self.deduplicated += 1
+                return rel
+            self._pending.add(path)
+        if background:
+            self.submit(self._process, path)
+        else:
+            self._process(path)
+        return rel
+
+    def store_file(self, source, background=True):
+        with open(source, 'rb') as f:
+            data = f.read()
+        return self.store(data, os.path.splitext(source)[1] or 'jpg', background=background)
+
+    def _write(self, path, data):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _write_original(self, path, data):
+        # The raw upload may carry EXIF (GPS, device); re-encoding without
+        # exif/icc arguments drops it. Animated images keep every frame.
+        if Image is not None:
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with Image.open(io.BytesIO(data)) as img:
+                    fmt = self.FORMATS.get(path.rsplit('.', 1)[-1], 'JPEG')
+                    if getattr(img, 'is_animated', False):
+                        img.save(tmp, format=fmt, save_all=True)
+                    else:
+                        img = ImageOps.exif_transpose(img)
+                        if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+                            img = img.convert('RGB')
+                        img.save(tmp, format=fmt, quality=self.quality, optimize=True)
+                os.replace(tmp, path)
+                return
+            except Exception as e:
+                # Fall back to serving the upload as-is rather than losing it.
+                print(f"Error re-encoding image {path}: {e}")
+                with self._lock:
+                    self.failed += 1
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        self._write(path, data)
+
+    def _process(self, path):
+        try:
+            with Image.open(path) as img:
+                if getattr(img, 'is_animated', False):
+                    frames, durations = [], []
+                    for frame in ImageSequence.Iterator(img):
+                        durations.append(frame.info.get('duration', 100))
+                        frames.append(frame.convert('RGBA'))
+                    options = {'save_all': True, 'duration': durations, 'loop': img.info.get('loop', 0)}
+                else:
+                    if img.mode not in ('RGB', 'RGBA'):
+                        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+                    frames, options = [img], {}
+                for width in self.widths:
+                    if width >= img.width:
+                        break
+                    scaled = []
+                    for frame in frames:
+                        frame = frame.copy()
+                        frame.thumbnail((width, frame.height))
+                        scaled.append(frame)
+                    if options:
+                        options['append_images'] = scaled[1:]
+                    tmp = f"{path}.{width}.tmp"
+                    scaled[0].save(tmp, format='WEBP', quality=self.quality, method=4, **options)
+                    os.replace(tmp, self._variant_name(path, width))
+            with self._lock:
+                self.processed += 1
+        except Exception as e:
+            # The original is already in place; it is just served without variants.
+            print(f"Error processing image {path}: {e}")
+            with self._lock:
+                self.failed += 1
+        finally:
+            with self._lock:
+                self._pending.discard(path)
+            self._variants.delete(path)
+
+    def owns(self, url):
+        return static_path(url).startswith(self.url_prefix + '/')
+
+    def variants(self, url):
+        rel = static_path(url)
+        if not rel.startswith(self.url_prefix + '/'):
+            return []
+        path = os.path.join(self.root, rel[len(self.url_prefix) + 1:])
+        found = self._variants.get(path)
+        if found is None:
+            found = [(f"{os.path.splitext(rel)[0]}-{w}.webp", w) for w in self.widths
+                     if os.path.exists(self._variant_name(path, w))]
+            # Variants can still be in flight here or in another process, so
+            # only a complete answer is cached for good.
+            if path not in self._pending:
+                self._variants.set(path, found, ttl=None if len(found) == len(self.widths) else self.RECHECK_SECONDS)
+        return found
+
+    def variants_key(self, urls):
+        # Changes whenever a variant lands for any of urls, so cached markup
+        # holding their srcsets is rebuilt once the resized images exist.
+        return tuple(len(self.variants(url)) for url in urls)
+
+    def srcset(self, rel):
+        return ', '.join(f"{url_for('static', filename=url)} {width}w" for url, width in self.variants(rel))
+
+    def stats(self):
+        with self._lock:
+            return {'enabled': Image is not None, 'processed': self.processed, 'deduplicated': self.deduplicated,
+                    'failed': self.failed, 'pending': len(self._pending), 'widths': list(self.widths)}
+
+
+images = ImagePipeline(
+    app.config['IMAGE_STORE'],
+    app.config['IMAGE_WIDTHS'],
+    quality=app.config['IMAGE_QUALITY'],
+    workers=app.config['IMAGE_WORKERS'],
+)
+
+@app.context_processor
+def inject_image_helpers():
+    return {'image_srcset': images.srcset}
+
+
+CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/|\s+', re.DOTALL)
+CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+
+def minify_css(source):
+    def token(match):
+        if match.group(1):
+            return match.group(1)
+        return '' if match.group(0).startswith('/*') else ' '
+    parts = re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', CSS_TOKENS.sub(token, source))
+    # Only squeeze around punctuation outside string literals.
+    return ''.join(part if i % 2 else CSS_PUNCTUATION.sub(r'\1', part).replace(';}', '}')
+                   for i, part in enumerate(parts)).strip()
+
+JS_REGEX_AFTER = tuple('(,=:[!&|?{};+-*%<>~^') + ('return', 'typeof', 'case', 'do', 'else', 'in', 'of',
+                                                    'void', 'delete', 'throw', 'new', 'yield', 'await')
+
+def js_literals(source):
+    # Returns the (start, end) spans of string, template and regex literals.
+    # A template literal with ${...} substitutions yields one span per text
+    # chunk; the substitutions are scanned as code. Comments are skipped so
+    # an apostrophe in one cannot open a string.
+    spans, templates = [], []
+    last, i, n = '', 0, len(source)
+    while i < n:
+        c = source[i]
+        if c in '\'"':
+            j = i + 1
+            while j < n and source[j] not in (c, '\n'):
+                j += 2 if source[j] == '\\' else 1
+            spans.append((i, j + 1))
+            i, last = j + 1, c
+        elif c == '`' or (c == '}' and templates and templates[-1] == 0):
+            if c == '}':
+                templates.pop()
+            j = i + 1
+            while j < n and source[j] != '`' and not source.startswith('${', j):
+                j += 2 if source[j] == '\\' else 1
+            if source.startswith('${', j):
+                templates.append(0)
+                spans.append((i, j + 2))
+                i, last = j + 2, '{'
+            else:
+                spans.append((i, j + 1))
+                i, last = j + 1, '`'
+        elif source.startswith('//', i):
+            i = source.find('\n', i)
+            i = n if i < 0 else i
+        elif source.startswith('/*', i):
+            i = source.find('*/', i + 2)
+            i = n if i < 0 else i + 2
+        elif c == '/' and (not last or last in JS_REGEX_AFTER):
+            j, in_class = i + 1, False
+            while j < n and source[j] != '\n' and (in_class or source[j] != '/'):
+                if source[j] == '\\':
+                    j += 1
+                elif source[j] in '[]':
+                    in_class = source[j] == '['
+                j += 1
+            while j + 1 < n and source[j + 1].isalpha():
+                j += 1
+            spans.append((i, j + 1))
+            i, last = j + 1, '/'
+        elif c.isalnum() or c in '_$':
+            j = i
+            while j < n and (source[j].isalnum() or source[j] in '_$'):
+                j += 1
+            i, last = j, source[i:j]
+        else:
+            if templates and c in '{}':
+                templates[-1] += 1 if c == '{' else -1
+            if not c.isspace():
+                last = c
+            i += 1
+    return spans
+
+def minify_js(source):
+    # Deliberately conservative: indentation, blank lines and whole-line
+    # comments only, so line breaks (and ASI) are preserved. Literals are
+    # swapped for placeholders first; whitespace inside them is content.
+    literals, pieces, pos = [], [], 0
+    for start, end in js_literals(source):
+        pieces.append(f"{source[pos:start]}\0{len(literals)}\0")
+        literals.append(source[start:end])
+        pos = end
+    pieces.append(source[pos:])
+    lines = (line.strip() for line in ''.join(pieces).splitlines())
+    code = '\n'.join(line for line in lines if line and not line.startswith('//'))
+    return re.sub(r'\0(\d+)\0', lambda m: literals[int(m.group(1))], code)
+
+
+class StaticAssets:
+    # Bundles and minifies the project's own CSS/JS at startup, names each
+    # output by content hash under static/dist and keeps identity/gzip/br
+    # bodies in memory. url_for('static', ...) is rewritten to the hashed
+    # name, which is then safe to cache forever.
+    BUNDLES = {
+        'css/site.css': ('css/style.css', 'css/canteen.css'),
+        'js/site.js': ('js/script.js', 'js/translator.js'),
+    }
+    SOURCES = ('css/canteen.css', 'js/canteen.js', 'js/checkout.js', 'js/kitchen.js', 'js/admin_canteen.js')
+    MIMETYPES = {'.css': 'text/css; charset=utf-8', '.js': 'text/javascript; charset=utf-8'}
+
+    def __init__(self, static_folder, out_dir='dist'):
+        self.static_folder = static_folder
+        self.out_dir = out_dir
+        self.manifest = {}
+        self.files = {}
+        self.built_at = None
+
+    def _read(self, name):
+        with open(os.path.join(self.static_folder, name), encoding='utf-8') as f:
+            return f.read()
+
+    def _minify(self, name, source):
+        return minify_css(source) if name.endswith('.css') else minify_js(source)
+
+    def build(self):
+        manifest, files = {}, {}
+        outputs = {name: (name,) for name in self.SOURCES}
+        outputs.update(self.BUNDLES)
+        for name, sources in outputs.items():
+            separator = '\n' if name.endswith('.css') else ';\n'
+            body = separator.join(self._minify(src, self._read(src)) for src in sources).encode('utf-8')
+            stem, ext = os.path.splitext(name)
+            hashed = f"{self.out_dir}/{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+            bodies = {'identity': body, 'gzip': gzip.compress(body, 9)}
+            if brotli:
+                bodies['br'] = brotli.compress(body)
+            manifest[name] = hashed
+            files[hashed] = bodies
+        self._write(files)
+        self.manifest, self.files = manifest, files
+        self.built_at = datetime.now()
+        return manifest
+
+    def _write(self, files):
+        # Siblings on disk let a front proxy serve them directly (e.g. nginx
+        # gzip_static/brotli_static); the app itself serves from memory.
+        suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+        try:
+            for hashed, bodies in files.items():
+                path = os.path.join(self.static_folder, hashed)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                for encoding, body in bodies.items():
+                    target = path + suffixes[encoding]
+                    if not os.path.exists(target):
+                        with open(target, 'wb') as f:
+                            f.write(body)
+        except OSError as e:
+            print(f"Error writing static assets: {e}")
+
+    def url_for(self, filename):
+        return self.manifest.get(filename.lstrip('/'), filename)
+
+    def stats(self):
+        return {'built_at': self.built_at.isoformat() if self.built_at else None, 'manifest': self.manifest,
+                'bytes': {name: {enc: len(body) for enc, body in bodies.items()} for name, bodies in self.files.items()}}
+
+
+assets = StaticAssets(app.static_folder)
+app.jinja_env.globals['assets'] = assets
+
+def build_static_assets():
+    # Until a build has run (create_app, or flask build-assets) the manifest is
+    # empty and pages link the unminified sources.
+    try:
+        assets.build()
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Error building static assets, serving sources: {e}")
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and assets.manifest:
+        values['filename'] = assets.url_for(values['filename'])
 
-oauth = OAuth(app)
+@app.route('/static/dist/<path:filename>')
+def dist_asset(filename):
+    bodies = assets.files.get(f"{assets.out_dir}/{filename}")
+    if bodies is None:
+        # Files from an earlier build stay servable for pages rendered before a deploy.
+        response = app.send_static_file(f"{assets.out_dir}/{filename}")
+        response.headers['Cache-Control'] = app.config['ASSET_CACHE_CONTROL']
+        return response
+    encoding = next((e for e in ('br', 'gzip') if e in bodies and request.accept_encodings[e]), 'identity')
+    response = app.response_class(bodies[encoding], mimetype=assets.MIMETYPES[os.path.splitext(filename)[1]])
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = app.config['ASSET_CACHE_CONTROL']
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    for name, hashed in assets.build().items():
+        sizes = {enc: len(body) for enc, body in assets.files[hashed].items()}
+        print(f"{name} -> {hashed} {sizes}")
+
+
+fragment_cache = LRUCache(maxsize=app.config['FRAGMENT_CACHE_SIZE'])
+
+def fragment_variant():
+    # Parts of the key every fragment shares. Anything per-user (cart count,
+    # name, flashes) has to stay outside {% cache %} blocks.
+    if not has_request_context():
+        return ('en', False)
+    language = request.accept_languages.best_match(app.config['FRAGMENT_LANGUAGES']) or 'en'
+    return (language, 'user_id' in session)
+
+
+class FragmentCacheExtension(Extension):
+    # {% cache 'name', more, key, parts %}...{% endcache %} renders the body
+    # once per key + language + logged-in state and serves it from an LRU.
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        # A None part (e.g. no catalog version after a failed load) means the
+        # body must not be cached.
+        if any(part is None for part in parts):
+            return caller()
+        key = (*parts, *fragment_variant())
+        value = fragment_cache.get(key)
+        if value is None:
+            value = caller()
+            fragment_cache.set(key, value, ttl=app.config['FRAGMENT_CACHE_TTL'])
+        return value
+
+
+app.jinja_env.add_extension(FragmentCacheExtension)
 
-def get_db_connection():
+def enable_template_cache():
     try:
-        return mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="@uttej123*",
-            database="lumoradb",
-            connection_timeout=5
-        )
-    except Error as e:
-        print(f"DB connection error: {e}")
-        return None
+        os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+    except OSError as e:
+        print(f"Error creating template bytecode cache: {e}")
 
-oauth.register(
-    name='google',
-    client_id=app.config['GOOGLE_CLIENT_ID'],
-    client_secret=app.config['GOOGLE_CLIENT_SECRET'],
-    access_token_url='https://accounts.google.com/o/oauth2/token',
-    access_token_params=None,
-    authorize_url='https://accounts.google.com/o/oauth2/auth',
-    authorize_params=None,
-    api_base_url='https://www.googleapis.com/oauth2/v1/',
-    userinfo_endpoint='https://openidconnect.googleapis.com/v1/userinfo',
-    client_kwargs={'scope': 'openid email profile'},
-    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration'
-)
 
-oauth.register(
-    name='facebook',
-    client_id=app.config['FACEBOOK_CLIENT_ID'],
-    client_secret=app.config['FACEBOOK_CLIENT_SECRET'],
-    access_token_url='https://graph.facebook.com/oauth/access_token',
-    authorize_url='https://www.facebook.com/dialog/oauth',
-    api_base_url='https://graph.facebook.com/',
-    client_kwargs={'scope': 'email'},
-    userinfo_endpoint='me?fields=id,name,email,picture{url}'
-)
+def cart_count_key(user_id):
+    return f"cart_count:{user_id}"
+
+def get_cached_cart_count(user_id):
+    value = kv_store.get(cart_count_key(user_id))
+    return int(value) if value is not None else None
+
+def set_cart_count(user_id, count):
+    ttl = app.config['CART_COUNT_LOCAL_TTL' if isinstance(kv_store, LocalKVStore) else 'CART_COUNT_TTL']
+    kv_store.set(cart_count_key(user_id), int(count), ex=ttl)
 
+def forget_cart_count(user_id):
+    # Dropped rather than adjusted in place: the next render recomputes it
+    # with one SUM, and there is no exists/incr race with the key's expiry.
+    kv_store.delete(cart_count_key(user_id))
 
 @app.context_processor
 def inject_cart_data():
     cart_item_count = 0
     if 'user_id' in session:
-        conn = get_db_connection()
-        if conn:
-            try:
-                with conn.cursor() as cur:
-                    cur.execute("SELECT SUM(quantity) FROM cart_items WHERE user_id = %s", (session['user_id'],))
-                    result = cur.fetchone()
-                    if result and result[0]:
-                        cart_item_count = int(result[0])
-            except Error as e:
-                print(f"Error fetching cart count: {e}")
-            finally:
-                if conn.is_connected():
-                    conn.close()
+        cart_item_count = get_cached_cart_count(session['user_id'])
+        if cart_item_count is None:
+            cart_item_count = 0
+            conn = get_db_connection()
+            if conn:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT SUM(quantity) FROM cart_items WHERE user_id = %s", (session['user_id'],))
+                        result = cur.fetchone()
+                        if result and result[0]:
+                            cart_item_count = int(result[0])
+                    set_cart_count(session['user_id'], cart_item_count)
+                except Error as e:
+                    print(f"Error fetching cart count: {e}")
+                finally:
+                    if conn.is_connected():
+                        conn.close()
     else:
         cart = session.get('cart', {})
         cart_item_count = sum(cart.values())
@@ -93,18 +2082,14 @@ def landing_page():
 
 @app.route('/home')
 def home():
-    conn = get_db_connection()
-    products = []
-    if conn:
-        try:
-            with conn.cursor(dictionary=True) as cur:
-                cur.execute("SELECT * FROM products ORDER BY category, name")
-                products = cur.fetchall()
-        except Error as e:
-            print(f"Error fetching products: {e}")
-        finally:
-            if conn.is_connected(): conn.close()
-    return render_template('index.html', products=products)
+    # The product grid is a cached fragment keyed on the catalog version (which
+    # every sale and edit moves on) and on which image variants exist, so a hit
+    # renders neither the loop nor touches the database.
+    version, products = catalog.snapshot()
+    if products is None:
+        return render_template('index.html', products=[], catalog_version=None, variants_key=None)
+    return render_template('index.html', products=products, catalog_version=version,
+                           variants_key=images.variants_key(product['image'] for product in products))
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -167,14 +2152,16 @@ def my_profile_page():
     try:
         with conn.cursor(dictionary=True) as cur:
             cur.execute("""
-                SELECT p.username, p.email, d.name, d.contact, d.profile_picture_url, d.address_line1, d.city, d.state, d.pincode
-                FROM profile p LEFT JOIN user_details d ON p.user_id = d.profile_id WHERE p.user_id = %s
+                SELECT p.username, p.email, d.name, d.contact, d.profile_picture_url, d.address_line1, d.city, d.state, d.pincode,
+                    s.order_count, s.lifetime_spend, s.last_order_at
+                FROM profile p LEFT JOIN user_details d ON p.user_id = d.profile_id
+                LEFT JOIN user_order_summary s ON p.user_id = s.user_id WHERE p.user_id = %s
             """, (user_id,))
             user_data = cur.fetchone()
 
             cur.execute("""
                 SELECT order_id, total_amount, status, created_at FROM orders
-                WHERE user_id = %s ORDER BY created_at DESC LIMIT 5
+                WHERE user_id = %s ORDER BY created_at DESC, order_id DESC LIMIT 5
             """, (user_id,))
             orders = cur.fetchall()
 
@@ -207,17 +2194,16 @@ def update_profile_picture():
         
         try:
             with conn.cursor() as cur:
-                filename = secure_filename(file.filename)
-                unique_filename = f"{user_id}_{int(datetime.now().timestamp())}_{filename}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                file.save(filepath)
-                
-                db_filepath = os.path.join('uploads/profile_pics', unique_filename).replace('\\', '/')
+                extension = file.filename.rsplit('.', 1)[1].lower()
+                db_filepath = images.store(file.read(), extension)
                 cur.execute("UPDATE user_details SET profile_picture_url = %s WHERE profile_id = %s", (db_filepath, user_id))
                 conn.commit()
 
                 session['profile_pic_url'] = db_filepath
                 return jsonify(success=True, message="Profile picture updated!", new_url=url_for('static', filename=db_filepath))
+        except OSError as e:
+            print(f"Error saving profile picture: {e}")
+            return jsonify(success=False, message="Could not save the picture."), 500
         except Error as e:
             return jsonify(success=False, message=f"Database error: {e}"), 500
         finally:
@@ -335,28 +2321,7 @@ def auth_handler():
                             session['profile_pic_url'] = user.get('profile_picture_url') or 'uploads/profile_pics/default-avatar.png'
                             flash(f"Welcome, {user['username']}!", "success") 
 
-                            session_cart = session.get('cart', {})
-                            if session_cart:
-                                try:
-                                    merge_cur = conn.cursor()
-                                    merge_data = []
-                                    for product_id, quantity in session_cart.items():
-                                        merge_data.append((user['user_id'], int(product_id), quantity, quantity))
-                                    
-                                    merge_query = """
-                                        INSERT INTO cart_items (user_id, product_id, quantity)
-                                        VALUES (%s, %s, %s)
-                                        ON DUPLICATE KEY UPDATE quantity = quantity + %s
-                                    """
-                                    merge_cur.executemany(merge_query, merge_data)
-                                    conn.commit()
-                                    session.pop('cart', None)
-                                    flash("Your guest cart has been merged.", "info")
-                                except Error as merge_e:
-                                    conn.rollback()
-                                    print(f"DB error merging cart: {merge_e}")
-                                finally:
-                                    if merge_cur: merge_cur.close()
+                            merge_session_cart(conn, user['user_id'])
                             return redirect(url_for('my_profile_page'))
                         else:
                             flash("Invalid credentials. Please try again.", "danger")
@@ -371,40 +2336,80 @@ def auth_handler():
     
     return redirect(url_for('landing_page')) # Redirect back if something goes wrong
 
+def merge_guest_cart(conn, user_id, session_cart):
+    quantities = {}
+    for product_id, quantity in session_cart.items():
+        try:
+            product_id, quantity = int(product_id), int(quantity)
+        except (TypeError, ValueError):
+            continue
+        if quantity > 0:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if not quantities:
+        return 0
+
+    with conn.cursor(dictionary=True) as cur:
+        placeholders = ','.join(['%s'] * len(quantities))
+        cur.execute(f"SELECT product_id, stock FROM products WHERE product_id IN ({placeholders}) AND stock > 0", list(quantities))
+        stock = {row['product_id']: row['stock'] for row in cur.fetchall()}
+        rows = [(user_id, pid, min(qty, stock[pid])) for pid, qty in sorted(quantities.items()) if pid in stock]
+        if rows:
+            # Cap merged quantities at stock in the same statement, so the whole
+            # merge stays one round trip regardless of cart size.
+            case = ' '.join(['WHEN %s THEN %s'] * len(rows))
+            cur.execute(
+                "INSERT INTO cart_items (user_id, product_id, quantity) VALUES " + ','.join(['(%s, %s, %s)'] * len(rows)) +
+                f" ON DUPLICATE KEY UPDATE quantity = LEAST(cart_items.quantity + VALUES(quantity), CASE VALUES(product_id) {case} END)",
+                [value for row in rows for value in row] + [value for _, pid, _ in rows for value in (pid, stock[pid])]
+            )
+    conn.commit()
+    return len(rows)
+
+def merge_session_cart(conn, user_id):
+    session_cart = session.get('cart', {})
+    if not session_cart:
+        return
+    try:
+        merged = merge_guest_cart(conn, user_id, session_cart)
+        session.pop('cart', None)
+        forget_cart_count(user_id)
+        if merged:
+            flash("Your guest cart has been merged.", "info")
+    except Error as e:
+        conn.rollback()
+        print(f"DB error merging cart: {e}")
+
 @app.route('/login/<provider>')
 def social_login(provider):
+    if provider not in OAUTH_PROVIDERS:
+        flash("Unsupported provider.", "danger")
+        return redirect(url_for('landing_page'))
     redirect_uri = url_for(f'authorize', provider=provider, _external=True)
-    return getattr(oauth, provider).authorize_redirect(redirect_uri)
+    return oauth_client(provider).authorize_redirect(redirect_uri)
 
 @app.route('/authorize/<provider>')
 def authorize(provider):
     try:
-        token = getattr(oauth, provider).authorize_access_token()
-        if provider == 'google':
-            user_info = oauth.google.userinfo(token=token)
-            email = user_info.get('email')
-            name = user_info.get('name')
-            picture = user_info.get('picture')
-        elif provider == 'facebook':
-            user_info = oauth.facebook.get('me?fields=id,name,email,picture{url}', token=token).json()
-            email = user_info.get('email')
-            name = user_info.get('name')
-            picture = user_info.get('picture', {}).get('data', {}).get('url')
-        else:
+        if provider not in OAUTH_PROVIDERS:
             flash("Unsupported provider.", "danger")
             return redirect(url_for('landing_page'))
-
-        if not email:
-            flash("Could not retrieve email from provider. Please try a different login method.", "danger")
-            return redirect(url_for('landing_page'))
-
-        return process_social_login(email, name, picture)
+        client = oauth_client(provider)
+        token = client.authorize_access_token()
+        user_info = client.get(OAUTH_PROVIDERS[provider]['userinfo_endpoint'], token=token).json()
+        return finish_social_login(provider, user_info)
 
     except Exception as e:
         print(f"OAuth Error with {provider}: {e}")
         flash(f"An error occurred during authentication with {provider.capitalize()}. Please try again.", "danger")
         return redirect(url_for('landing_page'))
 
+def finish_social_login(provider, user_info):
+    email, name, picture = social_profile(provider, user_info)
+    if not email:
+        flash("Could not retrieve email from provider. Please try a different login method.", "danger")
+        return redirect(url_for('landing_page'))
+    return process_social_login(email, name, picture)
+
 def process_social_login(email, name, picture_url):
     conn = get_db_connection()
     if not conn:
@@ -428,6 +2433,7 @@ def process_social_login(email, name, picture_url):
             session['username'] = user['username']
             session['profile_pic_url'] = user.get('profile_picture_url') or picture_url or 'static/uploads/profile_pics/default-avatar.png'
             flash(f"Welcome, {user['username']}!", "success") 
+            merge_session_cart(conn, user['user_id'])
             return redirect(url_for('home'))
 
     except Error as e:
@@ -444,26 +2450,14 @@ def shop_page():
 
 @app.route('/product/<int:product_id>')
 def product_detail_page(product_id):
-    conn = get_db_connection()
-    if not conn:
-        flash("Database connection failed.", "danger")
-        return redirect(url_for('home'))
-
-    product = None
+    product = catalog.get(product_id)
     reviews = []
-    try:
-        with conn.cursor(dictionary=True) as cur:
-            cur.execute("SELECT * FROM products WHERE product_id = %s", (product_id,))
-            product = cur.fetchone()
-
-            if product:
-                if product_id in [1, 2]: # Example product IDs
-                    reviews = [
-                        {'user_name': 'John Doe', 'rating': 5, 'comment': 'Absolutely delicious! A must-try.'},
-                        {'user_name': 'Jane Smith', 'rating': 4, 'comment': 'Very good, but a bit spicy for me.'}
-                    ]
-    finally:
-        if conn.is_connected(): conn.close()
+    if product:
+        if product_id in [1, 2]: # Example product IDs
+            reviews = [
+                {'user_name': 'John Doe', 'rating': 5, 'comment': 'Absolutely delicious! A must-try.'},
+                {'user_name': 'Jane Smith', 'rating': 4, 'comment': 'Very good, but a bit spicy for me.'}
+            ]
     if not product:
         flash("Product not found.", "danger")
         return redirect(url_for('home'))
@@ -503,6 +2497,7 @@ def add_to_cart(product_id):
                     ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
                 """, (user_id, product_id, quantity))
                 conn.commit()
+                forget_cart_count(user_id)
         except Error as e:
             return jsonify(success=False, message=str(e)), 500
         finally:
@@ -515,6 +2510,63 @@ def add_to_cart(product_id):
 
     return jsonify(success=True, message="Item added to cart!")
 
+def load_cart(conn, user_id):
+    cart = {}
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute("SELECT product_id, quantity FROM cart_items WHERE user_id = %s", (user_id,))
+        for item in cur.fetchall():
+            cart[str(item['product_id'])] = item['quantity']
+    return cart
+
+def price_cart(cart):
+    cart_products = []
+    total_price = 0
+    product_map = catalog.get_many(cart.keys())
+    for product_id, quantity in cart.items():
+        product = product_map.get(product_id)
+        if product:
+            subtotal = product['price'] * quantity
+            cart_products.append({**product, 'quantity': quantity, 'subtotal': subtotal, 'image_url': product['image']})
+            total_price += subtotal
+    return cart_products, total_price
+
+def parse_cart_changes(items):
+    changes = {}
+    for product_id, quantity in items.items():
+        changes[int(product_id)] = int(quantity)
+    return changes
+
+def apply_cart_changes(conn, user_id, changes):
+    known = catalog.get_many(changes.keys())
+    upserts = [(user_id, pid, qty) for pid, qty in sorted(changes.items()) if qty > 0 and str(pid) in known]
+    deletes = [pid for pid, qty in sorted(changes.items()) if qty <= 0]
+    with conn.cursor() as cur:
+        if upserts:
+            cur.execute(
+                "INSERT INTO cart_items (user_id, product_id, quantity) VALUES " + ','.join(['(%s, %s, %s)'] * len(upserts)) +
+                " ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)",
+                [value for row in upserts for value in row]
+            )
+        if deletes:
+            placeholders = ','.join(['%s'] * len(deletes))
+            cur.execute(f"DELETE FROM cart_items WHERE user_id = %s AND product_id IN ({placeholders})", [user_id] + deletes)
+    conn.commit()
+
+def change_cart(user_id, changes):
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        apply_cart_changes(conn, user_id, changes)
+        forget_cart_count(user_id)
+        return True
+    except Error as e:
+        conn.rollback()
+        print(f"DB Error updating cart: {e}")
+        return False
+    finally:
+        if conn.is_connected(): conn.close()
+
 @app.route('/cart', methods=['GET', 'POST'])
 def cart_page():
     cart_products = []
@@ -525,30 +2577,12 @@ def cart_page():
         return render_template('cart.html', cart_products=cart_products, total_price=total_price)
 
     try:
-        with conn.cursor(dictionary=True) as cur:
-            cart = {}
-            if 'user_id' in session:
-                cur.execute("SELECT product_id, quantity FROM cart_items WHERE user_id = %s", (session['user_id'],))
-                for item in cur.fetchall():
-                    cart[str(item['product_id'])] = item['quantity']
-            else:
-                cart = session.get('cart', {})
-
-            if cart:
-                product_ids = list(cart.keys())
-                placeholders = ','.join(['%s'] * len(product_ids))
-                query = f"SELECT * FROM products WHERE product_id IN ({placeholders})"
-                cur.execute(query, product_ids)
-                products_from_db = cur.fetchall()
-                
-                product_map = {str(p['product_id']): p for p in products_from_db}
-
-                for product_id, quantity in cart.items():
-                    product = product_map.get(product_id)
-                    if product:
-                        subtotal = product['price'] * quantity
-                        cart_products.append({**product, 'quantity': quantity, 'subtotal': subtotal, 'image_url': product['image']})
-                        total_price += subtotal
+        if 'user_id' in session:
+            cart = load_cart(conn, session['user_id'])
+            set_cart_count(session['user_id'], sum(cart.values()))
+        else:
+            cart = session.get('cart', {})
+        cart_products, total_price = price_cart(cart)
     except Error as e:
         flash("Could not load cart items.", "danger")
         print(f"DB Error loading cart: {e}")
@@ -557,62 +2591,675 @@ def cart_page():
 
     return render_template('cart.html', cart_products=cart_products, total_price=total_price)
 
+@app.route('/api/cart', methods=['PATCH', 'POST'])
+def bulk_update_cart():
+    payload = request.get_json(silent=True) or {}
+    try:
+        changes = parse_cart_changes(payload.get('items', {}))
+    except (AttributeError, TypeError, ValueError):
+        return jsonify(success=False, message="Expected an object of {product_id: quantity}."), 400
+
+    if 'user_id' in session:
+        user_id = session['user_id']
+        conn = get_db_connection()
+        if not conn:
+            return jsonify(success=False, message="Database connection failed."), 500
+        try:
+            if changes:
+                apply_cart_changes(conn, user_id, changes)
+            cart = load_cart(conn, user_id)
+            set_cart_count(user_id, sum(cart.values()))
+        except Error as e:
+            conn.rollback()
+            return jsonify(success=False, message=str(e)), 500
+        finally:
+            if conn.is_connected(): conn.close()
+    else:
+        cart = dict(session.get('cart', {}))
+        known = catalog.get_many(changes.keys())
+        for product_id, quantity in changes.items():
+            if quantity > 0 and str(product_id) in known:
+                cart[str(product_id)] = quantity
+            else:
+                cart.pop(str(product_id), None)
+        session['cart'] = cart
+
+    cart_products, total_price = price_cart(cart)
+    items = [{'product_id': p['product_id'], 'name': p['name'], 'price': p['price'],
+              'quantity': p['quantity'], 'subtotal': p['subtotal']} for p in cart_products]
+    return jsonify(success=True, items=items, total_price=total_price, item_count=sum(cart.values()))
+
 @app.route('/update-cart/<int:product_id>', methods=['POST'])
 @login_required
 def update_cart(product_id):
     quantity = int(request.form.get('quantity', 0))
-    user_id = session['user_id']
-    conn = get_db_connection()
-    if not conn:
-        flash("Database connection failed.", "danger")
-
-    try:
-        with conn.cursor() as cur:
-            if quantity > 0:
-                cur.execute("UPDATE cart_items SET quantity = %s WHERE user_id = %s AND product_id = %s", (quantity, user_id, product_id))
-            else:
-                cur.execute("DELETE FROM cart_items WHERE user_id = %s AND product_id = %s", (user_id, product_id))
-            conn.commit()
-            flash("Cart updated.", "success")
-    except Error as e:
-        conn.rollback()
+    if change_cart(session['user_id'], {product_id: quantity}):
+        flash("Cart updated.", "success")
+    else:
         flash("Failed to update cart.", "danger")
-        print(f"DB Error updating cart: {e}")
-    finally:
-        if conn.is_connected(): conn.close()
-
     return redirect(url_for('cart_page'))
 
 @app.route('/remove-from-cart/<int:product_id>', methods=['POST'])
 @login_required
 def remove_from_cart(product_id):
+    if change_cart(session['user_id'], {product_id: 0}):
+        flash("Item removed from cart.", "success")
+    else:
+        flash("Failed to remove item from cart.", "danger")
+    return redirect(url_for('cart_page'))
+
+class OrderQueue:
+    # Outbox-backed work queue: jobs are written in the same transaction as the
+    # order, then claimed in batches by worker threads or a separate process.
+    VISIBILITY_TIMEOUT = 300
+    MAX_BACKOFF = 300
+
+    def __init__(self, batch_size=20, poll_interval=1.0, max_attempts=5):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.handlers = {}
+        self.listeners = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {'batches': 0, 'processed': 0, 'retried': 0, 'failed': 0,
+                       'latency_total': 0.0, 'latency_max': 0.0}
+
+    def handler(self, kind):
+        def register(f):
+            self.handlers[kind] = f
+            return f
+        return register
+
+    def notify(self):
+        self._wake.set()
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def _claim(self, conn):
+        with conn.cursor(dictionary=True) as cur:
+            # Running jobs become claimable again once their visibility timeout
+            # lapses, which recovers work from a crashed worker.
+            cur.execute("""
+                SELECT job_id, order_id, kind, attempts, created_at,
+                    TIMESTAMPDIFF(MICROSECOND, created_at, NOW(3)) AS age_us FROM order_jobs
+                WHERE status IN ('pending', 'running') AND available_at <= NOW(3)
+                ORDER BY job_id LIMIT %s FOR UPDATE SKIP LOCKED
+            """, (self.batch_size,))
+            jobs = cur.fetchall()
+            # Job age comes from the database clock, so app and DB timezones
+            # never meet; time spent after the claim is added locally.
+            claimed_at = time.monotonic()
+            for job in jobs:
+                job['claimed_at'] = claimed_at
+            if jobs:
+                placeholders = ','.join(['%s'] * len(jobs))
+                cur.execute(f"""
+                    UPDATE order_jobs SET status = 'running', attempts = attempts + 1,
+                        available_at = NOW(3) + INTERVAL %s SECOND
+                    WHERE job_id IN ({placeholders})
+                """, [self.VISIBILITY_TIMEOUT] + [job['job_id'] for job in jobs])
+        conn.commit()
+        return jobs
+
+    def _process(self, conn, job):
+        handler = self.handlers.get(job['kind'])
+        try:
+            with conn.cursor() as cur:
+                # Hold the job row for the whole transaction: something else
+                # (rebuild-sales-rollups) may have consumed it since the claim.
+                cur.execute("SELECT status FROM order_jobs WHERE job_id = %s FOR UPDATE", (job['job_id'],))
+                row = cur.fetchone()
+            if not row or row[0] != 'running':
+                conn.rollback()
+                return
+            if handler is None:
+                raise ValueError(f"No handler for job kind {job['kind']!r}")
+            event = handler(conn, job)
+            with conn.cursor() as cur:
+                cur.execute("UPDATE order_jobs SET status = 'done', finished_at = NOW(3), last_error = NULL WHERE job_id = %s", (job['job_id'],))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            attempts = job['attempts'] + 1
+            failed = attempts >= self.max_attempts
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE order_jobs SET status = %s, last_error = %s,
+                        available_at = NOW(3) + INTERVAL %s SECOND
+                    WHERE job_id = %s
+                """, ('failed' if failed else 'pending', str(e)[:255], min(2 ** attempts, self.MAX_BACKOFF), job['job_id']))
+            conn.commit()
+            self._count(**{'failed' if failed else 'retried': 1})
+            print(f"Order job {job['job_id']} ({job['kind']}) failed on attempt {attempts}: {e}")
+            return
+
+        latency = max(job['age_us'] / 1e6 + time.monotonic() - job['claimed_at'], 0.0)
+        with self._lock:
+            self._stats['processed'] += 1
+            self._stats['latency_total'] += latency
+            self._stats['latency_max'] = max(self._stats['latency_max'], latency)
+        if event:
+            for listener in self.listeners:
+                try:
+                    listener(event)
+                except Exception as e:
+                    print(f"Order listener error: {e}")
+
+    def run_once(self):
+        conn = get_db_connection(request_scoped=False)
+        if not conn:
+            return 0
+        try:
+            jobs = self._claim(conn)
+            if jobs:
+                self._count(batches=1)
+            for job in jobs:
+                self._process(conn, job)
+            return len(jobs)
+        except Error as e:
+            print(f"Order queue error: {e}")
+            return 0
+        finally:
+            conn.close()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            if self.run_once() < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def start(self, threads=1):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(threads):
+                thread = threading.Thread(target=self.run_forever, name=f"order-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def depth(self):
+        conn = get_db_connection()
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT status, COUNT(*) FROM order_jobs WHERE status IN ('pending', 'running', 'failed') GROUP BY status")
+                return dict(cur.fetchall())
+        finally:
+            if conn.is_connected(): conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['latency_avg'] = stats['latency_total'] / stats['processed'] if stats['processed'] else 0.0
+        stats['workers'] = len(self._threads)
+        return stats
+
+
+order_queue = OrderQueue(
+    batch_size=app.config['ORDER_QUEUE_BATCH_SIZE'],
+    poll_interval=app.config['ORDER_QUEUE_POLL_INTERVAL'],
+    max_attempts=app.config['ORDER_QUEUE_MAX_ATTEMPTS'],
+)
+
+@order_queue.handler('order.placed')
+def handle_order_placed(conn, job):
+    order_id = job['order_id']
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute("""
+            SELECT oi.quantity, COALESCE(oi.product_name, p.name) AS name FROM order_items oi
+            LEFT JOIN products p ON oi.product_id = p.product_id
+            WHERE oi.order_id = %s
+        """, (order_id,))
+        summary = '\n'.join(f"{item['quantity']} x {item['name'] or 'Unknown item'}" for item in cur.fetchall())
+        cur.execute("INSERT IGNORE INTO kitchen_tickets (order_id, summary) VALUES (%s, %s)", (order_id, summary))
+        cur.execute("UPDATE orders SET status = 'Confirmed' WHERE order_id = %s AND status = 'Processing'", (order_id,))
+        cur.execute("SELECT user_id, status FROM orders WHERE order_id = %s", (order_id,))
+        order = cur.fetchone()
+    if not order:
+        return None
+    return {'type': 'order.status', 'order_id': order_id, 'user_id': order['user_id'], 'status': order['status'], 'ticket': summary}
+
+@order_queue.handler('order.rollup')
+def handle_order_rollup(conn, job):
+    # Runs in the same transaction that marks the job done, so each order is
+    # folded into the rollups exactly once.
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute("""
+            SELECT o.user_id, o.total_amount, o.created_at, oi.product_id, oi.quantity, oi.price,
+                COALESCE(p.category, 'uncategorized') AS category
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.order_id
+            LEFT JOIN products p ON p.product_id = oi.product_id
+            WHERE o.order_id = %s
+        """, (job['order_id'],))
+        lines = cur.fetchall()
+        if not lines:
+            return None
+        order = lines[0]
+        day = order['created_at'].date()
+        bucket_hour = order['created_at'].replace(minute=0, second=0, microsecond=0)
+
+        cur.execute("""
+            INSERT INTO sales_hourly (bucket_hour, order_count, items_sold, revenue) VALUES (%s, 1, %s, %s)
+            ON DUPLICATE KEY UPDATE order_count = order_count + 1, items_sold = items_sold + VALUES(items_sold),
+                revenue = revenue + VALUES(revenue)
+        """, (bucket_hour, sum(line['quantity'] for line in lines), order['total_amount']))
+
+        products, categories = {}, {}
+        for line in lines:
+            amount = line['price'] * line['quantity']
+            units, revenue = products.get(line['product_id'], (0, 0))
+            products[line['product_id']] = (units + line['quantity'], revenue + amount)
+            units, revenue = categories.get(line['category'], (0, 0))
+            categories[line['category']] = (units + line['quantity'], revenue + amount)
+        for table, key_column, totals in (('product_sales_daily', 'product_id', products), ('category_sales_daily', 'category', categories)):
+            rows = [(day, key, units, revenue) for key, (units, revenue) in sorted(totals.items())]
+            cur.execute(
+                f"INSERT INTO {table} (day, {key_column}, units, revenue) VALUES " + ','.join(['(%s, %s, %s, %s)'] * len(rows)) +
+                " ON DUPLICATE KEY UPDATE units = units + VALUES(units), revenue = revenue + VALUES(revenue)",
+                [value for row in rows for value in row]
+            )
+        cur.execute("INSERT IGNORE INTO active_users_daily (day, user_id) VALUES (%s, %s)", (day, order['user_id']))
+    return None
+
+def log_order_event(event):
+    app.logger.info("order event %s order=%s status=%s", event['type'], event['order_id'], event['status'])
+
+order_queue.listeners.append(log_order_event)
+
+
+class EventBroker:
+    # In-process pub/sub: one publish fans out to every subscribed stream.
+    def __init__(self, buffer_size=100):
+        self.buffer_size = buffer_size
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._stats = {'published': 0, 'delivered': 0, 'dropped': 0}
+
+    def subscribe(self, *channels):
+        subscriber = queue.Queue(maxsize=self.buffer_size)
+        with self._lock:
+            for channel in channels:
+                self._channels.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber, *channels):
+        with self._lock:
+            for channel in channels:
+                subscribers = self._channels.get(channel)
+                if subscribers:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+            self._stats['published'] += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+                delivered, dropped = 1, 0
+            except queue.Full:
+                # A stalled client must not hold up the publisher; it will
+                # reconnect and resync from the initial snapshot.
+                delivered, dropped = 0, 1
+            with self._lock:
+                self._stats['delivered'] += delivered
+                self._stats['dropped'] += dropped
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['channels'] = len(self._channels)
+            stats['subscribers'] = len({sub for subs in self._channels.values() for sub in subs})
+        return stats
+
+
+broker = EventBroker(buffer_size=app.config['SSE_SUBSCRIBER_BUFFER'])
+KITCHEN_CHANNEL = 'kitchen'
+ORDER_STATUSES = ('Processing', 'Confirmed', 'Preparing', 'Ready', 'Completed', 'Cancelled')
+
+def order_channel(order_id):
+    return f"order:{order_id}"
+
+class OrderEventFeed:
+    # The broker only reaches streams in its own process, so every event is
+    # also written to order_events and each process with open streams polls
+    # that table and republishes what other processes wrote. Local events are
+    # delivered at once; the poll skips ids this process has already seen.
+    # Ids can commit out of order, so recent rows are re-read for a while.
+    SETTLE_SECONDS = 10
+    PURGE_EVERY = 60
+
+    def __init__(self, broker, poll_interval=0.5, retention=3600):
+        self.broker = broker
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._cursor = None
+        self._seen = {}
+        self._purged_at = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {'written': 0, 'polls': 0, 'relayed': 0, 'errors': 0}
+
+    def publish(self, event):
+        event_id = None
+        conn = get_db_connection(request_scoped=False)
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("INSERT INTO order_events (order_id, payload) VALUES (%s, %s)",
+                                (event['order_id'], json.dumps(event, default=str)))
+                    event_id = cur.lastrowid
+                conn.commit()
+                self._count('written')
+            except Error as e:
+                conn.rollback()
+                self._count('errors')
+                print(f"Order event write error: {e}")
+            finally:
+                if conn.is_connected(): conn.close()
+        self._deliver(event_id, event)
+
+    def _deliver(self, event_id, event):
+        if event_id is not None:
+            with self._lock:
+                if event_id in self._seen:
+                    return False
+                self._seen[event_id] = time.monotonic()
+        self.broker.publish(KITCHEN_CHANNEL, event)
+        self.broker.publish(order_channel(event['order_id']), event)
+        return True
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def poll_once(self):
+        conn = get_db_connection(request_scoped=False)
+        if not conn:
+            return 0
+        try:
+            with conn.cursor(dictionary=True) as cur:
+                cur.execute("""
+                    SELECT event_id, payload FROM order_events
+                    WHERE event_id > %s OR created_at >= NOW(3) - INTERVAL %s SECOND
+                    ORDER BY event_id
+                """, (self._cursor or 0, self.SETTLE_SECONDS))
+                rows = cur.fetchall()
+                if time.monotonic() - self._purged_at >= self.PURGE_EVERY:
+                    cur.execute("DELETE FROM order_events WHERE created_at < NOW(3) - INTERVAL %s SECOND",
+                                (self.retention,))
+                    conn.commit()
+                    self._purged_at = time.monotonic()
+        except Error as e:
+            self._count('errors')
+            print(f"Order event poll error: {e}")
+            return 0
+        finally:
+            if conn.is_connected(): conn.close()
+
+        relayed = 0
+        if self._cursor is None:
+            # First poll: everything already written predates our streams,
+            # which start from their own snapshot.
+            with self._lock:
+                now = time.monotonic()
+                self._seen.update((row['event_id'], now) for row in rows)
+        else:
+            for row in rows:
+                if self._deliver(row['event_id'], json.loads(row['payload'])):
+                    relayed += 1
+        if rows:
+            self._cursor = max(self._cursor or 0, rows[-1]['event_id'])
+        elif self._cursor is None:
+            self._cursor = 0
+        with self._lock:
+            horizon = time.monotonic() - 2 * self.SETTLE_SECONDS
+            self._seen = {event_id: at for event_id, at in self._seen.items() if at >= horizon}
+            self._stats['polls'] += 1
+            self._stats['relayed'] += relayed
+        return relayed
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            first = self._cursor is None
+        if first:
+            # Set the baseline before the first stream subscribes.
+            self.poll_once()
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='order-event-feed', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"Order event feed error: {e}")
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cursor'] = self._cursor
+            stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+
+order_events = OrderEventFeed(broker, poll_interval=app.config['ORDER_EVENT_POLL_INTERVAL'],
+                              retention=app.config['ORDER_EVENT_RETENTION'])
+
+def publish_order_event(event):
+    order_events.publish(event)
+
+order_queue.listeners.append(publish_order_event)
+
+def format_sse(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+def sse_response(channels, initial_events=()):
+    # Each open stream occupies a worker thread under sync/gthread workers;
+    # serve busy screens from the ASGI app (asgi.py) or size threads for them.
+    order_events.start()
+    subscriber = broker.subscribe(*channels)
+    heartbeat = app.config['SSE_HEARTBEAT']
+    deadline = time.monotonic() + app.config['SSE_MAX_LIFETIME']
+
+    # Deliberately not wrapped in stream_with_context: the request's pooled DB
+    # connection is released as soon as the view returns, not when the stream ends.
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            for event in initial_events:
+                yield format_sse(event)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    event = subscriber.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            broker.unsubscribe(subscriber, *channels)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.before_request
+def start_order_workers():
+    if app.config['ORDER_WORKER_MODE'] == 'thread':
+        order_queue.start(app.config['ORDER_WORKER_THREADS'])
+
+@app.cli.command('order-worker')
+def order_worker_command():
+    order_queue.run_forever()
+
+class CheckoutError(Exception):
+    pass
+
+CHECKOUT_ATTEMPTS = 3
+# Lock wait timeout / deadlock: safe to retry the whole transaction.
+RETRYABLE_ERRNOS = {1205, 1213}
+
+def place_order(conn, user_id, idempotency_key):
+    timings = {}
+    for attempt in range(1, CHECKOUT_ATTEMPTS + 1):
+        timings['attempts'] = attempt
+        try:
+            order_id, created = _place_order(conn, user_id, idempotency_key, timings)
+            return order_id, created, timings
+        except CheckoutError:
+            conn.rollback()
+            raise
+        except Error as e:
+            conn.rollback()
+            if e.errno not in RETRYABLE_ERRNOS or attempt == CHECKOUT_ATTEMPTS:
+                raise
+
+def _place_order(conn, user_id, idempotency_key, timings):
+    clock = [time.perf_counter()]
+
+    def mark(stage):
+        now = time.perf_counter()
+        timings[stage] = round((now - clock[0]) * 1000, 2)
+        clock[0] = now
+
+    with conn.cursor(dictionary=True) as cur:
+        # Claiming the key first makes a concurrent resubmit block here until
+        # this transaction ends, then see the order it produced.
+        cur.execute("INSERT IGNORE INTO checkout_requests (idempotency_key, user_id) VALUES (%s, %s)", (idempotency_key, user_id))
+        if cur.rowcount == 0:
+            # A locking read sees the latest committed row; a plain SELECT would
+            # read the snapshot that earlier queries on this pooled connection
+            # (session, catalog) opened, from before the other checkout committed.
+            cur.execute("SELECT user_id, order_id FROM checkout_requests WHERE idempotency_key = %s FOR UPDATE", (idempotency_key,))
+            existing = cur.fetchone()
+            conn.rollback()
+            if existing and existing['user_id'] == user_id and existing['order_id']:
+                return existing['order_id'], False
+            raise CheckoutError("This order is already being processed.")
+        mark('idempotency')
+
+        cur.execute("SELECT product_id, quantity FROM cart_items WHERE user_id = %s ORDER BY product_id FOR UPDATE", (user_id,))
+        cart = {row['product_id']: row['quantity'] for row in cur.fetchall() if row['quantity'] > 0}
+        if not cart:
+            raise CheckoutError("Your cart is empty.")
+        mark('lock_cart')
+
+        # Always lock product rows in primary-key order so concurrent checkouts
+        # queue behind each other instead of deadlocking.
+        product_ids = sorted(cart)
+        placeholders = ','.join(['%s'] * len(product_ids))
+        cur.execute(f"SELECT product_id, name, image, price, stock FROM products WHERE product_id IN ({placeholders}) ORDER BY product_id FOR UPDATE", product_ids)
+        products = {row['product_id']: row for row in cur.fetchall()}
+        lines = [(pid, cart[pid]) for pid in product_ids if pid in products]
+        if not lines:
+            raise CheckoutError("The items in your cart are no longer available.")
+        short = [products[pid]['name'] for pid, qty in lines if products[pid]['stock'] < qty]
+        if short:
+            raise CheckoutError(f"Not enough stock for: {', '.join(short)}.")
+        mark('lock_stock')
+
+        line_ids = [pid for pid, _ in lines]
+        case = ' '.join(['WHEN %s THEN %s'] * len(lines))
+        case_params = [value for line in lines for value in line]
+        cur.execute(f"""
+            UPDATE products SET stock = stock - CASE product_id {case} END
+            WHERE product_id IN ({','.join(['%s'] * len(line_ids))}) AND stock >= CASE product_id {case} END
+        """, case_params + line_ids + case_params)
+        if cur.rowcount != len(lines):
+            raise CheckoutError("Stock changed while placing your order. Please try again.")
+        mark('reserve_stock')
+
+        total_price = sum(products[pid]['price'] * qty for pid, qty in lines)
+        cur.execute(
+            "INSERT INTO orders (user_id, total_amount, status, tracking_number) VALUES (%s, %s, %s, %s)",
+            (user_id, total_price, 'Processing', f"LUMORA{secrets.token_hex(6).upper()}")
+        )
+        order_id = cur.lastrowid
+        item_rows = [(order_id, pid, qty, products[pid]['price'], products[pid]['name'], products[pid]['image']) for pid, qty in lines]
+        cur.execute(
+            "INSERT INTO order_items (order_id, product_id, quantity, price, product_name, product_image) VALUES " +
+            ','.join(['(%s, %s, %s, %s, %s, %s)'] * len(item_rows)),
+            [value for row in item_rows for value in row]
+        )
+        cur.execute("DELETE FROM cart_items WHERE user_id = %s", (user_id,))
+        cur.execute("UPDATE checkout_requests SET order_id = %s WHERE idempotency_key = %s", (order_id, idempotency_key))
+        cur.execute("INSERT INTO order_jobs (order_id, kind) VALUES (%s, %s), (%s, %s)", (order_id, 'order.placed', order_id, 'order.rollup'))
+        cur.execute("""
+            INSERT INTO user_order_summary (user_id, order_count, lifetime_spend, last_order_id, last_order_at)
+            VALUES (%s, 1, %s, %s, NOW())
+            ON DUPLICATE KEY UPDATE order_count = order_count + 1, lifetime_spend = lifetime_spend + VALUES(lifetime_spend),
+                last_order_id = VALUES(last_order_id), last_order_at = VALUES(last_order_at)
+        """, (user_id, total_price, order_id))
+        # Stock is part of the cached menu bodies, their ETags and the home
+        # fragment, all keyed on the catalog version, so every sale moves it
+        # on. Bumped last: the version row is shared by all checkouts and
+        # stays locked until the commit.
+        catalog.bump_version(cur)
+        mark('write_order')
+
+    conn.commit()
+    mark('commit')
+    catalog.invalidate()
+    return order_id, True
+
+def server_timing(timings):
+    return ', '.join(f"{stage};dur={ms}" for stage, ms in timings.items() if stage != 'attempts')
+
+@app.route('/checkout', methods=['GET', 'POST'])
+@login_required
+def checkout_page():
     user_id = session['user_id']
     conn = get_db_connection()
     if not conn:
-        flash("Database error.", "danger")
+        flash("Database connection failed.", "danger")
         return redirect(url_for('cart_page'))
-    try:
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM cart_items WHERE user_id = %s AND product_id = %s", (user_id, product_id))
-            conn.commit()
-            flash("Item removed from cart.", "success")
-    except Error as e:
-        conn.rollback()
-        flash("Failed to remove item from cart.", "danger")
-        print(f"DB Error removing from cart: {e}")
-    finally:
-        if conn.is_connected(): conn.close()
 
-    return redirect(url_for('cart_page'))
+    if request.method == 'POST':
+        idempotency_key = (request.form.get('idempotency_key') or secrets.token_urlsafe(16))[:64]
+        try:
+            order_id, created, timings = place_order(conn, user_id, idempotency_key)
+        except CheckoutError as e:
+            flash(str(e), "warning")
+            return redirect(url_for('cart_page'))
+        except Error as e:
+            flash(f"An error occurred while placing your order: {e}", "danger")
+            return redirect(url_for('cart_page'))
+        finally:
+            if conn.is_connected(): conn.close()
 
-@app.route('/checkout', methods=['GET', 'POST'])
-@login_required
-def checkout_page():
-    user_id = session['user_id']
-    conn = get_db_connection()
-    if not conn:
-        flash("Database connection failed.", "danger")
-        return redirect(url_for('cart_page'))
+        if created:
+            order_queue.notify()
+            publish_order_event({'type': 'order.placed', 'order_id': order_id, 'user_id': user_id, 'status': 'Processing'})
+            set_cart_count(user_id, 0)
+            app.logger.info("checkout user=%s order=%s timings=%s", user_id, order_id, timings)
+            flash("Order placed successfully!", "success")
+        response = redirect(url_for('order_detail_page', order_id=order_id))
+        response.headers['Server-Timing'] = server_timing(timings)
+        return response
 
     cart = {}
     try:
@@ -630,41 +3277,6 @@ def checkout_page():
         flash("Your cart is empty.", "warning")
         return redirect(url_for('cart_page'))
 
-    if request.method == 'POST':
-        try:
-            product_ids = list(cart.keys())
-            placeholders = ','.join(['%s'] * len(product_ids))
-            cur = conn.cursor(dictionary=True)
-            query = f"SELECT product_id, price FROM products WHERE product_id IN ({placeholders})"
-            cur.execute(query, product_ids)
-            products_from_db = {str(p['product_id']): p for p in cur.fetchall()}
-            
-            total_price = sum(products_from_db[pid]['price'] * qty for pid, qty in cart.items() if pid in products_from_db)
-
-            cur.execute(
-                "INSERT INTO orders (user_id, total_amount, status, tracking_number) VALUES (%s, %s, %s, %s)",
-                (user_id, total_price, 'Processing', f"LUMORA{secrets.token_hex(6).upper()}")
-            )
-            order_id = cur.lastrowid
-
-            order_items_data = [
-                (order_id, pid, qty, products_from_db[pid]['price'])
-                for pid, qty in cart.items() if pid in products_from_db
-            ]
-            cur.executemany("INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (%s, %s, %s, %s)", order_items_data)
-
-            cur.execute("DELETE FROM cart_items WHERE user_id = %s", (user_id,))
-            conn.commit()
-
-            flash("Order placed successfully!", "success") 
-            return redirect(url_for('order_detail_page', order_id=order_id))
-        except Error as e:
-            if conn: conn.rollback()
-            flash(f"An error occurred while placing your order: {e}", "danger")
-            return redirect(url_for('cart_page'))
-        finally:
-            if conn.is_connected(): conn.close()
-
     cart_products = []
     total_price = 0
     user_data = None
@@ -674,61 +3286,187 @@ def checkout_page():
                 cur.execute("SELECT p.email, d.* FROM profile p LEFT JOIN user_details d ON p.user_id = d.profile_id WHERE p.user_id = %s", (session['user_id'],))
                 user_data = cur.fetchone()
                 if cart:
-                    product_ids = list(cart.keys())
-                    placeholders = ','.join(['%s'] * len(product_ids))
-                    query = f"SELECT product_id, name, price, image FROM products WHERE product_id IN ({placeholders})"
-                    cur.execute(query, product_ids)
-                    products_from_db = {str(p['product_id']): p for p in cur.fetchall()}
+                    products_from_db = catalog.get_many(cart.keys())
 
                     total_price = sum(products_from_db[pid]['price'] * qty for pid, qty in cart.items() if pid in products_from_db)    
         finally:
             if conn.is_connected(): conn.close()
 
-    return render_template('checkout.html', total_price=total_price, user=user_data)
+    return render_template('checkout.html', total_price=total_price, user=user_data, idempotency_key=secrets.token_urlsafe(16))
+
+ORDERS_PAGE_SIZE = 20
+
+def query_order_page(conn, user_id, before=None, limit=ORDERS_PAGE_SIZE):
+    query = "SELECT order_id, total_amount, status, created_at FROM orders WHERE user_id = %s"
+    params = [user_id]
+    if before:
+        created_at, order_id = decode_cursor(before)
+        query += " AND (created_at < %s OR (created_at = %s AND order_id < %s))"
+        params.extend([created_at, created_at, int(order_id)])
+    query += " ORDER BY created_at DESC, order_id DESC LIMIT %s"
+    params.append(limit + 1)
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute(query, params)
+        orders = cur.fetchall()
+    next_cursor = None
+    if len(orders) > limit:
+        last = orders[limit - 1]
+        next_cursor = encode_cursor([last['created_at'], last['order_id']])
+    return orders[:limit], next_cursor
 
 @app.route('/my-orders')
 @login_required
 def my_orders_page():
     user_id = session['user_id']
-    conn = get_db_connection()
+    conn = get_db_connection(readonly=True)
     orders = []
+    next_cursor = None
+    summary = None
     if conn:
         try:
+            orders, next_cursor = query_order_page(conn, user_id, request.args.get('before'))
             with conn.cursor(dictionary=True) as cur:
-                cur.execute("SELECT * FROM orders WHERE user_id = %s ORDER BY created_at DESC", (user_id,))
-                orders = cur.fetchall()
+                cur.execute("SELECT order_count, lifetime_spend, last_order_at FROM user_order_summary WHERE user_id = %s", (user_id,))
+                summary = cur.fetchone()
+        except (ValueError, TypeError):
+            return redirect(url_for('my_orders_page'))
         except Error as e:
             flash(f"Could not retrieve your orders: {e}", "danger")
         finally:
             if conn.is_connected(): conn.close()
-    return render_template('my_orders.html', orders=orders)
+    return render_template('my_orders.html', orders=orders, next_cursor=next_cursor, summary=summary)
+
+@app.cli.command('rebuild-order-summaries')
+def rebuild_order_summaries_command():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                REPLACE INTO user_order_summary (user_id, order_count, lifetime_spend, last_order_id, last_order_at)
+                SELECT user_id, COUNT(*), SUM(total_amount), MAX(order_id), MAX(created_at) FROM orders GROUP BY user_id
+            """)
+            print(f"Rebuilt order summaries for {cur.rowcount} rows.")
+        conn.commit()
+    finally:
+        conn.close()
+
+order_cache = LRUCache(maxsize=app.config['ORDER_CACHE_SIZE'])
+FINAL_ORDER_STATUSES = ('Completed', 'Cancelled')
+
+def forget_cached_order(event):
+    order_cache.delete(event['order_id'])
+
+order_queue.listeners.append(forget_cached_order)
+
+def load_order(conn, order_id, user_id):
+    # One round trip: order header and line items together. Items placed before
+    # snapshots existed fall back to the live product row.
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute("""
+            SELECT o.order_id, o.user_id, o.total_amount, o.status, o.tracking_number, o.created_at,
+                oi.product_id, oi.quantity, oi.price,
+                COALESCE(oi.product_name, p.name) AS name, COALESCE(oi.product_image, p.image) AS image_url
+            FROM orders o
+            LEFT JOIN order_items oi ON oi.order_id = o.order_id
+            LEFT JOIN products p ON p.product_id = oi.product_id AND oi.product_name IS NULL
+            WHERE o.order_id = %s AND o.user_id = %s
+        """, (order_id, user_id))
+        rows = cur.fetchall()
+    if not rows:
+        return None
+    first = rows[0]
+    order = {key: first[key] for key in ('order_id', 'user_id', 'total_amount', 'status', 'tracking_number', 'created_at')}
+    order['items'] = [{key: row[key] for key in ('product_id', 'quantity', 'price', 'name', 'image_url')}
+                      for row in rows if row['product_id'] is not None]
+    return order
+
+@app.cli.command('rebuild-sales-rollups')
+def rebuild_sales_rollups_command():
+    # Recomputes every rollup from orders/order_items and consumes every
+    # outstanding order.rollup job in the same transaction. Locking those jobs
+    # first waits out any worker mid-job; workers re-check the job under the
+    # same lock, so nothing is folded in twice.
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT job_id FROM order_jobs WHERE kind = 'order.rollup' AND status IN ('pending', 'running', 'failed')
+                FOR UPDATE
+            """)
+            cur.fetchall()
+            for table in ('sales_hourly', 'product_sales_daily', 'category_sales_daily', 'active_users_daily'):
+                cur.execute(f"DELETE FROM {table}")
+            cur.execute("""
+                INSERT INTO sales_hourly (bucket_hour, order_count, items_sold, revenue)
+                SELECT DATE_FORMAT(o.created_at, '%Y-%m-%d %H:00:00'), COUNT(*), COALESCE(SUM(i.units), 0), SUM(o.total_amount)
+                FROM orders o
+                LEFT JOIN (SELECT order_id, SUM(quantity) AS units FROM order_items GROUP BY order_id) i ON i.order_id = o.order_id
+                GROUP BY 1
+            """)
+            cur.execute("""
+                INSERT INTO product_sales_daily (day, product_id, units, revenue)
+                SELECT DATE(o.created_at), oi.product_id, SUM(oi.quantity), SUM(oi.quantity * oi.price)
+                FROM orders o JOIN order_items oi ON oi.order_id = o.order_id
+                GROUP BY 1, 2
+            """)
+            cur.execute("""
+                INSERT INTO category_sales_daily (day, category, units, revenue)
+                SELECT DATE(o.created_at), COALESCE(p.category, 'uncategorized'), SUM(oi.quantity), SUM(oi.quantity * oi.price)
+                FROM orders o JOIN order_items oi ON oi.order_id = o.order_id
+                LEFT JOIN products p ON p.product_id = oi.product_id
+                GROUP BY 1, 2
+            """)
+            cur.execute("INSERT INTO active_users_daily (day, user_id) SELECT DISTINCT DATE(created_at), user_id FROM orders")
+            cur.execute("UPDATE order_jobs SET status = 'done', finished_at = NOW(3) WHERE kind = 'order.rollup' AND status IN ('pending', 'running', 'failed')")
+        conn.commit()
+        print("Rebuilt sales rollups.")
+    finally:
+        conn.close()
 
 @app.route('/order/<int:order_id>')
 @login_required
 def order_detail_page(order_id):
     user_id = session['user_id']
-    conn = get_db_connection()
-    order = None
-    if conn:
-        try:
-            with conn.cursor(dictionary=True) as cur:
-                cur.execute("SELECT * FROM orders WHERE order_id = %s AND user_id = %s", (order_id, user_id))
-                order = cur.fetchone()
-                if order:
-                    cur.execute("""
-                        SELECT oi.quantity, oi.price, p.name, p.image as image_url, p.product_id
-                        FROM order_items oi JOIN products p ON oi.product_id = p.product_id 
-                        WHERE oi.order_id = %s
-                    """, (order_id,))
-                    order['items'] = cur.fetchall()
-        finally:
-            if conn.is_connected(): conn.close()
+    order = order_cache.get(order_id)
+    if order and order['user_id'] != user_id:
+        order = None
+    elif not order:
+        conn = get_db_connection(readonly=True)
+        if conn:
+            try:
+                order = load_order(conn, order_id, user_id)
+            finally:
+                if conn.is_connected(): conn.close()
+        if order:
+            # Final orders never change; live ones expire quickly so status
+            # changes made by other worker processes still show up.
+            ttl = None if order['status'] in FINAL_ORDER_STATUSES else app.config['ORDER_CACHE_ACTIVE_TTL']
+            order_cache.set(order_id, order, ttl=ttl)
     
     if not order:
         flash("Order not found or you do not have permission to view it.", "warning")
         return redirect(url_for('my_orders_page'))
 
-    return render_template('order_detail.html', order=order)
+    return render_template('order_detail.html', order=order, live=order['status'] not in FINAL_ORDER_STATUSES)
+
+@app.route('/api/orders/<int:order_id>/stream')
+@login_required
+def order_stream(order_id):
+    conn = get_db_connection()
+    if not conn:
+        return jsonify(success=False, message="Database connection failed."), 500
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute("SELECT order_id, user_id, status FROM orders WHERE order_id = %s AND user_id = %s", (order_id, session['user_id']))
+            order = cur.fetchone()
+    finally:
+        if conn.is_connected(): conn.close()
+    if not order:
+        return jsonify(success=False, message="Order not found."), 404
+    if order['status'] in FINAL_ORDER_STATUSES:
+        # 204 tells EventSource to stop reconnecting; nothing will change.
+        return '', 204
+    return sse_response([order_channel(order_id)], [{'type': 'order.status', **order}])
 
 @app.route('/contact', methods=['GET', 'POST'])
 def contact_page():
@@ -770,21 +3508,526 @@ def faqs_page():
     return render_template('faqs.html')
 
 
+MENU_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+_menu_bodies = {'version': None, 'bodies': {}}
+_menu_bodies_lock = threading.Lock()
+
+def menu_bodies(version, products):
+    with _menu_bodies_lock:
+        if _menu_bodies['version'] != version:
+            items = [{**p, 'id': p['product_id'], 'image_srcset': images.srcset(p['image'])}
+                     for p in sorted(products, key=lambda p: p['product_id'])]
+            body = app.json.dumps(items).encode('utf-8')
+            bodies = {'identity': body, 'gzip': gzip.compress(body, 9)}
+            if brotli:
+                bodies['br'] = brotli.compress(body)
+            _menu_bodies.update(version=version, bodies=bodies)
+        return _menu_bodies['bodies']
+
+def menu_etag(version, encoding):
+    return f"menu-v{version}" if encoding == 'identity' else f"menu-v{version}-{encoding}"
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, default=str).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+
+MENU_FIELDS = ('product_id', 'name', 'category', 'type', 'description', 'price', 'image', 'stock', 'badge')
+MENU_QUERY_PARAMS = ('category', 'type', 'min_price', 'max_price', 'in_stock', 'fields', 'limit', 'cursor')
+MENU_PAGE_SIZE = 50
+MENU_MAX_PAGE_SIZE = 200
+
+def encode_menu_cursor(product):
+    return encode_cursor([product['category'], product['name'], product['product_id']])
+
+def decode_menu_cursor(cursor):
+    category, name, product_id = decode_cursor(cursor)
+    return category, name, int(product_id)
+
+def menu_page_query(args):
+    # Shared by the sync view and the async (ASGI) handler.
+    where, params = [], []
+    if args.get('category'):
+        where.append("category = %s")
+        params.append(args['category'])
+    if args.get('type'):
+        where.append("type = %s")
+        params.append(args['type'])
+    if args.get('min_price'):
+        where.append("price >= %s")
+        params.append(float(args['min_price']))
+    if args.get('max_price'):
+        where.append("price <= %s")
+        params.append(float(args['max_price']))
+    if args.get('in_stock', '').lower() in ('1', 'true', 'yes'):
+        where.append("stock > 0")
+    if args.get('cursor'):
+        category, name, product_id = decode_menu_cursor(args['cursor'])
+        # Expanded row comparison so MySQL can range-scan the composite index.
+        # NULL categories sort first and never compare greater than anything,
+        # so a cursor inside them continues with every non-NULL category.
+        after = "(name > %s OR (name = %s AND product_id > %s))"
+        if category is None:
+            where.append(f"(category IS NOT NULL OR {after})")
+            params.extend([name, name, product_id])
+        else:
+            where.append(f"(category > %s OR (category = %s AND {after}))")
+            params.extend([category, category, name, name, product_id])
+
+    fields = None
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f != 'id' and f not in MENU_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    columns = '*'
+    if fields:
+        selected = {f for f in fields if f != 'id'} | {'product_id', 'category', 'name'}
+        columns = ', '.join(f for f in MENU_FIELDS if f in selected)
+
+    limit = min(max(int(args.get('limit', MENU_PAGE_SIZE)), 1), MENU_MAX_PAGE_SIZE)
+    query = f"SELECT {columns} FROM products"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY category, name, product_id LIMIT %s"
+    params.append(limit + 1)
+    return query, params, limit, fields
+
+def query_menu_page(conn, args):
+    query, params, limit, fields = menu_page_query(args)
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+    return menu_page_result(rows, limit, fields)
+
+def menu_page_result(rows, limit, fields):
+    next_cursor = encode_menu_cursor(rows[limit - 1]) if len(rows) > limit else None
+    items = []
+    for row in rows[:limit]:
+        item = {**row, 'id': row['product_id']}
+        if 'image' in row:
+            item['image_srcset'] = images.srcset(row['image'])
+        if fields:
+            item = {f: item[f] for f in fields}
+        items.append(item)
+    return {'items': items, 'next_cursor': next_cursor}
+
 @app.route('/api/canteen/menu')
 def get_canteen_menu():
-    conn = get_db_connection()
+    if any(param in request.args for param in MENU_QUERY_PARAMS):
+        return get_canteen_menu_page()
+
+    version, products = catalog.snapshot()
+    if products is None:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    encoding = next((e for e in MENU_ENCODINGS if request.accept_encodings[e]), 'identity')
+    etag = menu_etag(version, encoding)
+    if any(request.if_none_match.contains(menu_etag(version, e)) for e in ('identity',) + MENU_ENCODINGS) \
+            or request.if_none_match.star_tag:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(menu_bodies(version, products)[encoding], mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = app.config['MENU_CACHE_CONTROL']
+    response.vary.add('Accept-Encoding')
+    return response
+
+def get_canteen_menu_page():
+    conn = get_db_connection(readonly=True)
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
-    
     try:
-        with conn.cursor(dictionary=True) as cur:
-            cur.execute("SELECT *, product_id as id FROM products ORDER BY product_id")
-            return jsonify(cur.fetchall())
+        return jsonify(query_menu_page(conn, request.args))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
     except Error as e:
         return jsonify({"error": str(e)}), 500
     finally:
         if conn.is_connected(): conn.close()
 
+# Devanagari (U+0900) and Telugu (U+0C00) share the ISCII-derived layout, so
+# one table keyed by offset within the block romanizes both.
+INDIC_BLOCKS = (0x0900, 0x0C00)
+INDIC_VOWELS = {0x05: 'a', 0x06: 'aa', 0x07: 'i', 0x08: 'ii', 0x09: 'u', 0x0A: 'uu', 0x0B: 'ri',
+                0x0E: 'e', 0x0F: 'e', 0x10: 'ai', 0x12: 'o', 0x13: 'o', 0x14: 'au'}
+INDIC_CONSONANTS = {0x15: 'k', 0x16: 'kh', 0x17: 'g', 0x18: 'gh', 0x19: 'n', 0x1A: 'ch', 0x1B: 'chh',
+                    0x1C: 'j', 0x1D: 'jh', 0x1E: 'n', 0x1F: 't', 0x20: 'th', 0x21: 'd', 0x22: 'dh',
+                    0x23: 'n', 0x24: 't', 0x25: 'th', 0x26: 'd', 0x27: 'dh', 0x28: 'n', 0x2A: 'p',
+                    0x2B: 'ph', 0x2C: 'b', 0x2D: 'bh', 0x2E: 'm', 0x2F: 'y', 0x30: 'r', 0x31: 'r',
+                    0x32: 'l', 0x33: 'l', 0x35: 'v', 0x36: 'sh', 0x37: 'sh', 0x38: 's', 0x39: 'h',
+                    0x58: 'q', 0x59: 'kh', 0x5A: 'g', 0x5B: 'z', 0x5C: 'r', 0x5D: 'rh', 0x5E: 'f', 0x5F: 'y'}
+INDIC_MATRAS = {0x3E: 'aa', 0x3F: 'i', 0x40: 'ii', 0x41: 'u', 0x42: 'uu', 0x43: 'ri', 0x46: 'e',
+                0x47: 'e', 0x48: 'ai', 0x4A: 'o', 0x4B: 'o', 0x4C: 'au', 0x4D: ''}
+INDIC_MARKS = {0x01: 'n', 0x02: 'n', 0x03: 'h'}
+
+def indic_offset(ch):
+    code = ord(ch)
+    for base in INDIC_BLOCKS:
+        if base <= code < base + 0x80:
+            return code - base
+    return None
+
+def transliterate(text):
+    if text.isascii():
+        return text
+    out = []
+    pending = None
+    for ch in text:
+        offset = indic_offset(ch)
+        if offset == 0x3C:
+            continue
+        if offset in INDIC_MATRAS:
+            out.append(INDIC_MATRAS[offset])
+            pending = None
+            continue
+        if pending is not None and (offset is not None or pending == INDIC_BLOCKS[1]):
+            # Inherent vowel, dropped word-finally in Hindi (schwa deletion).
+            out.append('a')
+        pending = None
+        if offset in INDIC_CONSONANTS:
+            out.append(INDIC_CONSONANTS[offset])
+            pending = ord(ch) & ~0x7F
+        elif offset in INDIC_VOWELS:
+            out.append(INDIC_VOWELS[offset])
+        elif offset in INDIC_MARKS:
+            out.append(INDIC_MARKS[offset])
+        elif offset is None and ch not in '\u200c\u200d':
+            out.append(ch)
+    if pending == INDIC_BLOCKS[1]:
+        out.append('a')
+    return ''.join(out)
+
+SEARCH_FOLDS = [(re.compile(pattern), replacement) for pattern, replacement in (
+    (r'ee|ii|ie', 'i'), (r'oo|uu', 'u'), (r'aa', 'a'), (r'w', 'v'), (r'ph', 'f'), (r'(.)\1', r'\1'),
+)]
+SEARCH_STOPWORDS = {'a', 'an', 'and', 'the', 'of', 'with', 'in', 'on', 'for', 'or'}
+
+@lru_cache(maxsize=65536)
+def fold_term(term):
+    # Phonetic folding so romanized spellings meet: paneer/panir, chawal/chaval.
+    for pattern, replacement in SEARCH_FOLDS:
+        term = pattern.sub(replacement, term)
+    return term
+
+def search_terms(text):
+    text = str(text or '')
+    if not text.isascii():
+        text = transliterate(unicodedata.normalize('NFKC', text))
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return [fold_term(t) for t in re.findall(r'[a-z0-9]+', text.lower()) if t not in SEARCH_STOPWORDS]
+
+# Romanized Hindi/Telugu food and menu words (plus the category labels from
+# translator.js) mapped onto the English words the menu is written in.
+SEARCH_SYNONYMS = {fold_term(word): targets for words, targets in (
+    (('chawal', 'chaval', 'bhaat', 'annam', 'biyyam'), ('rice',)),
+    (('murgh', 'murg', 'kodi'), ('chicken',)),
+    (('gosht', 'mamsam', 'maamsam'), ('mutton',)),
+    (('machli', 'machhli', 'chepa'), ('fish',)),
+    (('anda', 'guddu'), ('egg',)),
+    (('aloo', 'alu', 'bangaladumpa'), ('potato',)),
+    (('pappu',), ('dal', 'lentil')),
+    (('doodh', 'dudh', 'paalu'), ('milk',)),
+    (('chai', 'chaay'), ('tea', 'chai')),
+    (('kaafi', 'kafi'), ('coffee',)),
+    (('paani', 'neellu', 'nillu'), ('water',)),
+    (('dahi', 'perugu'), ('curd',)),
+    (('sabzi', 'sabji', 'kura', 'koora'), ('curry', 'vegetable')),
+    (('chapati', 'chapathi', 'rotti'), ('roti', 'bread')),
+    (('meetha', 'mitha', 'mithai', 'mithaai', 'tipi', 'dejart'), ('dessert', 'sweet')),
+    (('pey', 'peya', 'paaniiy', 'paniy', 'sharbat'), ('beverage', 'drink')),
+    (('mukhy', 'mukhya', 'pradhaan', 'pradhan'), ('main',)),
+    (('nashta', 'naashta', 'akali', 'chirutindi'), ('appetizer', 'snack', 'starter')),
+    (('teekha', 'tikha', 'kaaram', 'karam'), ('spicy',)),
+) for word in words}
+SYNONYM_MIN_PREFIX = 4
+
+
+class SearchIndex:
+    # Inverted index over the catalog: term -> {product_id: weight}. A sorted
+    # vocabulary serves prefix lookups and a one-deletion neighbourhood
+    # (SymSpell-style) serves edit-distance-1 typos without scanning terms.
+    FIELDS = (('name', 3.0), ('category', 2.0), ('badge', 2.0), ('description', 1.0))
+    EXACT, SYNONYM, PREFIX, TYPO = 1.0, 0.9, 0.7, 0.5
+    MAX_PREFIX_TERMS = 200
+    MIN_TYPO_LENGTH = 4
+
+    def __init__(self):
+        self.version = None
+        self._lock = threading.RLock()
+        self._doc_terms = {}
+        self._postings = {}
+        self._vocab = []
+        self._deletes = {}
+        self.queries = 0
+        self.query_ms = 0.0
+        self.rebuilds = 0
+
+    def _deletions(self, term):
+        return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+    def _add_term(self, term):
+        bisect.insort(self._vocab, term)
+        if len(term) >= self.MIN_TYPO_LENGTH:
+            for variant in self._deletions(term):
+                self._deletes.setdefault(variant, set()).add(term)
+
+    def _remove_term(self, term):
+        del self._postings[term]
+        del self._vocab[bisect.bisect_left(self._vocab, term)]
+        if len(term) >= self.MIN_TYPO_LENGTH:
+            for variant in self._deletions(term):
+                terms = self._deletes.get(variant)
+                if terms:
+                    terms.discard(term)
+                    if not terms:
+                        del self._deletes[variant]
+
+    def _add(self, product):
+        weights = {}
+        for field, weight in self.FIELDS:
+            for term in search_terms(product.get(field)):
+                weights[term] = max(weights.get(term, 0.0), weight)
+        product_id = product['product_id']
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                self._add_term(term)
+            postings[product_id] = weight
+        self._doc_terms[product_id] = set(weights)
+
+    def _drop(self, product_id):
+        for term in self._doc_terms.pop(product_id, ()):
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                self._remove_term(term)
+
+    def rebuild(self, version, products):
+        with self._lock:
+            self._doc_terms, self._postings, self._deletes = {}, {}, {}
+            self._vocab = []
+            for product in products:
+                self._add(product)
+            self.version = version
+            self.rebuilds += 1
+
+    def sync(self):
+        # Rebuild only when the catalog moved on without telling us (TTL
+        # reload, a write from another process); admin edits in this process
+        # arrive through on_catalog_change.
+        version, products = catalog.snapshot()
+        if products is None:
+            return False
+        if version != self.version:
+            self.rebuild(version, products)
+        return True
+
+    def on_catalog_change(self, action, version, payload):
+        with self._lock:
+            if self.version != version - 1:
+                return
+            if action == 'upsert':
+                self._drop(payload['product_id'])
+                self._add(payload)
+            else:
+                self._drop(payload)
+            self.version = version
+
+    def _matches(self, token):
+        matches = {}
+        def offer(term, factor):
+            if factor > matches.get(term, 0.0):
+                matches[term] = factor
+        candidates = [(token, self.EXACT)]
+        for key, targets in SEARCH_SYNONYMS.items():
+            if token == key or (len(key) >= SYNONYM_MIN_PREFIX and token.startswith(key)):
+                candidates.extend((fold_term(target), self.SYNONYM) for target in targets)
+        for term, factor in candidates:
+            if term in self._postings:
+                offer(term, factor)
+            if len(term) >= 2:
+                start = bisect.bisect_left(self._vocab, term)
+                for candidate in self._vocab[start:start + self.MAX_PREFIX_TERMS]:
+                    if not candidate.startswith(term):
+                        break
+                    offer(candidate, factor * self.PREFIX)
+            if len(term) >= self.MIN_TYPO_LENGTH:
+                for candidate in self._deletes.get(term, ()):
+                    offer(candidate, factor * self.TYPO)
+                for variant in self._deletions(term):
+                    if variant in self._postings:
+                        offer(variant, factor * self.TYPO)
+                    for candidate in self._deletes.get(variant, ()):
+                        offer(candidate, factor * self.TYPO)
+        return matches
+
+    def search(self, query, limit=20, where=None):
+        started = time.perf_counter()
+        tokens = search_terms(query)
+        scores = None
+        with self._lock:
+            for token in tokens:
+                token_scores = None
+                for term, factor in self._matches(token).items():
+                    postings = self._postings[term]
+                    if token_scores is None:
+                        token_scores = dict(postings) if factor == 1.0 else {pid: weight * factor for pid, weight in postings.items()}
+                        continue
+                    for product_id, weight in postings.items():
+                        score = weight * factor
+                        if score > token_scores.get(product_id, 0.0):
+                            token_scores[product_id] = score
+                # Every query word has to match something (AND semantics).
+                if not token_scores:
+                    scores = {}
+                elif scores is None:
+                    scores = token_scores
+                else:
+                    small, large = sorted((scores, token_scores), key=len)
+                    scores = {pid: score + large[pid] for pid, score in small.items() if pid in large}
+                if not scores:
+                    break
+        scores = scores or {}
+        if where is not None:
+            scores = {pid: score for pid, score in scores.items() if where(pid)}
+        top = heapq.nlargest(limit, scores, key=scores.__getitem__)
+        results = sorted(((pid, scores[pid]) for pid in top), key=lambda item: (-item[1], item[0]))
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.queries += 1
+            self.query_ms += elapsed
+        return results, elapsed
+
+    def stats(self):
+        with self._lock:
+            return {'version': self.version, 'documents': len(self._doc_terms), 'terms': len(self._vocab),
+                    'deletion_variants': len(self._deletes), 'queries': self.queries, 'rebuilds': self.rebuilds,
+                    'avg_query_ms': round(self.query_ms / self.queries, 4) if self.queries else 0.0}
+
+
+search_index = SearchIndex()
+catalog.listeners.append(search_index.on_catalog_change)
+SEARCH_MAX_RESULTS = 100
+
+@app.route('/api/canteen/search')
+def search_canteen_menu():
+    query = request.args.get('q', '').strip()[:100]
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), SEARCH_MAX_RESULTS)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not query:
+        return jsonify({'query': query, 'items': []})
+    if not search_index.sync():
+        return jsonify({"error": "Database connection failed"}), 500
+
+    category, product_type = request.args.get('category'), request.args.get('type')
+    def matches(product_id):
+        product = catalog.get(product_id)
+        return (product is not None and (not category or product['category'] == category)
+                and (not product_type or product['type'] == product_type))
+    results, took_ms = search_index.search(query, limit, matches if category or product_type else None)
+    products = catalog.get_many([product_id for product_id, _ in results])
+    items = [{**products[str(product_id)], 'id': product_id, 'score': round(score, 3)}
+             for product_id, score in results if str(product_id) in products]
+    return jsonify({'query': query, 'items': items, 'took_ms': round(took_ms, 3)})
+
+def fetch_product(conn, product_id):
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute("SELECT * FROM products WHERE product_id = %s", (product_id,))
+        return cur.fetchone()
+
+def ingest_product_image(product_id, image):
+    # Returns the static path of the replaced original, or None if the
+    # product's image was left alone.
+    rel = static_path(image)
+    source = os.path.join(app.static_folder, rel) if rel else None
+    if not source or images.owns(image) or not os.path.isfile(source):
+        return None
+    stored = '/static/' + images.store_file(source, background=False)
+    conn = get_db_connection(request_scoped=False)
+    if not conn:
+        return None
+    try:
+        with conn.cursor() as cur:
+            # Skip the swap if the item was edited again in the meantime.
+            cur.execute("UPDATE products SET image = %s WHERE product_id = %s AND image = %s", (stored, product_id, image))
+            if cur.rowcount == 0:
+                conn.rollback()
+                return None
+            version = catalog.bump_version(cur)
+            product = fetch_product(conn, product_id)
+        conn.commit()
+        catalog.upsert(version, product)
+        return rel
+    except Error as e:
+        conn.rollback()
+        print(f"Error storing image for product {product_id}: {e}")
+    finally:
+        conn.close()
+
+def remove_orphaned_images(conn, paths):
+    # Deletes replaced originals from the static folder once no product,
+    # profile or past order line (which keeps its own image snapshot) still
+    # points at them, in either the '/static/...' or the relative form.
+    removed = 0
+    with conn.cursor() as cur:
+        for rel in sorted(paths):
+            forms = (rel, '/static/' + rel)
+            cur.execute("""
+                SELECT 1 FROM products WHERE image IN (%s, %s)
+                UNION ALL SELECT 1 FROM user_details WHERE profile_picture_url IN (%s, %s)
+                UNION ALL SELECT 1 FROM order_items WHERE product_image IN (%s, %s)
+                LIMIT 1
+            """, forms * 3)
+            if cur.fetchone():
+                continue
+            try:
+                os.remove(os.path.join(app.static_folder, rel))
+                removed += 1
+            except OSError as e:
+                print(f"Error removing orphaned image {rel}: {e}")
+    return removed
+
+@app.cli.command('process-images')
+def process_images_command():
+    # Moves existing menu images and profile pictures into the content-hashed
+    # store, so duplicate uploads collapse to one file with resized variants.
+    conn = get_db_connection()
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute("SELECT product_id, image FROM products")
+            products = cur.fetchall()
+            cur.execute("SELECT profile_id, profile_picture_url FROM user_details WHERE profile_picture_url IS NOT NULL")
+            profiles = cur.fetchall()
+        replaced = set()
+        for product in products:
+            rel = ingest_product_image(product['product_id'], product['image'])
+            if rel:
+                replaced.add(rel)
+        moved = 0
+        with conn.cursor() as cur:
+            for profile in profiles:
+                rel = static_path(profile['profile_picture_url'])
+                source = os.path.join(app.static_folder, rel) if rel else None
+                if not source or images.owns(rel) or not os.path.isfile(source) or rel.endswith('default-avatar.png'):
+                    continue
+                stored = images.store_file(source, background=False)
+                cur.execute("UPDATE user_details SET profile_picture_url = %s WHERE profile_id = %s", (stored, profile['profile_id']))
+                replaced.add(rel)
+                moved += 1
+        conn.commit()
+        removed = remove_orphaned_images(conn, replaced)
+        print(f"Processed {len(products)} menu images and {moved} profile pictures, "
+              f"removed {removed} orphaned originals: {images.stats()}")
+    finally:
+        conn.close()
+
 @app.route('/admin/canteen-menu')
 @admin_required
 def admin_canteen_page():
@@ -803,8 +4046,13 @@ def add_canteen_item():
                 INSERT INTO products (name, category, type, description, price, image, stock, badge)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """, (data['name'], data['category'], data.get('type', 'veg'), data['description'], data['price'], data['image'], data['stock'], data.get('badge')))
+            item_id = cur.lastrowid
+            version = catalog.bump_version(cur)
+            product = fetch_product(conn, item_id)
             conn.commit()
-            return jsonify(success=True, message="Item added successfully", id=cur.lastrowid)
+            catalog.upsert(version, product)
+            images.submit(ingest_product_image, item_id, product['image'])
+            return jsonify(success=True, message="Item added successfully", id=item_id)
     except Error as e:
         conn.rollback()
         return jsonify(success=False, message=str(e)), 500
@@ -824,7 +4072,14 @@ def update_canteen_item(item_id):
                 UPDATE products SET name=%s, category=%s, type=%s, description=%s, price=%s, image=%s, stock=%s, badge=%s
                 WHERE product_id=%s
             """, (data['name'], data['category'], data.get('type', 'veg'), data['description'], data['price'], data['image'], data['stock'], data.get('badge'), item_id))
+            version = catalog.bump_version(cur)
+            product = fetch_product(conn, item_id)
             conn.commit()
+            if product:
+                catalog.upsert(version, product)
+                images.submit(ingest_product_image, item_id, product['image'])
+            else:
+                catalog.remove(version, item_id)
             return jsonify(success=True, message="Item updated successfully")
     except Error as e:
         conn.rollback()
@@ -841,7 +4096,9 @@ def delete_canteen_item(item_id):
     try:
         with conn.cursor() as cur:
             cur.execute("DELETE FROM products WHERE product_id = %s", (item_id,))
+            version = catalog.bump_version(cur)
             conn.commit()
+            catalog.remove(version, item_id)
             return jsonify(success=True, message="Item deleted successfully")
     except Error as e:
         conn.rollback()
@@ -849,6 +4106,246 @@ def delete_canteen_item(item_id):
     finally:
         if conn.is_connected(): conn.close()
 
+CATALOG_EDITABLE = MENU_FIELDS[1:]
+PRODUCT_TYPES = ('veg', 'nonveg')
+IMPORT_CHUNK = 500
+EXPORT_CHUNK = 500
+
+def chunked(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def validate_catalog_row(raw):
+    errors = []
+    row = {}
+    product_id = raw.get('product_id') or raw.get('id')
+    if product_id not in (None, ''):
+        try:
+            row['product_id'] = int(product_id)
+        except (TypeError, ValueError):
+            errors.append("product_id must be an integer")
+    for field, limit in (('name', 100), ('category', 50)):
+        value = str(raw.get(field) or '').strip()
+        if not value:
+            errors.append(f"{field} is required")
+        elif len(value) > limit:
+            errors.append(f"{field} is longer than {limit} characters")
+        row[field] = value
+    row['type'] = str(raw.get('type') or 'veg').strip().lower()
+    if row['type'] not in PRODUCT_TYPES:
+        errors.append(f"type must be one of {', '.join(PRODUCT_TYPES)}")
+    row['description'] = str(raw.get('description') or '')
+    row['image'] = str(raw.get('image') or '')
+    row['badge'] = str(raw.get('badge')).strip() if raw.get('badge') not in (None, '') else None
+    try:
+        row['price'] = Decimal(str(raw.get('price'))).quantize(Decimal('0.01'))
+        if row['price'] < 0:
+            errors.append("price must not be negative")
+    except (InvalidOperation, ValueError):
+        errors.append("price must be a number")
+    try:
+        row['stock'] = int(raw.get('stock') or 0)
+        if row['stock'] < 0:
+            errors.append("stock must not be negative")
+    except (TypeError, ValueError):
+        errors.append("stock must be an integer")
+    return row, errors
+
+def read_import_rows():
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or ('json' if (upload.filename if upload else '').endswith('.json') or request.is_json else 'csv')
+    if fmt == 'json':
+        data = json.load(upload.stream) if upload else request.get_json(silent=True)
+        rows = data.get('items') if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise ValueError("Expected a JSON list of items.")
+        return rows
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig') if upload else io.StringIO(request.get_data(as_text=True))
+    return list(csv.DictReader(stream))
+
+def diff_catalog_import(conn, rows):
+    with conn.cursor(dictionary=True) as cur:
+        cur.execute(f"SELECT {', '.join(MENU_FIELDS)} FROM products")
+        current = {p['product_id']: p for p in cur.fetchall()}
+    created, updated, unchanged = [], [], 0
+    for row in rows:
+        existing = current.get(row.get('product_id'))
+        if existing is None:
+            created.append(row)
+            continue
+        changes = {f: [existing[f], row[f]] for f in CATALOG_EDITABLE if existing[f] != row[f]}
+        if changes:
+            updated.append((row, changes))
+        else:
+            unchanged += 1
+    return created, updated, unchanged
+
+def apply_catalog_import(cur, created, updated):
+    with_ids = [row for row in created if 'product_id' in row] + [row for row, _ in updated]
+    without_ids = [row for row in created if 'product_id' not in row]
+    assignments = ', '.join(f"{f} = VALUES({f})" for f in CATALOG_EDITABLE)
+    for chunk in chunked(with_ids, IMPORT_CHUNK):
+        cur.execute(
+            f"INSERT INTO products ({', '.join(MENU_FIELDS)}) VALUES " +
+            ','.join(['(' + ', '.join(['%s'] * len(MENU_FIELDS)) + ')'] * len(chunk)) +
+            f" ON DUPLICATE KEY UPDATE {assignments}",
+            [row[f] for row in chunk for f in MENU_FIELDS]
+        )
+    for chunk in chunked(without_ids, IMPORT_CHUNK):
+        cur.execute(
+            f"INSERT INTO products ({', '.join(CATALOG_EDITABLE)}) VALUES " +
+            ','.join(['(' + ', '.join(['%s'] * len(CATALOG_EDITABLE)) + ')'] * len(chunk)),
+            [row[f] for row in chunk for f in CATALOG_EDITABLE]
+        )
+
+@app.route('/api/admin/canteen/menu/import', methods=['POST'])
+@admin_required
+def import_canteen_menu():
+    dry_run = request.args.get('dry_run', '1').lower() not in ('0', 'false', 'no')
+    try:
+        raw_rows = read_import_rows()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify(success=False, message=f"Could not read import: {e}"), 400
+
+    rows, errors, seen_ids = [], [], set()
+    for line, raw in enumerate(raw_rows, start=1):
+        if not isinstance(raw, dict):
+            errors.append({'row': line, 'errors': ["row must be an object"]})
+            continue
+        row, row_errors = validate_catalog_row(raw)
+        # Rows without an id are new items, so only real ids can collide.
+        if 'product_id' in row:
+            if row['product_id'] in seen_ids:
+                row_errors.append("duplicate product_id in import")
+            seen_ids.add(row['product_id'])
+        if row_errors:
+            errors.append({'row': line, 'errors': row_errors})
+        rows.append(row)
+    if errors:
+        return jsonify(success=False, message="Import has validation errors; nothing was changed.", errors=errors), 400
+
+    conn = get_db_connection()
+    if not conn: return jsonify(success=False, message="Database connection failed"), 500
+    try:
+        created, updated, unchanged = diff_catalog_import(conn, rows)
+        if not dry_run and (created or updated):
+            with conn.cursor() as cur:
+                apply_catalog_import(cur, created, updated)
+                catalog.bump_version(cur)
+            conn.commit()
+            catalog.invalidate()
+    except Error as e:
+        conn.rollback()
+        return jsonify(success=False, message=str(e)), 500
+    finally:
+        if conn.is_connected(): conn.close()
+
+    return jsonify(
+        success=True,
+        dry_run=dry_run,
+        summary={'created': len(created), 'updated': len(updated), 'unchanged': unchanged},
+        created=[row['name'] for row in created],
+        updated=[{'product_id': row['product_id'], 'name': row['name'], 'changes': changes} for row, changes in updated],
+    )
+
+@app.route('/api/admin/canteen/menu/export')
+@admin_required
+def export_canteen_menu():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'json'):
+        return jsonify(success=False, message="format must be csv or json"), 400
+
+    # The stream outlives the request, so it checks out its own connection
+    # and reads the table in chunks rather than materializing it.
+    def generate():
+        conn = get_db_connection(request_scoped=False)
+        if not conn:
+            return
+        try:
+            with conn.cursor(dictionary=True) as cur:
+                cur.execute(f"SELECT {', '.join(MENU_FIELDS)} FROM products ORDER BY product_id")
+                first = True
+                if fmt == 'json':
+                    yield '['
+                else:
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    writer.writerow(MENU_FIELDS)
+                while True:
+                    rows = cur.fetchmany(EXPORT_CHUNK)
+                    if not rows:
+                        break
+                    if fmt == 'json':
+                        chunk = ','.join(json.dumps(row, default=str) for row in rows)
+                        yield chunk if first else ',' + chunk
+                        first = False
+                    else:
+                        writer.writerows([row[c] for c in MENU_FIELDS] for row in rows)
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                if fmt == 'json':
+                    yield ']'
+                elif first:
+                    yield buffer.getvalue()
+        finally:
+            conn.close()
+
+    mimetype = 'application/json' if fmt == 'json' else 'text/csv'
+    return Response(generate(), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=menu.{fmt}'})
+
+@app.route('/api/admin/canteen/menu', methods=['PATCH'])
+@admin_required
+def batch_update_canteen_items():
+    payload = request.get_json(silent=True)
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        return jsonify(success=False, message="Expected a list of {id, price?, stock?} objects."), 400
+
+    prices, stocks = {}, {}
+    try:
+        for item in items:
+            product_id = int(item.get('id') or item.get('product_id'))
+            if item.get('price') is not None:
+                prices[product_id] = Decimal(str(item['price'])).quantize(Decimal('0.01'))
+            if item.get('stock') is not None:
+                stocks[product_id] = int(item['stock'])
+    except (AttributeError, TypeError, ValueError, InvalidOperation):
+        return jsonify(success=False, message="Each item needs an integer id and numeric price/stock."), 400
+    if any(v < 0 for v in prices.values()) or any(v < 0 for v in stocks.values()):
+        return jsonify(success=False, message="Price and stock must not be negative."), 400
+    product_ids = sorted(set(prices) | set(stocks))
+    if not product_ids:
+        return jsonify(success=False, message="Nothing to update."), 400
+
+    conn = get_db_connection()
+    if not conn: return jsonify(success=False, message="Database connection failed"), 500
+    updated = 0
+    try:
+        with conn.cursor() as cur:
+            for chunk in chunked(product_ids, IMPORT_CHUNK):
+                assignments, params = [], []
+                for column, values in (('price', prices), ('stock', stocks)):
+                    cases = [(pid, values[pid]) for pid in chunk if pid in values]
+                    if cases:
+                        assignments.append(f"{column} = CASE product_id " + ' '.join(['WHEN %s THEN %s'] * len(cases)) + f" ELSE {column} END")
+                        params.extend(value for case in cases for value in case)
+                cur.execute(
+                    f"UPDATE products SET {', '.join(assignments)} WHERE product_id IN ({','.join(['%s'] * len(chunk))})",
+                    params + chunk
+                )
+                updated += cur.rowcount
+            catalog.bump_version(cur)
+        conn.commit()
+        catalog.invalidate()
+    except Error as e:
+        conn.rollback()
+        return jsonify(success=False, message=str(e)), 500
+    finally:
+        if conn.is_connected(): conn.close()
+    return jsonify(success=True, message=f"Updated {updated} items", updated=updated)
+
 @app.route('/admin-login', methods=['GET', 'POST'])
 def admin_login_page():
     if session.get('is_admin'):
@@ -867,27 +4364,187 @@ def admin_login_page():
 
     return render_template('admin-login.html')
 
+ADMIN_USERS_PAGE_SIZE = 25
+ANALYTICS_DAYS = 30
+
+def load_dashboard_analytics(cur):
+    analytics = {}
+    cur.execute("""
+        SELECT bucket_hour, order_count, revenue FROM sales_hourly
+        WHERE bucket_hour >= NOW() - INTERVAL 24 HOUR ORDER BY bucket_hour
+    """)
+    analytics['revenue_by_hour'] = cur.fetchall()
+    cur.execute("""
+        SELECT DATE(bucket_hour) AS day, SUM(order_count) AS order_count, SUM(revenue) AS revenue FROM sales_hourly
+        WHERE bucket_hour >= CURDATE() - INTERVAL %s DAY GROUP BY day ORDER BY day
+    """, (ANALYTICS_DAYS - 1,))
+    analytics['revenue_by_day'] = cur.fetchall()
+    orders = sum(row['order_count'] for row in analytics['revenue_by_day'])
+    revenue = sum(row['revenue'] for row in analytics['revenue_by_day'])
+    analytics['order_count'] = orders
+    analytics['revenue'] = revenue
+    analytics['average_order_value'] = revenue / orders if orders else 0
+    cur.execute("""
+        SELECT ps.product_id, COALESCE(p.name, CONCAT('#', ps.product_id)) AS name, SUM(ps.units) AS units, SUM(ps.revenue) AS revenue
+        FROM product_sales_daily ps LEFT JOIN products p ON p.product_id = ps.product_id
+        WHERE ps.day >= CURDATE() - INTERVAL %s DAY
+        GROUP BY ps.product_id, name ORDER BY units DESC LIMIT 10
+    """, (ANALYTICS_DAYS - 1,))
+    analytics['top_products'] = cur.fetchall()
+    cur.execute("""
+        SELECT category, SUM(units) AS units, SUM(revenue) AS revenue FROM category_sales_daily
+        WHERE day >= CURDATE() - INTERVAL %s DAY GROUP BY category ORDER BY revenue DESC
+    """, (ANALYTICS_DAYS - 1,))
+    analytics['category_mix'] = cur.fetchall()
+    cur.execute("""
+        SELECT COUNT(DISTINCT user_id) AS week, COUNT(DISTINCT CASE WHEN day = CURDATE() THEN user_id END) AS today
+        FROM active_users_daily WHERE day >= CURDATE() - INTERVAL 6 DAY
+    """)
+    analytics['active_users'] = cur.fetchone()
+    return analytics
+
 @app.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
-    conn = get_db_connection()
-    data = {'users': []}
+    search = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    conn = get_db_connection(readonly=True)
+    data = {'users': [], 'analytics': None, 'search': search, 'page': page, 'has_next': False}
     if conn:
         try:
             with conn.cursor(dictionary=True) as cur:
-                cur.execute("""
+                query = """
                     SELECT p.user_id, p.username, p.email, p.created_at, d.contact 
                     FROM profile p 
                     LEFT JOIN user_details d ON p.user_id = d.profile_id 
-                    ORDER BY p.created_at DESC
-                """)
-                data['users'] = cur.fetchall()
+                """
+                params = []
+                if search:
+                    query += " WHERE p.username LIKE %s OR p.email LIKE %s"
+                    params.extend([f"{search}%", f"{search}%"])
+                query += " ORDER BY p.created_at DESC, p.user_id DESC LIMIT %s OFFSET %s"
+                params.extend([ADMIN_USERS_PAGE_SIZE + 1, (page - 1) * ADMIN_USERS_PAGE_SIZE])
+                cur.execute(query, params)
+                users = cur.fetchall()
+                data['has_next'] = len(users) > ADMIN_USERS_PAGE_SIZE
+                data['users'] = users[:ADMIN_USERS_PAGE_SIZE]
+                data['analytics'] = load_dashboard_analytics(cur)
         except Error as e:
             flash(f"Error fetching dashboard data: {e}", "danger")
         finally:
             if conn.is_connected(): conn.close()
     return render_template('admin_dashboard.html', data=data)
 
+@app.route('/admin/kitchen')
+@admin_required
+def kitchen_display_page():
+    return render_template('kitchen_display.html', statuses=ORDER_STATUSES)
+
+@app.route('/api/kitchen/stream')
+@admin_required
+def kitchen_stream():
+    conn = get_db_connection()
+    if not conn:
+        return jsonify(success=False, message="Database connection failed."), 500
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute("""
+                SELECT o.order_id, o.user_id, o.status, o.created_at, t.summary AS ticket
+                FROM orders o LEFT JOIN kitchen_tickets t ON o.order_id = t.order_id
+                WHERE o.status NOT IN ('Completed', 'Cancelled')
+                ORDER BY o.order_id
+            """)
+            open_orders = cur.fetchall()
+    finally:
+        if conn.is_connected(): conn.close()
+    return sse_response([KITCHEN_CHANNEL], [{'type': 'order.status', **order} for order in open_orders])
+
+@app.route('/api/admin/orders/<int:order_id>/status', methods=['POST'])
+@admin_required
+def update_order_status(order_id):
+    status = (request.json or {}).get('status')
+    if status not in ORDER_STATUSES:
+        return jsonify(success=False, message="Unknown status."), 400
+    conn = get_db_connection()
+    if not conn: return jsonify(success=False, message="Database connection failed"), 500
+
+    try:
+        with conn.cursor(dictionary=True) as cur:
+            cur.execute("UPDATE orders SET status = %s WHERE order_id = %s", (status, order_id))
+            cur.execute("SELECT user_id FROM orders WHERE order_id = %s", (order_id,))
+            order = cur.fetchone()
+            conn.commit()
+    except Error as e:
+        conn.rollback()
+        return jsonify(success=False, message=str(e)), 500
+    finally:
+        if conn.is_connected(): conn.close()
+    if not order:
+        return jsonify(success=False, message="Order not found."), 404
+    order_cache.delete(order_id)
+    publish_order_event({'type': 'order.status', 'order_id': order_id, 'user_id': order['user_id'], 'status': status})
+    return jsonify(success=True, message="Order status updated")
+
+@app.route('/api/admin/events')
+@admin_required
+def event_broker_stats():
+    return jsonify({**broker.stats(), 'feed': order_events.stats()})
+
+@app.route('/api/admin/order-cache')
+@admin_required
+def order_cache_stats():
+    return jsonify(order_cache.stats())
+
+@app.route('/api/admin/query-stats')
+@admin_required
+def query_stats_page():
+    return jsonify(query_stats.snapshot())
+
+@app.route('/api/admin/db-pool')
+@admin_required
+def db_pool_stats():
+    return jsonify(db_pool.stats())
+
+@app.route('/api/admin/db-replicas')
+@admin_required
+def db_replica_stats():
+    return jsonify(replica_router.stats())
+
+@app.route('/api/admin/order-queue')
+@admin_required
+def order_queue_stats():
+    return jsonify({**order_queue.stats(), 'depth': order_queue.depth()})
+
+@app.route('/api/admin/images')
+@admin_required
+def image_pipeline_stats():
+    return jsonify(images.stats())
+
+@app.route('/api/admin/fragment-cache')
+@admin_required
+def fragment_cache_stats():
+    return jsonify(fragment_cache.stats())
+
+@app.route('/api/admin/search')
+@admin_required
+def search_index_stats():
+    return jsonify(search_index.stats())
+
+@app.route('/api/admin/sessions')
+@admin_required
+def session_store_stats():
+    return jsonify(session_store.stats())
+
+@app.route('/api/admin/rate-limits')
+@admin_required
+def rate_limit_stats():
+    return jsonify(rate_limiter.stats())
+
+@app.route('/api/admin/assets')
+@admin_required
+def static_asset_stats():
+    return jsonify(assets.stats())
+
 @app.route('/admin/delete-user/<int:user_id>', methods=['POST'])
 @admin_required
 def delete_user(user_id):
@@ -905,5 +4562,55 @@ def delete_user(user_id):
             if conn.is_connected(): conn.close()
     return redirect(url_for('admin_dashboard'))
 
+def warm_up():
+    # Run once before workers accept traffic (in the pre-fork master when
+    # preloading): forked workers inherit the loaded catalog, menu bodies,
+    # search index and compiled templates. Warm-up is only an optimization:
+    # a step that fails is logged and left to happen on first use.
+    started = time.perf_counter()
+    products, templates = None, 0
+    # A request context rather than a bare app context, so url_for (image
+    # srcsets in the menu bodies) works without SERVER_NAME.
+    with app.test_request_context():
+        try:
+            version, products = catalog.snapshot()
+            if products is not None:
+                menu_bodies(version, products)
+                search_index.sync()
+        except Exception:
+            app.logger.exception("Warm-up could not preload the catalog")
+        for name in app.jinja_env.list_templates(extensions=('html',)):
+            try:
+                app.jinja_env.get_template(name)
+                templates += 1
+            except (TemplateError, OSError) as e:
+                print(f"Error compiling template {name}: {e}")
+    result = {'event': 'warm_up', 'ms': round((time.perf_counter() - started) * 1000, 2),
+              'products': len(products) if products is not None else None, 'templates': templates}
+    app.logger.info(json.dumps(result))
+    return result
+
+_app_started = False
+
+def create_app(warm=None):
+    # Entry point for app servers, e.g. gunicorn 'app:create_app()'. Importing
+    # the module only reads the configuration and sets up idle singletons
+    # (pools and clients connect on first use), so the CLI, scripts and tests
+    # can import it cheaply. Start-up work that touches the disk runs here,
+    # once per process; schema changes run from flask migrate.
+    global _app_started
+    if not _app_started:
+        _app_started = True
+        enable_template_cache()
+        if app.config['ASSET_PIPELINE']:
+            build_static_assets()
+    if app.config['WARM_UP'] if warm is None else warm:
+        warm_up()
+    return app
+
+@app.cli.command('warm-up')
+def warm_up_command():
+    print(json.dumps(warm_up()))
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
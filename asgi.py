@@ -0,0 +1,323 @@
+"""Async (ASGI) serving mode for the storefront.
+
+    uvicorn asgi:application --workers 1
+
+Two paths run natively on the event loop: the OAuth callback talks to the
+identity provider over httpx, and the paginated menu reads (/api/canteen/menu
+with query parameters) go through an aiomysql pool. Every other route is the
+unchanged Flask app, run on a bounded thread pool, so both modes serve the
+same site. A slow provider now parks a coroutine instead of a worker thread.
+
+The native menu reads always go to the primary (DB_REPLICAS is not consulted)
+and are not counted in the per-request query stats; the bridged routes keep
+both.
+
+Needs the optional aiomysql and httpx packages.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qs, unquote
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from flask import flash, redirect, session, url_for
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import app as storefront
+
+flask_app = storefront.app
+flask_app.config['ASYNC_DB_POOL_SIZE'] = int(os.environ.get('ASYNC_DB_POOL_SIZE', 20))
+flask_app.config['ASYNC_WSGI_THREADS'] = int(os.environ.get('ASYNC_WSGI_THREADS', 32))
+flask_app.config['OAUTH_HTTP_TIMEOUT'] = float(os.environ.get('OAUTH_HTTP_TIMEOUT', 10))
+flask_app.config['OAUTH_HTTP_CONNECTIONS'] = int(os.environ.get('OAUTH_HTTP_CONNECTIONS', 200))
+# The native paths never go through app.wsgi_app, so they apply the same
+# X-Forwarded-* handling to their environ themselves.
+forwarded = ProxyFix(lambda environ, start_response: environ, x_for=flask_app.config['TRUSTED_PROXIES'],
+                     x_proto=flask_app.config['TRUSTED_PROXIES']) if flask_app.config['TRUSTED_PROXIES'] else None
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': unquote(scope['path']).encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': BytesIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body)),
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def client_environ(scope, body):
+    environ = build_environ(scope, body)
+    return forwarded(environ, None) if forwarded else environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AsyncStorefront:
+    def __init__(self, app):
+        self.app = app
+        self.threads = ThreadPoolExecutor(max_workers=app.config['ASYNC_WSGI_THREADS'], thread_name_prefix='wsgi')
+        self.db = None
+        self.http = None
+        self.stats = {'native': 0, 'bridged': 0, 'oauth': 0, 'oauth_errors': 0}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        path, method = scope['path'], scope['method']
+        if method == 'GET' and path == '/api/canteen/menu' and any(
+                param in parse_qs(scope['query_string'].decode('latin-1')) for param in storefront.MENU_QUERY_PARAMS):
+            return await self.menu_page(scope, receive, send)
+        if method == 'GET' and path.startswith('/authorize/'):
+            return await self.authorize(scope, receive, send, path[len('/authorize/'):])
+        return await self.bridge(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        if aiomysql is None or httpx is None:
+            raise RuntimeError("The async serving mode needs the aiomysql and httpx packages.")
+        config = self.app.config
+        self.db = await aiomysql.create_pool(
+            host=config['DB_HOST'], user=config['DB_USER'], password=config['DB_PASSWORD'], db=config['DB_NAME'],
+            minsize=1, maxsize=config['ASYNC_DB_POOL_SIZE'], autocommit=True, pool_recycle=config['DB_POOL_RECYCLE'],
+        )
+        limits = httpx.Limits(max_connections=config['OAUTH_HTTP_CONNECTIONS'])
+        self.http = httpx.AsyncClient(timeout=config['OAUTH_HTTP_TIMEOUT'], limits=limits)
+        # The asset build and the catalog load are sync; do them once up front.
+        await self.run_sync(self.warm)
+
+    def warm(self):
+        storefront.create_app()
+        storefront.db_pool.warm(self.app.config['DB_POOL_WARM'])
+
+    async def shutdown(self):
+        if self.db is not None:
+            self.db.close()
+            await self.db.wait_closed()
+        if self.http is not None:
+            await self.http.aclose()
+        self.threads.shutdown(wait=False)
+
+    async def run_sync(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.threads, fn, *args)
+
+    async def bridge(self, scope, receive, send):
+        self.stats['bridged'] += 1
+        environ = build_environ(scope, await read_body(receive))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        iterable = await self.run_sync(self.app.wsgi_app, environ, start_response)
+        chunks = iter(iterable)
+        done = object()
+        await send({'type': 'http.response.start', 'status': started['status'],
+                    'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in started['headers']]})
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        pull = None
+        try:
+            # Pull chunks on the pool so streaming responses (SSE, the menu
+            # export) keep working; each open stream holds one thread until
+            # it ends or the client goes away.
+            while True:
+                pull = asyncio.ensure_future(self.run_sync(next, chunks, done))
+                await asyncio.wait({pull, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not pull.done():
+                    break
+                chunk = pull.result()
+                if chunk is done:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            disconnected.cancel()
+            if pull is not None and not pull.done():
+                # A generator can't be closed while next() runs in it; an SSE
+                # stream returns within one SSE_HEARTBEAT.
+                await asyncio.wait({pull})
+            if hasattr(iterable, 'close'):
+                await self.run_sync(iterable.close)
+
+    async def wait_for_disconnect(self, receive):
+        # The request body has been read, so the next message is the client
+        # going away (or, for a finished response, never comes).
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    def admit(self, environ, policies):
+        if not self.app.config['RATE_LIMIT_ENABLED']:
+            return None
+        ip = environ['REMOTE_ADDR'] or 'unknown'
+        for policy in ('global_ip',) + policies:
+            allowed, retry = storefront.rate_limiter.take(policy, ip)
+            if not allowed:
+                return max(int(retry + 0.999), 1)
+        return None
+
+    async def menu_page(self, scope, receive, send):
+        self.stats['native'] += 1
+        started = time.perf_counter()
+        # A request context, not just an app context: url_for in the srcsets
+        # needs the request's host when SERVER_NAME is unset.
+        environ = client_environ(scope, b'')
+        # Local buckets are a dict lookup; only a Redis round trip needs a thread.
+        if storefront.rate_limiter.stats()['backend'] == 'redis':
+            retry_after = await self.run_sync(self.admit, environ, ('menu_ip',))
+        else:
+            retry_after = self.admit(environ, ('menu_ip',))
+        with self.app.request_context(environ):
+            if retry_after:
+                body = self.app.json.dumps({'success': False, 'message': "Too many requests. Please try again later."})
+                return await send_response(send, 429, [('Content-Type', 'application/json'), ('Retry-After', str(retry_after))],
+                                           body.encode('utf-8'))
+            args = {k: v[0] for k, v in parse_qs(scope['query_string'].decode('utf-8')).items()}
+            try:
+                query, params, limit, fields = storefront.menu_page_query(args)
+            except (ValueError, TypeError) as e:
+                body = self.app.json.dumps({'error': f"Invalid query: {e}"})
+                return await send_response(send, 400, [('Content-Type', 'application/json')], body.encode('utf-8'))
+        try:
+            async with self.db.acquire() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute(query, params)
+                    rows = await cur.fetchall()
+        except aiomysql.Error as e:
+            with self.app.request_context(environ):
+                body = self.app.json.dumps({'error': str(e)})
+            return await send_response(send, 500, [('Content-Type', 'application/json')], body.encode('utf-8'))
+        with self.app.request_context(environ):
+            body = self.app.json.dumps(storefront.menu_page_result(list(rows), limit, fields)).encode('utf-8')
+        elapsed = (time.perf_counter() - started) * 1000
+        await send_response(send, 200, [('Content-Type', 'application/json'),
+                                        ('Server-Timing', f'app;dur={elapsed:.2f}')], body)
+
+    def in_request(self, environ, fn):
+        # Runs Flask code (session, flash, url_for) for a request that is
+        # otherwise handled on the event loop, and returns the finished response.
+        with self.app.request_context(environ):
+            rv = fn()
+            if isinstance(rv, tuple) and rv and rv[0] == 'continue':
+                return rv
+            response = self.app.process_response(self.app.make_response(rv))
+            return ('response', response.status_code, response.headers.to_wsgi_list(), response.get_data())
+
+    async def authorize(self, scope, receive, send, provider):
+        if provider not in storefront.OAUTH_PROVIDERS:
+            return await self.bridge(scope, receive, send)
+        self.stats['oauth'] += 1
+        environ = client_environ(scope, await read_body(receive))
+        query = parse_qs(environ['QUERY_STRING'])
+        state, code = query.get('state', [None])[0], query.get('code', [None])[0]
+        client = storefront.oauth_client(provider)
+
+        def check_state():
+            rv = self.app.preprocess_request()
+            if rv is not None:
+                return rv
+            data = client.framework.get_state_data(session, state) if state else None
+            if not data or not code:
+                return fail("Invalid or expired login attempt.")
+            return ('continue', data.get('redirect_uri'))
+
+        def fail(message):
+            flash(message, "danger")
+            return redirect(url_for('landing_page'))
+
+        result = await self.run_sync(self.in_request, environ, check_state)
+        if result[0] == 'continue':
+            redirect_uri = result[1]
+            try:
+                user_info = await self.fetch_user_info(provider, code, redirect_uri)
+                finish = lambda: (client.framework.clear_state_data(session, state),
+                                  storefront.finish_social_login(provider, user_info))[1]
+            except Exception as e:
+                self.stats['oauth_errors'] += 1
+                print(f"OAuth Error with {provider}: {e}")
+                finish = lambda: fail(f"An error occurred during authentication with {provider.capitalize()}. Please try again.")
+            result = await self.run_sync(self.in_request, environ, finish)
+        _, status, headers, body = result
+        await send_response(send, status, headers, body)
+
+    async def fetch_user_info(self, provider, code, redirect_uri):
+        settings = storefront.OAUTH_PROVIDERS[provider]
+        config = self.app.config
+        # One shared client, so logins reuse pooled keep-alive connections.
+        response = await self.http.post(settings['access_token_url'], data={
+            'grant_type': 'authorization_code',
+            'code': code,
+            'redirect_uri': redirect_uri,
+            'client_id': config[f'{provider.upper()}_CLIENT_ID'],
+            'client_secret': config[f'{provider.upper()}_CLIENT_SECRET'],
+        }, headers={'Accept': 'application/json'})
+        response.raise_for_status()
+        token = response.json()
+        response = await self.http.get(settings['userinfo_endpoint'],
+                                       headers={'Authorization': f"Bearer {token['access_token']}"})
+        response.raise_for_status()
+        return response.json()
+
+
+application = AsyncStorefront(flask_app)
@@ -0,0 +1,349 @@
+import argparse
+import json
+import os
+import random
+import re
+import secrets
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# The app reads its settings at import time, so point it at the benchmark
+# database (and keep background workers quiet) before importing it. DB_NAME
+# is always overridden: seeding truncates tables, and an inherited DB_NAME
+# from a shell or .env would otherwise be the live database.
+APP_DB_NAME = os.environ.get('DB_NAME', 'lumoradb')
+os.environ['DB_NAME'] = os.environ.get('BENCH_DB_NAME', 'lumoradb_bench')
+os.environ.setdefault('ORDER_WORKER_MODE', 'off')
+# Every simulated client shares one test-client address, so the limiter would
+# measure itself; set RATE_LIMIT_ENABLED=1 to include it anyway.
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import mysql.connector
+
+import app as storefront
+
+BASE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS profile (
+        user_id INT AUTO_INCREMENT PRIMARY KEY,
+        username VARCHAR(100) NOT NULL,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        password VARCHAR(255) NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_details (
+        profile_id INT PRIMARY KEY,
+        name VARCHAR(100),
+        contact VARCHAR(20),
+        dob DATE NULL,
+        address_line1 VARCHAR(255),
+        city VARCHAR(100),
+        state VARCHAR(100),
+        pincode VARCHAR(10),
+        profile_picture_url VARCHAR(255)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        product_id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        category VARCHAR(50) NOT NULL,
+        type VARCHAR(10) NOT NULL DEFAULT 'veg',
+        description TEXT,
+        price DECIMAL(10, 2) NOT NULL,
+        image VARCHAR(255),
+        stock INT NOT NULL DEFAULT 0,
+        badge VARCHAR(50) NULL,
+        rating DECIMAL(2, 1) NULL,
+        reviews INT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cart_items (
+        user_id INT NOT NULL,
+        product_id INT NOT NULL,
+        quantity INT NOT NULL,
+        PRIMARY KEY (user_id, product_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        total_amount DECIMAL(10, 2) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        tracking_number VARCHAR(32),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_items (
+        order_item_id INT AUTO_INCREMENT PRIMARY KEY,
+        order_id INT NOT NULL,
+        product_id INT NOT NULL,
+        quantity INT NOT NULL,
+        price DECIMAL(10, 2) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS contact_submissions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        name VARCHAR(100),
+        email VARCHAR(255),
+        message TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+SEED_TABLES = ['order_items', 'orders', 'cart_items', 'user_details', 'profile', 'products']
+CATEGORIES = ['mains', 'appetizers', 'desserts', 'beverages']
+INSERT_CHUNK = 1000
+SCENARIOS = ('home', 'menu', 'cart', 'add_to_cart', 'checkout')
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def connect(database=None):
+    config = storefront.app.config
+    return mysql.connector.connect(host=config['DB_HOST'], user=config['DB_USER'],
+                                   password=config['DB_PASSWORD'], database=database)
+
+
+def insert_rows(cur, table, columns, rows):
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    for i in range(0, len(rows), INSERT_CHUNK):
+        chunk = rows[i:i + INSERT_CHUNK]
+        cur.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ', '.join([placeholders] * len(chunk)),
+                    [value for row in chunk for value in row])
+
+
+def seed(args):
+    database = storefront.app.config['DB_NAME']
+    if database == APP_DB_NAME:
+        raise SystemExit(f"Refusing to seed {database!r}: it is the application's database. Set BENCH_DB_NAME to a scratch database.")
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+    conn.close()
+
+    rng = random.Random(args.seed)
+    conn = connect(database)
+    with conn.cursor() as cur:
+        for statement in BASE_SCHEMA:
+            cur.execute(statement)
+        cur.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in SEED_TABLES:
+            cur.execute(f"TRUNCATE TABLE {table}")
+        cur.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+        insert_rows(cur, 'products', ['name', 'category', 'type', 'description', 'price', 'image', 'stock'], [
+            (f"Item {i:05d}", rng.choice(CATEGORIES), rng.choice(['veg', 'nonveg']), f"Benchmark item {i}",
+             round(rng.uniform(20, 400), 2), f"/static/assets/item-{i % 50}.webp", 10 ** 6)
+            for i in range(1, args.products + 1)
+        ])
+        insert_rows(cur, 'profile', ['username', 'email', 'password'], [
+            (f"bench{i}", f"bench{i}@example.com", None) for i in range(1, args.users + 1)
+        ])
+        insert_rows(cur, 'user_details', ['profile_id', 'name', 'contact', 'address_line1', 'city', 'state', 'pincode'], [
+            (i, f"bench{i}", f"9{i:09d}", "1 Bench Street", "Hyderabad", "Telangana", "500001")
+            for i in range(1, args.users + 1)
+        ])
+        insert_rows(cur, 'cart_items', ['user_id', 'product_id', 'quantity'], [
+            (user_id, product_id, rng.randint(1, 3))
+            for user_id in range(1, args.users + 1)
+            for product_id in rng.sample(range(1, args.products + 1), min(args.cart_items, args.products))
+        ])
+        now = datetime.now()
+        insert_rows(cur, 'orders', ['user_id', 'total_amount', 'status', 'tracking_number', 'created_at'], [
+            (rng.randint(1, args.users), round(rng.uniform(50, 1500), 2), 'Completed',
+             f"BENCH{i:08d}", now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)))
+            for i in range(1, args.orders + 1)
+        ])
+        insert_rows(cur, 'order_items', ['order_id', 'product_id', 'quantity', 'price'], [
+            (order_id, rng.randint(1, args.products), rng.randint(1, 3), round(rng.uniform(20, 400), 2))
+            for order_id in range(1, args.orders + 1)
+            for _ in range(rng.randint(1, 4))
+        ])
+    conn.commit()
+    conn.close()
+    storefront.ensure_schema()
+    storefront.catalog.invalidate()
+
+
+def db_questions(conn):
+    with conn.cursor() as cur:
+        cur.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        return int(cur.fetchone()[1])
+
+
+def make_client(user_id):
+    client = storefront.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['username'] = f"bench{user_id}"
+        sess['profile_pic_url'] = 'uploads/profile_pics/default-avatar.png'
+    return client
+
+
+def run_request(client, scenario, product_id):
+    if scenario == 'home':
+        return client.get('/home')
+    if scenario == 'menu':
+        return client.get('/api/canteen/menu', headers={'Accept-Encoding': 'gzip'})
+    if scenario == 'cart':
+        return client.get('/cart')
+    if scenario == 'add_to_cart':
+        return client.post(f'/add-to-cart/{product_id}', data={'quantity': 1})
+    if scenario == 'checkout':
+        return client.post('/checkout', data={'idempotency_key': secrets.token_urlsafe(16)})
+    raise ValueError(scenario)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_scenario(scenario, concurrency, total_requests, args, stats_conn):
+    rng = random.Random(args.seed)
+    clients = [make_client(rng.randint(1, args.users)) for _ in range(concurrency)]
+    product_ids = [rng.randint(1, args.products) for _ in range(total_requests)]
+    latencies = []
+    query_counts = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(index):
+        nonlocal errors
+        client = clients[index % concurrency]
+        if scenario == 'checkout':
+            # Give every checkout something to buy; this setup is not timed.
+            client.post(f'/add-to-cart/{product_ids[index]}', data={'quantity': 1})
+        started = time.perf_counter()
+        response = run_request(client, scenario, product_ids[index])
+        elapsed = (time.perf_counter() - started) * 1000
+        timing = SERVER_TIMING_QUERIES.findall(response.headers.get('Server-Timing', ''))
+        with lock:
+            latencies.append(elapsed)
+            if timing:
+                query_counts.append(int(timing[-1]))
+            if response.status_code >= 400:
+                errors += 1
+
+    for i in range(min(args.warmup, total_requests)):
+        worker(i)
+    latencies.clear()
+    query_counts.clear()
+    errors = 0
+
+    questions_before = db_questions(stats_conn)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(total_requests)))
+    duration = time.perf_counter() - started
+    # Server-side statement count, including pool pings and the untimed
+    # checkout setup requests; the status query itself is subtracted.
+    questions = db_questions(stats_conn) - questions_before - 1
+    requests_made = total_requests * (2 if scenario == 'checkout' else 1)
+
+    latencies.sort()
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'errors': errors,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(total_requests / duration, 2) if duration else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0.0,
+        },
+        'db_queries_per_request': round(sum(query_counts) / len(query_counts), 2) if query_counts else None,
+        'db_statements_per_request': round(questions / requests_made, 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r['scenario'], r['concurrency']): r for r in json.load(f)['results']}
+    for result in results:
+        base = baseline.get((result['scenario'], result['concurrency']))
+        if not base:
+            continue
+        p95_change = result['latency_ms']['p95'] - base['latency_ms']['p95']
+        rps_change = result['throughput_rps'] - base['throughput_rps']
+        print(f"{result['scenario']:>12} c={result['concurrency']:<3} "
+              f"p95 {p95_change:+.2f} ms  throughput {rps_change:+.1f} rps  "
+              f"queries/req {base['db_queries_per_request']} -> {result['db_queries_per_request']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the storefront hot paths against a local database.")
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--cart-items', type=int, default=3, help="cart lines seeded per user")
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32', help="comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=500, help="requests per scenario and concurrency level")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-seed', action='store_true', help="reuse the data from a previous run")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help="baseline results file to diff against")
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        seed(args)
+
+    stats_conn = connect(storefront.app.config['DB_NAME'])
+    results = []
+    for scenario in args.scenarios.split(','):
+        for concurrency in (int(c) for c in args.concurrency.split(',')):
+            result = run_scenario(scenario, concurrency, args.requests, args, stats_conn)
+            results.append(result)
+            latency = result['latency_ms']
+            print(f"{scenario:>12} c={concurrency:<3} {result['throughput_rps']:>9.1f} rps  "
+                  f"p50 {latency['p50']:.2f}  p95 {latency['p95']:.2f}  p99 {latency['p99']:.2f} ms  "
+                  f"{result['db_queries_per_request']} queries/req  {result['errors']} errors")
+    stats_conn.close()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'database': storefront.app.config['DB_NAME'],
+            'products': args.products,
+            'users': args.users,
+            'cart_items': args.cart_items,
+            'orders': args.orders,
+            'requests': args.requests,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import multiprocessing
+import os
+
+# flask --app app migrate   (once per deploy; schema changes never run on requests)
+# gunicorn -c gunicorn.conf.py
+wsgi_app = 'app:create_app()'
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# gthread workers hold one thread per open SSE stream (order pages, kitchen
+# screens) for up to SSE_MAX_LIFETIME. Raise GUNICORN_THREADS to cover the
+# expected number of open streams, or serve them from the ASGI app (asgi.py).
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Load and warm the app once in the master; workers fork with the catalog,
+# search index and compiled templates already in memory.
+preload_app = True
+
+
+def pre_fork(server, worker):
+    from app import db_pool, replica_router
+    # Connections opened during warm-up must not be shared with children.
+    db_pool.dispose()
+    replica_router.dispose()
+
+
+def post_fork(server, worker):
+    from app import app, db_pool, replica_router
+    opened = db_pool.warm(app.config['DB_POOL_WARM']) + replica_router.warm(app.config['DB_POOL_WARM'])
+    server.log.info(f"Worker {worker.pid}: {opened} database connections ready")
+
+
+def on_starting(server):
+    # Without Redis the rate limiter keeps its buckets per worker process, so
+    # every limit is effectively multiplied by the worker count.
+    limited = os.environ.get('RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    if limited and workers > 1 and not os.environ.get('REDIS_URL'):
+        server.log.warning(f"Rate limits are per worker without REDIS_URL; {workers} workers allow up to "
+                           f"{workers}x each configured limit.")
@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+import benchmark
+
+MODES = {
+    'sync': [sys.executable, '-c', "import app; app.create_app().run(host='127.0.0.1', port=5000, threaded=True)"],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:application', '--host', '127.0.0.1', '--port', '5000',
+             '--log-level', 'warning'],
+}
+SCENARIOS = ('oauth', 'menu_page')
+BASE_URL = 'http://127.0.0.1:5000'
+
+
+class StubProvider(BaseHTTPRequestHandler):
+    # A stand-in identity provider with a fixed response delay, so the
+    # benchmark measures how each mode copes with slow upstream I/O.
+    latency = 0.2
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, payload):
+        time.sleep(self.latency)
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+        self.reply({'access_token': form.get('code', ['anonymous'])[0], 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        user = self.headers.get('Authorization', '').split(' ', 1)[-1]
+        self.reply({'email': f'{user}@bench.local', 'name': user, 'picture': None})
+
+
+def start_provider(port, latency):
+    StubProvider.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubProvider)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_server(mode, provider_url):
+    env = dict(os.environ,
+               GOOGLE_AUTHORIZE_URL=f'{provider_url}/authorize',
+               GOOGLE_TOKEN_URL=f'{provider_url}/token',
+               GOOGLE_USERINFO_URL=f'{provider_url}/userinfo')
+    process = subprocess.Popen(MODES[mode], env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f'{BASE_URL}/api/canteen/menu?limit=1', timeout=1)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"The {mode} server did not start within 30 seconds.")
+
+
+async def oauth_login(client, index, users):
+    client.cookies.clear()
+    response = await client.get('/login/google')
+    state = parse_qs(urlsplit(response.headers['location']).query)['state'][0]
+    return await client.get('/authorize/google', params={'code': f'oauth{index % users}', 'state': state})
+
+
+async def run_scenario(scenario, concurrency, total_requests, args):
+    latencies = []
+    errors = 0
+    counter = iter(range(total_requests))
+
+    async def worker():
+        nonlocal errors
+        async with httpx.AsyncClient(base_url=BASE_URL, timeout=60) as client:
+            for index in counter:
+                started = time.perf_counter()
+                try:
+                    if scenario == 'oauth':
+                        response = await oauth_login(client, index, args.users)
+                        # A successful login redirects to the home page.
+                        failed = response.status_code != 302 or '/home' not in response.headers.get('location', '')
+                    else:
+                        response = await client.get('/api/canteen/menu', params={'limit': 20})
+                        failed = response.status_code >= 400
+                except (httpx.HTTPError, KeyError):
+                    failed = True
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'errors': errors,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(total_requests / duration, 2) if duration else 0.0,
+        'latency_ms': {
+            'p50': round(benchmark.percentile(latencies, 50), 3),
+            'p95': round(benchmark.percentile(latencies, 95), 3),
+            'p99': round(benchmark.percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sync (WSGI) and async (ASGI) serving modes under slow OAuth I/O.")
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='8,64,256', help="comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=500, help="requests per scenario and concurrency level")
+    parser.add_argument('--provider-latency', type=float, default=0.2, help="seconds the stub provider takes per call")
+    parser.add_argument('--provider-port', type=int, default=5055)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--cart-items', type=int, default=0)
+    parser.add_argument('--orders', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-seed', action='store_true', help="reuse the data from a previous run")
+    parser.add_argument('--output', default='bench_serve.json')
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        benchmark.seed(args)
+    provider = start_provider(args.provider_port, args.provider_latency)
+
+    results = []
+    for mode in args.modes.split(','):
+        server = start_server(mode, f'http://127.0.0.1:{args.provider_port}')
+        try:
+            for scenario in args.scenarios.split(','):
+                for concurrency in (int(c) for c in args.concurrency.split(',')):
+                    result = {'mode': mode, **asyncio.run(run_scenario(scenario, concurrency, args.requests, args))}
+                    results.append(result)
+                    latency = result['latency_ms']
+                    print(f"{mode:>5} {scenario:>10} c={concurrency:<4} {result['throughput_rps']:>9.1f} rps  "
+                          f"p50 {latency['p50']:.2f}  p95 {latency['p95']:.2f}  p99 {latency['p99']:.2f} ms  "
+                          f"{result['errors']} errors")
+        finally:
+            server.terminate()
+            server.wait()
+    provider.shutdown()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': benchmark.git_revision(),
+            'database': benchmark.storefront.app.config['DB_NAME'],
+            'provider_latency_s': args.provider_latency,
+            'requests': args.requests,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
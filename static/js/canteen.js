@@ -91,7 +91,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 card.setAttribute('aria-label', `${item.name} (${item.type === 'veg' ? 'Vegetarian' : 'Non-Vegetarian'}), Price: ${item.price} INR`);
 
                 card.innerHTML = `
-                    <img src="${item.image}" alt="${item.name}" loading="lazy" class="item-image" />
+                    <img src="${item.image}" ${item.image_srcset ? `srcset="${item.image_srcset}" sizes="(max-width: 576px) 100vw, 320px"` : ''} alt="${item.name}" loading="lazy" class="item-image" />
                     ${item.badge ? `<div class="item-badge">${item.badge}</div>` : ''}
                     <div class="veg-indicator ${item.type === 'veg' ? 'veg' : 'nonveg'}" aria-hidden="true">${item.type === 'veg' ? 'V' : 'NV'}</div>
                     <div class="item-content">
@@ -191,6 +191,17 @@ document.addEventListener('DOMContentLoaded', () => {
         fetchAndRenderMenu();
     }
 
+    // Progress for every status in ORDER_STATUSES (app.py): how many of the
+    // three steps are lit and how far the bar is filled.
+    const ORDER_PROGRESS = {
+        Processing: { steps: 1, percent: 15 },
+        Confirmed: { steps: 1, percent: 33 },
+        Preparing: { steps: 2, percent: 66 },
+        Ready: { steps: 3, percent: 100 },
+        Completed: { steps: 3, percent: 100 },
+        Cancelled: { steps: 0, percent: 0 },
+    };
+
     function initOrdersPage() {
         const ordersContainer = document.getElementById('ordersContainer');
         if (!ordersContainer) return;
@@ -218,25 +229,13 @@ document.addEventListener('DOMContentLoaded', () => {
                 card.className = 'order-card';
 
                 // Map backend status to client-side progress and step activation
-                let progressPercent = 0;
-                let statusConfirmed = '';
-                let statusCrafting = '';
-                let statusReady = '';
-
-                // Assuming 'Processing' is the initial status from the backend
-                if (order.status === 'Processing') {
-                    progressPercent = 33;
-                    statusConfirmed = 'active';
-                }
-                // If the backend had more statuses (e.g., 'Preparing', 'Out for Delivery', 'Delivered'),
-                // you would add more conditions here to activate subsequent steps.
-                // Example:
-                // else if (order.status === 'Preparing') { /* ... */ }
-                // else if (order.status === 'Out for Delivery' || order.status === 'Delivered') { /* ... */ }
+                const progress = ORDER_PROGRESS[order.status] || ORDER_PROGRESS.Processing;
+                const progressPercent = progress.percent;
+                const [statusConfirmed, statusCrafting, statusReady] = [1, 2, 3].map(step => progress.steps >= step ? 'active' : '');
 
                 card.innerHTML = `
                     <div class="order-header">
-                        <span>Order #${order.order_id}</span>
+                        <span>Order #${order.order_id}${order.status === 'Cancelled' ? ' (Cancelled)' : ''}</span>
                         <span>${new Date(order.created_at).toLocaleString()}</span>
                     </div>
                     <div class="progress-container" aria-label="Order progress">
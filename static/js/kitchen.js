@@ -0,0 +1,70 @@
+document.addEventListener('DOMContentLoaded', () => {
+    const ordersBody = document.getElementById('kitchen-orders');
+    if (!ordersBody) return;
+
+    const connectionLabel = document.getElementById('kitchen-connection');
+    const statuses = ordersBody.dataset.statuses.split(',');
+    const closedStatuses = ['Completed', 'Cancelled'];
+    const orders = new Map();
+
+    function statusUrl(orderId) {
+        return ordersBody.dataset.statusUrl.replace(/\/0\/status$/, `/${orderId}/status`);
+    }
+
+    function renderOrders() {
+        ordersBody.innerHTML = '';
+        [...orders.values()]
+            .sort((a, b) => a.order_id - b.order_id)
+            .forEach(order => {
+                const row = document.createElement('tr');
+                // Ticket text is built from product names, so never parse it as HTML.
+                const idCell = row.insertCell();
+                idCell.textContent = `#${order.order_id}`;
+                const ticketCell = row.insertCell();
+                ticketCell.style.whiteSpace = 'pre-line';
+                ticketCell.textContent = order.ticket || '';
+                const select = document.createElement('select');
+                select.className = 'form-select form-select-sm';
+                select.dataset.orderId = order.order_id;
+                statuses.forEach(status => {
+                    select.add(new Option(status, status, false, status === order.status));
+                });
+                row.insertCell().appendChild(select);
+                ordersBody.appendChild(row);
+            });
+
+        ordersBody.querySelectorAll('select').forEach(select => {
+            select.onchange = async () => {
+                const response = await fetch(statusUrl(select.dataset.orderId), {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ status: select.value }),
+                });
+                if (!response.ok && window.showAlert) {
+                    window.showAlert('Could not update order status.', 'danger');
+                }
+            };
+        });
+    }
+
+    function handleEvent(e) {
+        const event = JSON.parse(e.data);
+        if (closedStatuses.includes(event.status)) {
+            orders.delete(event.order_id);
+        } else {
+            orders.set(event.order_id, { ...orders.get(event.order_id), ...event });
+        }
+        renderOrders();
+    }
+
+    const source = new EventSource(ordersBody.dataset.streamUrl);
+    source.onopen = () => {
+        orders.clear();
+        connectionLabel.textContent = 'Live';
+    };
+    source.onerror = () => {
+        connectionLabel.textContent = 'Reconnecting...';
+    };
+    source.addEventListener('order.placed', handleEvent);
+    source.addEventListener('order.status', handleEvent);
+});
@@ -132,13 +132,16 @@ window.addEventListener('load', () => {
         const filterButtons = controls.querySelectorAll('.filter-btn');
         const sortSelect = document.getElementById('sort-by');
         const productGrid = document.querySelector('.product-grid-3');
+        const searchInput = document.getElementById('menu-search');
         let productItems = Array.from(productGrid.querySelectorAll('.product-item'));
+        let searchRanks = null; // product id -> rank while a search is active
 
         const updateGrid = () => {
             const activeFilter = document.querySelector('.filter-btn.active').dataset.filter;
             productItems.forEach(item => {
                 const itemCategory = item.dataset.category;
-                const isVisible = (activeFilter === 'all' || itemCategory === activeFilter);
+                const isVisible = (activeFilter === 'all' || itemCategory === activeFilter)
+                    && (!searchRanks || searchRanks.has(item.dataset.id));
                 item.classList.toggle('hide', !isVisible);
             });
 
@@ -157,6 +160,8 @@ window.addEventListener('load', () => {
                         return valA.localeCompare(valB) * direction;
                     }
                 });
+            } else if (searchRanks) {
+                visibleItems.sort((a, b) => searchRanks.get(a.dataset.id) - searchRanks.get(b.dataset.id));
             } else {
                 visibleItems.sort((a, b) => {
                     return productItems.indexOf(a) - productItems.indexOf(b);
@@ -176,6 +181,33 @@ window.addEventListener('load', () => {
 
         sortSelect.addEventListener('change', updateGrid);
 
+        if (searchInput) {
+            let searchTimer = null;
+            let searchController = null;
+            searchInput.addEventListener('input', () => {
+                clearTimeout(searchTimer);
+                searchTimer = setTimeout(async () => {
+                    const query = searchInput.value.trim();
+                    if (searchController) searchController.abort();
+                    if (!query) {
+                        searchRanks = null;
+                        updateGrid();
+                        return;
+                    }
+                    searchController = new AbortController();
+                    try {
+                        const response = await fetch(`/api/canteen/search?limit=100&q=${encodeURIComponent(query)}`, { signal: searchController.signal });
+                        if (!response.ok) return;
+                        const data = await response.json();
+                        searchRanks = new Map(data.items.map((item, index) => [String(item.id), index]));
+                        updateGrid();
+                    } catch (error) {
+                        if (error.name !== 'AbortError') console.error('Menu search failed:', error);
+                    }
+                }, 200);
+            });
+        }
+
         productGrid.addEventListener('click', (e) => {
             const card = e.target.closest('.clickable-card');
             if (!card) return;
@@ -530,7 +562,10 @@ window.addEventListener('load', () => {
                                 showAlert(data.message, 'success');
                                 const headerProfilePic = document.querySelector('.desktop-sidebar .profile-img');
                                 if (headerProfilePic) {
-                                    headerProfilePic.src = data.new_url;
+                                    // Resized variants are generated in the background, so
+                                    // reuse the local preview until the next page load.
+                                    headerProfilePic.removeAttribute('srcset');
+                                    headerProfilePic.src = picturePreview.src;
                                 }
                             } else {
                                 showAlert(data.message || 'Upload failed.', 'danger');
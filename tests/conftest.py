@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+# app.py reads its settings at import time: point it at a throwaway database
+# and keep background workers, the limiter and Redis out of the way.
+os.environ['DB_NAME'] = os.environ.get('TEST_DB_NAME', 'lumoradb_test')
+os.environ['ORDER_WORKER_MODE'] = 'off'
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+os.environ['ASSET_PIPELINE'] = '0'
+os.environ['WARM_UP'] = '0'
+os.environ['SESSION_BACKEND'] = 'kv'
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+for name in ('REDIS_URL', 'DB_REPLICAS'):
+    os.environ.pop(name, None)
+
+import mysql.connector
+
+import app as storefront
+import benchmark
+
+TRUNCATE_SKIP = {'catalog_version'}
+
+
+def connect(database=None):
+    config = storefront.app.config
+    return mysql.connector.connect(host=config['DB_HOST'], user=config['DB_USER'], password=config['DB_PASSWORD'],
+                                   database=database, connection_timeout=2)
+
+
+@pytest.fixture(scope='session')
+def database():
+    # Integration tests need a MySQL server reachable with the DB_* settings;
+    # the database itself is recreated from scratch for every run.
+    name = storefront.app.config['DB_NAME']
+    try:
+        conn = connect()
+    except mysql.connector.Error as e:
+        pytest.skip(f"MySQL is not reachable: {e}")
+    with conn.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS `{name}`")
+        cur.execute(f"CREATE DATABASE `{name}`")
+        cur.execute(f"USE `{name}`")
+        for statement in benchmark.BASE_SCHEMA:
+            cur.execute(statement)
+    conn.commit()
+    conn.close()
+    storefront.db_pool.dispose()
+    storefront._schema_ready = False
+    storefront.ensure_schema()
+    return name
+
+
+@pytest.fixture
+def db(database):
+    conn = connect(database)
+    with conn.cursor() as cur:
+        cur.execute("SHOW TABLES")
+        tables = [row[0] for row in cur.fetchall()]
+        cur.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for table in tables:
+            if table not in TRUNCATE_SKIP:
+                cur.execute(f"TRUNCATE TABLE `{table}`")
+        cur.execute("SET FOREIGN_KEY_CHECKS = 1")
+    conn.commit()
+    storefront.catalog.invalidate()
+    storefront.order_cache.clear()
+    storefront.fragment_cache.clear()
+    storefront.kv_store._data.clear()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def client():
+    return storefront.app.test_client()
+
+
+def add_product(conn, name, category='mains', price=100, stock=10, product_type='veg'):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO products (name, category, type, description, price, image, stock) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                    (name, category, product_type, f"{name} description", price, None, stock))
+        product_id = cur.lastrowid
+    conn.commit()
+    return product_id
+
+
+def add_user(conn, username='alice', email=None):
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO profile (username, email) VALUES (%s, %s)", (username, email or f"{username}@example.com"))
+        user_id = cur.lastrowid
+        cur.execute("INSERT INTO user_details (profile_id, name) VALUES (%s, %s)", (user_id, username))
+    conn.commit()
+    return user_id
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import threading
+import time
+import types
+
+import pytest
+from flask import Flask, Response
+
+import app as storefront
+import asgi
+
+
+@pytest.fixture
+def stream_app():
+    flask_app = Flask('stream-test')
+    flask_app.config['ASYNC_WSGI_THREADS'] = 4
+    flask_app.config['RATE_LIMIT_ENABLED'] = False
+    flask_app.closed = threading.Event()
+
+    @flask_app.route('/ticks')
+    def ticks():
+        def generate():
+            try:
+                while True:
+                    yield 'tick\n'
+                    time.sleep(0.01)
+            finally:
+                flask_app.closed.set()
+        return Response(generate())
+
+    @flask_app.route('/events')
+    def events():
+        return storefront.sse_response(['asgi-test'])
+
+    @flask_app.route('/plain')
+    def plain():
+        return 'hello'
+
+    application = asgi.AsyncStorefront(flask_app)
+    yield application
+    application.threads.shutdown(wait=True)
+
+
+def scope(path):
+    return {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': [],
+            'root_path': '', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)}
+
+
+async def drive(application, path, drop_after=None):
+    messages = asyncio.Queue()
+    messages.put_nowait({'type': 'http.request', 'body': b'', 'more_body': False})
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        chunks = [m for m in sent if m.get('more_body')]
+        if drop_after is not None and len(chunks) == drop_after:
+            messages.put_nowait({'type': 'http.disconnect'})
+
+    await asyncio.wait_for(application(scope(path), messages.get, send), timeout=5)
+    return sent
+
+
+def test_dropped_stream_is_closed(stream_app):
+    sent = asyncio.run(drive(stream_app, '/ticks', drop_after=3))
+    assert sent[0]['status'] == 200
+    assert stream_app.app.closed.wait(1)
+
+
+def test_dropped_event_stream_unsubscribes(stream_app, monkeypatch):
+    monkeypatch.setitem(storefront.app.config, 'SSE_HEARTBEAT', 0.05)
+    before = storefront.broker.stats()['subscribers']
+    sent = asyncio.run(drive(stream_app, '/events', drop_after=2))
+    assert sent[1]['body'] == b'retry: 3000\n\n'
+    assert storefront.broker.stats()['subscribers'] == before
+
+
+def test_finished_response_ends_the_body(stream_app):
+    sent = asyncio.run(drive(stream_app, '/plain'))
+    assert [m.get('body') for m in sent[1:]] == [b'hello', b'']
+
+
+class FakeDB:
+    # Stands in for the aiomysql pool, connection and cursor at once.
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def acquire(self):
+        return self
+
+    def cursor(self, cursor_class=None):
+        return self
+
+    async def execute(self, query, params=None):
+        pass
+
+    async def fetchall(self):
+        return self.rows
+
+
+def test_native_menu_page_builds_srcsets_without_server_name(monkeypatch):
+    monkeypatch.setattr(asgi, 'aiomysql', types.SimpleNamespace(DictCursor=object, Error=Exception))
+    monkeypatch.setitem(storefront.app.config, 'SERVER_NAME', None)
+    monkeypatch.setattr(storefront.images, 'variants', lambda url: [('uploads/images/dal-96.webp', 96)])
+    application = asgi.AsyncStorefront(storefront.app)
+    application.db = FakeDB([{'product_id': 1, 'name': 'Dal', 'image': '/static/uploads/images/dal.png'}])
+    menu_scope = {**scope('/api/canteen/menu'), 'query_string': b'limit=5'}
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    try:
+        asyncio.run(asyncio.wait_for(application(menu_scope, receive, send), timeout=5))
+    finally:
+        application.threads.shutdown(wait=True)
+    assert sent[0]['status'] == 200
+    item = json.loads(sent[1]['body'])['items'][0]
+    assert item['image_srcset'] == '/static/uploads/images/dal-96.webp 96w'
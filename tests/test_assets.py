@@ -0,0 +1,35 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import app as storefront
+
+SCRIPTS = sorted({src for sources in storefront.StaticAssets.BUNDLES.values() for src in sources if src.endswith('.js')} |
+                 {src for src in storefront.StaticAssets.SOURCES if src.endswith('.js')})
+
+
+def literals(source):
+    return [source[start:end] for start, end in storefront.js_literals(source)]
+
+
+def test_minify_keeps_template_literal_and_string_content():
+    source = ("const row = `\n    <td>${name}</td>\n    // not a comment\n`;\n"
+              "  // a comment\n  const re = /[\"'/]+/g; // don't\n  const s = 'it\\'s';\n  x = a / 2 / b;\n")
+    assert storefront.minify_js(source) == (
+        "const row = `\n    <td>${name}</td>\n    // not a comment\n`;\n"
+        "const re = /[\"'/]+/g; // don't\nconst s = 'it\\'s';\nx = a / 2 / b;")
+
+
+@pytest.mark.parametrize('name', SCRIPTS)
+def test_shipped_scripts_survive_minification(name, tmp_path):
+    with open(os.path.join(storefront.app.static_folder, name), encoding='utf-8') as f:
+        source = f.read()
+    minified = storefront.minify_js(source)
+    assert literals(minified) == literals(source)
+    if shutil.which('node'):
+        path = tmp_path / os.path.basename(name)
+        path.write_text(minified, encoding='utf-8')
+        result = subprocess.run(['node', '--check', str(path)], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
@@ -0,0 +1,20 @@
+import argparse
+import os
+
+import pytest
+
+import app as storefront
+import benchmark
+
+
+def test_benchmark_always_targets_its_own_database():
+    assert os.environ['DB_NAME'] == os.environ.get('BENCH_DB_NAME', 'lumoradb_bench')
+
+
+def test_seed_refuses_the_applications_database():
+    # conftest imported the app first, so the app is bound to the database
+    # DB_NAME named before benchmark.py overrode it.
+    assert storefront.app.config['DB_NAME'] == benchmark.APP_DB_NAME
+    args = argparse.Namespace(products=1, users=1, cart_items=0, orders=0, seed=1)
+    with pytest.raises(SystemExit, match="Refusing to seed"):
+        benchmark.seed(args)
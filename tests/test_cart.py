@@ -0,0 +1,63 @@
+from decimal import Decimal
+
+import app as storefront
+from conftest import add_product, add_user
+
+
+def test_local_cart_counts_expire_quickly(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(storefront.time, 'monotonic', lambda: now[0])
+    monkeypatch.setitem(storefront.app.config, 'CART_COUNT_LOCAL_TTL', 5)
+    storefront.set_cart_count(42, 3)
+    assert storefront.get_cached_cart_count(42) == 3
+    now[0] += 6
+    assert storefront.get_cached_cart_count(42) is None
+
+
+def test_cart_change_forgets_the_count():
+    storefront.set_cart_count(42, 3)
+    storefront.forget_cart_count(42)
+    assert storefront.get_cached_cart_count(42) is None
+
+
+def lines(body):
+    return sorted((item['product_id'], item['quantity'], Decimal(str(item['subtotal']))) for item in body['items'])
+
+
+def test_bulk_update_rejects_a_malformed_body(client):
+    response = client.patch('/api/cart', json={'items': ['not', 'a', 'mapping']})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_bulk_update_applies_every_change_and_returns_totals(db, client):
+    user_id = add_user(db)
+    dal, roti, rice = add_product(db, 'Dal', price=40), add_product(db, 'Roti', price=10), add_product(db, 'Rice', price=60)
+    with db.cursor() as cur:
+        cur.execute("INSERT INTO cart_items (user_id, product_id, quantity) VALUES (%s, %s, 1), (%s, %s, 2)",
+                    (user_id, dal, user_id, rice))
+    db.commit()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    response = client.patch('/api/cart', json={'items': {str(dal): 3, str(roti): 2, str(rice): 0, '999999': 1}})
+    body = response.get_json()
+    assert body['success'] is True
+    assert lines(body) == [(dal, 3, Decimal('120')), (roti, 2, Decimal('20'))]
+    assert Decimal(str(body['total_price'])) == Decimal('140')
+    assert body['item_count'] == 5
+    db.commit()
+    with db.cursor() as cur:
+        cur.execute("SELECT product_id, quantity FROM cart_items WHERE user_id = %s ORDER BY product_id", (user_id,))
+        assert cur.fetchall() == [(dal, 3), (roti, 2)]
+    assert storefront.get_cached_cart_count(user_id) == 5
+
+
+def test_bulk_update_keeps_a_guest_cart_in_the_session(db, client):
+    dal, roti = add_product(db, 'Dal', price=40), add_product(db, 'Roti', price=10)
+    client.patch('/api/cart', json={'items': {str(dal): 2, '999999': 1}})
+    body = client.patch('/api/cart', json={'items': {str(dal): 0, str(roti): 4}}).get_json()
+    assert lines(body) == [(roti, 4, Decimal('40'))]
+    assert body['item_count'] == 4
+    with client.session_transaction() as session:
+        assert session['cart'] == {str(roti): 4}
@@ -0,0 +1,92 @@
+import threading
+
+import app as storefront
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.db.queries.append(query)
+        self.rows = [{'version': self.db.version}] if 'catalog_version' in query else list(self.db.products)
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeDB:
+    replica = None
+
+    def __init__(self, products):
+        self.products = products
+        self.version = 1
+        self.queries = []
+        self.available = True
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def product(product_id, name, stock=5):
+    return {'product_id': product_id, 'name': name, 'category': 'mains', 'stock': stock}
+
+
+def cache_over(monkeypatch, db):
+    monkeypatch.setattr(storefront, 'get_db_connection', lambda **kwargs: db if db.available else None)
+    return storefront.CatalogCache(ttl=300, version_check_interval=5)
+
+
+def test_invalidate_keeps_serving_the_old_copy_until_the_reload(monkeypatch):
+    db = FakeDB([product(1, 'Dosa')])
+    cache = cache_over(monkeypatch, db)
+    assert [p['name'] for p in cache.products()] == ['Dosa']
+    db.available = False
+    cache.invalidate()
+    assert [p['name'] for p in cache.products()] == ['Dosa']
+    assert cache.get_many([1]) == {'1': product(1, 'Dosa')}
+
+    db.available = True
+    db.products, db.version = [product(1, 'Dosa', stock=0), product(2, 'Idli')], 2
+    cache.invalidate()
+    assert cache.get(1)['stock'] == 0
+    assert cache.snapshot()[0] == 2
+
+
+def test_readers_never_see_an_empty_catalog_during_invalidation(monkeypatch):
+    db = FakeDB([product(i, f'Item {i}') for i in range(50)])
+    cache = cache_over(monkeypatch, db)
+    cache.products()
+    missing = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            if cache.products() is None or len(cache.get_many(range(50))) != 50:
+                missing.append(True)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for _ in range(200):
+        cache.invalidate()
+    stop.set()
+    for reader in readers:
+        reader.join()
+    assert not missing
@@ -0,0 +1,81 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+import app as storefront
+from conftest import add_product
+
+
+@pytest.fixture
+def admin(client):
+    with client.session_transaction() as session:
+        session['is_admin'] = True
+    return client
+
+
+def test_valid_row_is_normalized():
+    row, errors = storefront.validate_catalog_row(
+        {'id': '7', 'name': ' Dosa ', 'category': 'mains', 'type': 'VEG', 'price': '40.5', 'stock': '3', 'badge': ''})
+    assert errors == []
+    assert row['product_id'] == 7
+    assert row['name'] == 'Dosa'
+    assert row['type'] == 'veg'
+    assert row['price'] == Decimal('40.50')
+    assert row['stock'] == 3
+    assert row['badge'] is None
+
+
+def test_invalid_row_reports_every_problem():
+    _, errors = storefront.validate_catalog_row(
+        {'product_id': 'x', 'name': '', 'category': 'c' * 51, 'type': 'vegan', 'price': 'free', 'stock': '-1'})
+    assert errors == [
+        "product_id must be an integer",
+        "name is required",
+        "category is longer than 50 characters",
+        "type must be one of veg, nonveg",
+        "price must be a number",
+        "stock must not be negative",
+    ]
+
+
+def test_csv_and_json_bodies_are_read():
+    csv_body = "name,category,price\nDosa,mains,40\nIdli,mains,30\n"
+    with storefront.app.test_request_context(data=csv_body, content_type='text/csv'):
+        assert [row['name'] for row in storefront.read_import_rows()] == ['Dosa', 'Idli']
+    with storefront.app.test_request_context(json={'items': [{'name': 'Dosa'}]}):
+        assert storefront.read_import_rows() == [{'name': 'Dosa'}]
+    with storefront.app.test_request_context(json={'name': 'Dosa'}), pytest.raises(ValueError):
+        storefront.read_import_rows()
+
+
+def test_duplicate_ids_reject_the_whole_import(admin):
+    items = [{'product_id': 1, 'name': 'Dosa', 'category': 'mains', 'price': 40},
+             {'product_id': 1, 'name': 'Idli', 'category': 'mains', 'price': 30}]
+    response = admin.post('/api/admin/canteen/menu/import', json=items)
+    assert response.status_code == 400
+    assert response.get_json()['errors'] == [{'row': 2, 'errors': ["duplicate product_id in import"]}]
+
+
+def test_dry_run_reports_the_diff_without_writing(db, admin):
+    product_id = add_product(db, 'Dosa', price=40)
+    items = [{'product_id': product_id, 'name': 'Dosa', 'category': 'mains', 'price': 45, 'stock': 10},
+             {'name': 'Idli', 'category': 'mains', 'price': 30},
+             {'name': 'Vada', 'category': 'snacks', 'price': 20}]
+    response = admin.post('/api/admin/canteen/menu/import', json=items)
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['dry_run'] is True
+    assert body['summary']['created'] == 2
+    assert body['updated'][0]['changes']['price'] == ['40.00', '45.00']
+    with db.cursor() as cur:
+        cur.execute("SELECT COUNT(*), MAX(price) FROM products")
+        assert cur.fetchone() == (1, Decimal('40.00'))
+
+    response = admin.post('/api/admin/canteen/menu/import?dry_run=0', data=json.dumps(items),
+                          content_type='application/json')
+    assert response.get_json()['success'] is True
+    db.commit()
+    with db.cursor() as cur:
+        cur.execute("SELECT name, price FROM products ORDER BY name")
+        assert cur.fetchall() == [('Dosa', Decimal('45.00')), ('Idli', Decimal('30.00')), ('Vada', Decimal('20.00'))]
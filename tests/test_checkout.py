@@ -0,0 +1,160 @@
+from decimal import Decimal
+
+import pytest
+
+import app as storefront
+from conftest import add_product, add_user
+
+
+def stock(conn, product_id):
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute("SELECT stock FROM products WHERE product_id = %s", (product_id,))
+        return cur.fetchone()[0]
+
+
+def order_count(conn, user_id):
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM orders WHERE user_id = %s", (user_id,))
+        return cur.fetchone()[0]
+
+
+def fill_cart(conn, user_id, lines):
+    with conn.cursor() as cur:
+        for product_id, quantity in lines:
+            cur.execute("INSERT INTO cart_items (user_id, product_id, quantity) VALUES (%s, %s, %s)",
+                        (user_id, product_id, quantity))
+    conn.commit()
+
+
+@pytest.fixture
+def pooled():
+    conns = []
+
+    def acquire():
+        conns.append(storefront.db_pool.acquire())
+        return conns[-1]
+
+    yield acquire
+    for conn in conns:
+        conn.release()
+
+
+def test_checkout_reserves_stock_and_clears_cart(db, pooled):
+    user_id = add_user(db)
+    dal, roti = add_product(db, 'Dal', stock=5), add_product(db, 'Roti', stock=5)
+    fill_cart(db, user_id, [(dal, 2), (roti, 1)])
+
+    order_id, created, timings = storefront.place_order(pooled(), user_id, 'key-1')
+
+    assert created and order_id
+    assert (stock(db, dal), stock(db, roti)) == (3, 4)
+    with db.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM cart_items WHERE user_id = %s", (user_id,))
+        assert cur.fetchone()[0] == 0
+        cur.execute("SELECT kind FROM order_jobs WHERE order_id = %s ORDER BY kind", (order_id,))
+        assert [row[0] for row in cur.fetchall()] == ['order.placed', 'order.rollup']
+    assert timings['attempts'] == 1
+
+
+def test_resubmitting_the_same_key_replays_the_order(db, pooled):
+    user_id = add_user(db)
+    dal = add_product(db, 'Dal', stock=5)
+    fill_cart(db, user_id, [(dal, 2)])
+
+    first, created, _ = storefront.place_order(pooled(), user_id, 'key-1')
+    fill_cart(db, user_id, [(dal, 1)])
+    again, created_again, _ = storefront.place_order(pooled(), user_id, 'key-1')
+
+    assert created and not created_again
+    assert again == first
+    assert order_count(db, user_id) == 1
+    assert stock(db, dal) == 3
+
+
+def test_resubmit_with_an_older_snapshot_still_sees_the_committed_order(db, pooled):
+    user_id = add_user(db)
+    dal = add_product(db, 'Dal', stock=5)
+    fill_cart(db, user_id, [(dal, 1)])
+
+    # The resubmit's connection already read in this transaction (as the
+    # session and catalog loads do), pinning its REPEATABLE READ snapshot.
+    late = pooled()
+    with late.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM checkout_requests")
+        cur.fetchall()
+    first, _, _ = storefront.place_order(pooled(), user_id, 'key-1')
+
+    replayed, created, _ = storefront.place_order(late, user_id, 'key-1')
+    assert (replayed, created) == (first, False)
+
+
+def test_another_users_key_is_not_replayed(db, pooled):
+    alice, bob = add_user(db, 'alice'), add_user(db, 'bob')
+    dal = add_product(db, 'Dal', stock=5)
+    fill_cart(db, alice, [(dal, 1)])
+    fill_cart(db, bob, [(dal, 1)])
+    storefront.place_order(pooled(), alice, 'shared-key')
+
+    with pytest.raises(storefront.CheckoutError):
+        storefront.place_order(pooled(), bob, 'shared-key')
+    assert order_count(db, bob) == 0
+
+
+def test_insufficient_stock_rolls_back_everything(db, pooled):
+    user_id = add_user(db)
+    dal, roti = add_product(db, 'Dal', stock=5), add_product(db, 'Roti', stock=1)
+    fill_cart(db, user_id, [(dal, 1), (roti, 2)])
+
+    with pytest.raises(storefront.CheckoutError, match='Roti'):
+        storefront.place_order(pooled(), user_id, 'key-1')
+    assert (stock(db, dal), stock(db, roti)) == (5, 1)
+    assert order_count(db, user_id) == 0
+    # The key was released with the rollback, so a fixed cart can retry it.
+    with db.cursor() as cur:
+        cur.execute("UPDATE cart_items SET quantity = 1 WHERE user_id = %s", (user_id,))
+    db.commit()
+    assert storefront.place_order(pooled(), user_id, 'key-1')[1]
+
+
+def test_empty_cart_is_rejected(db, pooled):
+    user_id = add_user(db)
+    with pytest.raises(storefront.CheckoutError, match='empty'):
+        storefront.place_order(pooled(), user_id, 'key-1')
+
+
+def test_every_sale_refreshes_the_cached_menu_stock(db, pooled, client):
+    user_id = add_user(db)
+    dal = add_product(db, 'Dal', stock=5)
+    first = client.get('/api/canteen/menu')
+    assert first.get_json()[0]['stock'] == 5
+
+    fill_cart(db, user_id, [(dal, 1)])
+    storefront.place_order(pooled(), user_id, 'key-1')
+
+    again = client.get('/api/canteen/menu', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 200
+    assert again.get_json()[0]['stock'] == 4
+
+
+def test_orders_keep_the_per_user_summary_current(db, pooled):
+    user_id = add_user(db)
+    dal = add_product(db, 'Dal', price=40)
+    fill_cart(db, user_id, [(dal, 2)])
+    storefront.place_order(pooled(), user_id, 'key-1')
+    fill_cart(db, user_id, [(dal, 1)])
+    second, _, _ = storefront.place_order(pooled(), user_id, 'key-2')
+    fill_cart(db, user_id, [(dal, 1)])
+    storefront.place_order(pooled(), user_id, 'key-2')
+
+    def summary():
+        db.commit()
+        with db.cursor() as cur:
+            cur.execute("SELECT order_count, lifetime_spend, last_order_id FROM user_order_summary WHERE user_id = %s", (user_id,))
+            return cur.fetchall()
+
+    assert summary() == [(2, Decimal('120.00'), second)]
+    result = storefront.app.test_cli_runner().invoke(args=['rebuild-order-summaries'])
+    assert result.exit_code == 0, result.output
+    assert summary() == [(2, Decimal('120.00'), second)]
@@ -0,0 +1,66 @@
+import time
+
+import app as storefront
+
+
+def test_stream_ends_after_its_maximum_lifetime(monkeypatch):
+    monkeypatch.setitem(storefront.app.config, 'SSE_MAX_LIFETIME', 0.2)
+    monkeypatch.setitem(storefront.app.config, 'SSE_HEARTBEAT', 0.05)
+    with storefront.app.test_request_context():
+        response = storefront.sse_response(['test-channel'], [{'type': 'order.status', 'order_id': 1}])
+    started = time.monotonic()
+    body = ''.join(response.response)
+    assert time.monotonic() - started < 2
+    assert body.startswith("retry: 3000\n\n")
+    assert "event: order.status" in body
+    assert ": keep-alive" in body
+    assert storefront.broker.stats()['subscribers'] == 0
+
+
+def test_published_events_reach_the_stream():
+    with storefront.app.test_request_context():
+        response = storefront.sse_response(['test-channel'])
+    stream = iter(response.response)
+    assert next(stream) == "retry: 3000\n\n"
+    storefront.broker.publish('test-channel', {'type': 'order.status', 'order_id': 9, 'status': 'Ready'})
+    assert '"status": "Ready"' in next(stream)
+    stream.close()
+    assert storefront.broker.stats()['subscribers'] == 0
+
+
+def test_full_subscriber_drops_instead_of_blocking():
+    broker = storefront.EventBroker(buffer_size=1)
+    subscriber = broker.subscribe('c')
+    broker.publish('c', {'n': 1})
+    broker.publish('c', {'n': 2})
+    assert subscriber.get_nowait() == {'n': 1}
+    assert broker.stats()['dropped'] == 1
+
+
+def test_events_are_delivered_locally_without_a_database(monkeypatch):
+    monkeypatch.setattr(storefront, 'get_db_connection', lambda *args, **kwargs: None)
+    feed = storefront.OrderEventFeed(storefront.EventBroker())
+    kitchen = feed.broker.subscribe(storefront.KITCHEN_CHANNEL)
+    order = feed.broker.subscribe(storefront.order_channel(4))
+    feed.publish({'type': 'order.status', 'order_id': 4, 'status': 'Ready'})
+    assert kitchen.get_nowait()['status'] == 'Ready'
+    assert order.get_nowait()['status'] == 'Ready'
+
+
+def test_events_reach_streams_in_other_processes_once(db):
+    # Two feeds with their own brokers stand in for two gunicorn workers.
+    here = storefront.OrderEventFeed(storefront.EventBroker())
+    there = storefront.OrderEventFeed(storefront.EventBroker())
+    here.publish({'type': 'order.placed', 'order_id': 1, 'status': 'Processing'})
+    assert here.poll_once() == 0
+    assert there.poll_once() == 0
+
+    local = here.broker.subscribe(storefront.KITCHEN_CHANNEL)
+    remote = there.broker.subscribe(storefront.order_channel(2))
+    here.publish({'type': 'order.status', 'order_id': 2, 'status': 'Ready'})
+    assert here.poll_once() == 0
+    assert there.poll_once() == 1
+    assert there.poll_once() == 0
+    assert local.get_nowait()['status'] == 'Ready'
+    assert remote.get_nowait() == {'type': 'order.status', 'order_id': 2, 'status': 'Ready'}
+    assert remote.empty()
@@ -0,0 +1,103 @@
+import io
+import os
+
+import pytest
+
+import app as storefront
+from conftest import add_product, add_user
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def encode(img, fmt, **options):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    images = storefront.ImagePipeline(str(tmp_path), (16, 32), workers=1)
+    yield images
+    if images._executor is not None:
+        images._executor.shutdown(wait=True)
+
+
+def test_original_is_servable_as_soon_as_store_returns(pipeline, tmp_path):
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'
+    data = encode(Image.new('RGB', (64, 48), 'red'), 'JPEG', exif=exif.tobytes())
+    rel = pipeline.store(data, 'jpeg')
+    path = os.path.join(str(tmp_path), rel[len(pipeline.url_prefix) + 1:])
+    assert rel.endswith('.jpg')
+    assert os.path.isfile(path)
+    with Image.open(path) as img:
+        assert not img.getexif()
+    pipeline._executor.shutdown(wait=True)
+    assert [width for _, width in pipeline.variants(rel)] == [16, 32]
+
+
+def test_duplicate_upload_is_stored_once(pipeline):
+    data = encode(Image.new('RGB', (20, 20), 'blue'), 'PNG')
+    assert pipeline.store(data, 'png', background=False) == pipeline.store(data, 'png', background=False)
+    assert pipeline.stats()['deduplicated'] == 1
+
+
+def test_animated_gif_keeps_its_frames(pipeline, tmp_path):
+    frames = [Image.new('RGB', (64, 64), color) for color in ('red', 'green', 'blue')]
+    data = encode(frames[0], 'GIF', save_all=True, append_images=frames[1:], duration=80, loop=0)
+    rel = pipeline.store(data, 'gif', background=False)
+    with Image.open(os.path.join(str(tmp_path), rel[len(pipeline.url_prefix) + 1:])) as img:
+        assert img.n_frames == 3
+    variant = pipeline._variant_name(os.path.join(str(tmp_path), rel[len(pipeline.url_prefix) + 1:]), 32)
+    with Image.open(variant) as img:
+        assert img.format == 'WEBP'
+        assert img.n_frames == 3
+        assert img.width == 32
+
+
+def test_unreadable_upload_is_kept_as_is(pipeline, tmp_path):
+    rel = pipeline.store(b'not an image', 'png', background=False)
+    with open(os.path.join(str(tmp_path), rel[len(pipeline.url_prefix) + 1:]), 'rb') as f:
+        assert f.read() == b'not an image'
+    assert pipeline.variants(rel) == []
+
+
+def test_orphaned_originals_are_removed_unless_still_referenced(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(storefront.app, 'static_folder', str(tmp_path))
+    for name in ('old-dish.png', 'old-avatar.png', 'ordered.png'):
+        (tmp_path / name).write_bytes(b'x')
+    user_id = add_user(db)
+    product_id = add_product(db, 'Dosa')
+    with db.cursor() as cur:
+        cur.execute("UPDATE user_details SET profile_picture_url = 'old-avatar.png' WHERE profile_id = %s", (user_id,))
+        cur.execute("INSERT INTO orders (user_id, total_amount, status) VALUES (%s, 100, 'Completed')", (user_id,))
+        cur.execute("INSERT INTO order_items (order_id, product_id, quantity, price, product_image) "
+                    "VALUES (%s, %s, 1, 100, '/static/ordered.png')", (cur.lastrowid, product_id))
+    db.commit()
+    conn = storefront.get_db_connection(request_scoped=False)
+    try:
+        removed = storefront.remove_orphaned_images(conn, {'old-dish.png', 'old-avatar.png', 'ordered.png'})
+    finally:
+        conn.close()
+    assert removed == 1
+    assert sorted(os.listdir(str(tmp_path))) == ['old-avatar.png', 'ordered.png']
+
+
+def test_variants_built_elsewhere_show_up_and_change_the_key(pipeline, tmp_path, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(storefront.time, 'monotonic', lambda: clock[0])
+    (tmp_path / 'dish.png').write_bytes(b'x')
+    rel = f"{pipeline.url_prefix}/dish.png"
+    before = pipeline.variants_key([rel, '/static/assets/logo.png'])
+    assert before == (0, 0)
+
+    # Another process finishes the variants after this one looked.
+    for width in pipeline.widths:
+        with open(pipeline._variant_name(str(tmp_path / 'dish.png'), width), 'wb') as f:
+            f.write(b'x')
+    assert pipeline.variants_key([rel, '/static/assets/logo.png']) == before
+    clock[0] += pipeline.RECHECK_SECONDS
+    assert pipeline.variants_key([rel, '/static/assets/logo.png']) == (2, 0)
+    clock[0] += 3600
+    assert [width for _, width in pipeline.variants(rel)] == [16, 32]
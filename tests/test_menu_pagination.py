@@ -0,0 +1,74 @@
+import pytest
+
+import app as storefront
+from conftest import add_product
+
+
+def test_first_page_query_orders_by_keyset_and_fetches_one_extra():
+    query, params, limit, fields = storefront.menu_page_query({'limit': '20', 'category': 'mains'})
+    assert query.endswith("ORDER BY category, name, product_id LIMIT %s")
+    assert "category = %s" in query
+    assert params == ['mains', 21]
+    assert (limit, fields) == (20, None)
+
+
+def test_limit_is_clamped():
+    assert storefront.menu_page_query({'limit': '0'})[2] == 1
+    assert storefront.menu_page_query({'limit': '100000'})[2] == storefront.MENU_MAX_PAGE_SIZE
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(ValueError):
+        storefront.menu_page_query({'fields': 'name,password'})
+
+
+def test_projection_keeps_keyset_columns():
+    query, _, _, fields = storefront.menu_page_query({'fields': 'id,price'})
+    assert query.startswith("SELECT product_id, name, category, price FROM products")
+    assert fields == ['id', 'price']
+
+
+def test_cursor_round_trips_null_category():
+    cursor = storefront.encode_menu_cursor({'category': None, 'name': 'Tea', 'product_id': 7})
+    assert storefront.decode_menu_cursor(cursor) == (None, 'Tea', 7)
+
+
+def test_cursor_inside_null_categories_continues_into_named_ones():
+    cursor = storefront.encode_menu_cursor({'category': None, 'name': 'Tea', 'product_id': 7})
+    query, params, _, _ = storefront.menu_page_query({'cursor': cursor})
+    assert "category IS NOT NULL" in query
+    assert "category > %s" not in query
+    assert params[:3] == ['Tea', 'Tea', 7]
+
+
+def test_cursor_with_category_uses_expanded_row_comparison():
+    cursor = storefront.encode_menu_cursor({'category': 'mains', 'name': 'Dal', 'product_id': 3})
+    query, params, _, _ = storefront.menu_page_query({'cursor': cursor})
+    assert "(category > %s OR (category = %s AND (name > %s OR (name = %s AND product_id > %s))))" in query
+    assert params[:5] == ['mains', 'mains', 'Dal', 'Dal', 3]
+
+
+def test_result_trims_the_lookahead_row_into_a_cursor():
+    rows = [{'product_id': i, 'category': 'mains', 'name': f'Item {i}'} for i in range(1, 4)]
+    result = storefront.menu_page_result(rows, 2, ['id', 'name'])
+    assert result['items'] == [{'id': 1, 'name': 'Item 1'}, {'id': 2, 'name': 'Item 2'}]
+    assert storefront.decode_menu_cursor(result['next_cursor']) == ('mains', 'Item 2', 2)
+
+
+def test_pages_cover_every_product_including_null_categories(db, client):
+    with db.cursor() as cur:
+        cur.execute("ALTER TABLE products MODIFY category VARCHAR(50) NULL")
+    expected = [add_product(db, name, category) for name, category in
+                [('Chai', None), ('Lassi', None), ('Dal', 'mains'), ('Roti', 'mains'), ('Jamun', 'desserts')]]
+    seen, cursor = [], None
+    for _ in range(10):
+        params = {'limit': 2, 'fields': 'id'}
+        if cursor:
+            params['cursor'] = cursor
+        page = client.get('/api/canteen/menu', query_string=params).get_json()
+        seen.extend(item['id'] for item in page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert sorted(seen) == sorted(expected)
+    assert len(seen) == len(set(seen))
@@ -0,0 +1,171 @@
+from decimal import Decimal
+
+import pytest
+
+import app as storefront
+from conftest import add_product, add_user
+
+
+@pytest.fixture
+def queue():
+    # A private queue with the app's handlers, so stats start from zero and
+    # no listener publishes to live streams.
+    q = storefront.OrderQueue(batch_size=10, max_attempts=2)
+    q.handlers = dict(storefront.order_queue.handlers)
+    return q
+
+
+def place(db, name='Dal', quantity=2):
+    user_id = add_user(db)
+    product_id = add_product(db, name, stock=10)
+    with db.cursor() as cur:
+        cur.execute("INSERT INTO cart_items (user_id, product_id, quantity) VALUES (%s, %s, %s)", (user_id, product_id, quantity))
+    db.commit()
+    conn = storefront.db_pool.acquire()
+    try:
+        order_id, _, _ = storefront.place_order(conn, user_id, f'key-{user_id}')
+    finally:
+        conn.release()
+    return user_id, order_id
+
+
+def fetch(db, query, params=()):
+    db.commit()
+    with db.cursor(dictionary=True) as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+def test_placed_order_is_confirmed_ticketed_and_rolled_up(db, queue):
+    events = []
+    queue.listeners.append(events.append)
+    user_id, order_id = place(db, 'Dal', 2)
+
+    assert queue.run_once() == 2
+
+    assert fetch(db, "SELECT status FROM orders WHERE order_id = %s", (order_id,))[0]['status'] == 'Confirmed'
+    assert fetch(db, "SELECT summary FROM kitchen_tickets WHERE order_id = %s", (order_id,))[0]['summary'] == '2 x Dal'
+    assert fetch(db, "SELECT order_count, items_sold FROM sales_hourly") == [{'order_count': 1, 'items_sold': 2}]
+    assert {row['status'] for row in fetch(db, "SELECT status FROM order_jobs")} == {'done'}
+    assert [(e['order_id'], e['status'], e['user_id']) for e in events] == [(order_id, 'Confirmed', user_id)]
+    assert queue.run_once() == 0
+
+
+def test_latency_is_measured_on_the_database_clock(db, queue):
+    # Skew the stored creation time by a timezone-sized offset: the job age
+    # must still come out as the time since that stored value, never negative.
+    _, order_id = place(db)
+    with db.cursor() as cur:
+        cur.execute("UPDATE order_jobs SET created_at = NOW(3) - INTERVAL 2 SECOND")
+    db.commit()
+
+    queue.run_once()
+    stats = queue.stats()
+    assert stats['processed'] == 2
+    assert 2 <= stats['latency_max'] < 60
+
+
+def test_failing_job_backs_off_then_fails(db, queue):
+    calls = []
+
+    def broken(conn, job):
+        calls.append(job['job_id'])
+        raise RuntimeError("printer on fire")
+
+    queue.handlers['order.placed'] = broken
+    place(db)
+
+    queue.run_once()
+    job = fetch(db, "SELECT status, attempts, last_error, available_at > NOW(3) AS delayed FROM order_jobs WHERE kind = 'order.placed'")[0]
+    assert (job['status'], job['attempts'], job['last_error'], job['delayed']) == ('pending', 1, 'printer on fire', 1)
+
+    with db.cursor() as cur:
+        cur.execute("UPDATE order_jobs SET available_at = NOW(3) WHERE kind = 'order.placed'")
+    db.commit()
+    queue.run_once()
+    job = fetch(db, "SELECT status, attempts FROM order_jobs WHERE kind = 'order.placed'")[0]
+    assert (job['status'], job['attempts']) == ('failed', 2)
+    assert len(calls) == 2
+    assert queue.stats()['retried'] == 1 and queue.stats()['failed'] == 1
+
+
+def test_rollup_rebuild_consumes_claimed_jobs(db, queue):
+    place(db, 'Dal', 2)
+    conn = storefront.db_pool.acquire()
+    try:
+        jobs = queue._claim(conn)
+        assert {job['kind'] for job in jobs} == {'order.placed', 'order.rollup'}
+
+        # The rebuild lands between a worker's claim and its processing.
+        result = storefront.app.test_cli_runner().invoke(args=['rebuild-sales-rollups'])
+        assert result.exit_code == 0, result.output
+
+        for job in jobs:
+            queue._process(conn, job)
+    finally:
+        conn.release()
+
+    assert fetch(db, "SELECT order_count, items_sold FROM sales_hourly") == [{'order_count': 1, 'items_sold': 2}]
+    assert fetch(db, "SELECT SUM(units) AS units FROM product_sales_daily")[0]['units'] == 2
+    assert {row['status'] for row in fetch(db, "SELECT status FROM order_jobs")} == {'done'}
+
+
+def test_rollups_fold_each_order_in_by_hour_product_and_category(db, queue):
+    user_id = add_user(db)
+    dal = add_product(db, 'Dal', category='mains', price=40)
+    roti = add_product(db, 'Roti', category='breads', price=10)
+    lassi = add_product(db, 'Lassi', category='drinks', price=30)
+    for key, lines in (('key-1', [(dal, 2), (roti, 3)]), ('key-2', [(dal, 1), (lassi, 1)])):
+        with db.cursor() as cur:
+            for product_id, quantity in lines:
+                cur.execute("INSERT INTO cart_items (user_id, product_id, quantity) VALUES (%s, %s, %s)",
+                            (user_id, product_id, quantity))
+        db.commit()
+        conn = storefront.db_pool.acquire()
+        try:
+            storefront.place_order(conn, user_id, key)
+        finally:
+            conn.release()
+
+    assert queue.run_once() == 4
+
+    # Summed across buckets, so the test holds when it straddles an hour or day.
+    assert fetch(db, "SELECT SUM(order_count) AS orders, SUM(items_sold) AS items, SUM(revenue) AS revenue FROM sales_hourly") == [
+        {'orders': 2, 'items': 7, 'revenue': Decimal('180.00')}]
+    assert fetch(db, "SELECT product_id, SUM(units) AS units, SUM(revenue) AS revenue FROM product_sales_daily "
+                     "GROUP BY product_id ORDER BY product_id") == [
+        {'product_id': dal, 'units': 3, 'revenue': Decimal('120.00')},
+        {'product_id': roti, 'units': 3, 'revenue': Decimal('30.00')},
+        {'product_id': lassi, 'units': 1, 'revenue': Decimal('30.00')}]
+    assert fetch(db, "SELECT category, SUM(units) AS units, SUM(revenue) AS revenue FROM category_sales_daily "
+                     "GROUP BY category ORDER BY category") == [
+        {'category': 'breads', 'units': 3, 'revenue': Decimal('30.00')},
+        {'category': 'drinks', 'units': 1, 'revenue': Decimal('30.00')},
+        {'category': 'mains', 'units': 3, 'revenue': Decimal('120.00')}]
+    assert fetch(db, "SELECT COUNT(DISTINCT user_id) AS users FROM active_users_daily") == [{'users': 1}]
+
+
+def test_order_detail_is_cached_until_its_status_changes(db, queue, client):
+    queue.listeners.append(storefront.forget_cached_order)
+    user_id, order_id = place(db, 'Dal', 2)
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['is_admin'] = True
+
+    assert b'Processing' in client.get(f'/order/{order_id}').data
+    assert storefront.order_cache.get(order_id)['items'][0]['quantity'] == 2
+
+    queue.run_once()
+    assert storefront.order_cache.get(order_id) is None
+    assert b'Confirmed' in client.get(f'/order/{order_id}').data
+
+    response = client.post(f'/api/admin/orders/{order_id}/status', json={'status': 'Completed'})
+    assert response.get_json()['success'] is True
+    assert storefront.order_cache.get(order_id) is None
+    assert b'Completed' in client.get(f'/order/{order_id}').data
+    # Final orders never change again, so they are cached without a TTL.
+    assert storefront.order_cache._data[order_id][1] is None
+
+    with client.session_transaction() as session:
+        session['user_id'] = user_id + 1
+    assert client.get(f'/order/{order_id}').status_code == 302
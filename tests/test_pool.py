@@ -0,0 +1,140 @@
+import threading
+
+import pytest
+
+import app as storefront
+
+
+class FakeConnection:
+    def __init__(self):
+        self.in_transaction = False
+        self.connected = True
+        self.rolled_back = 0
+        self.closed = False
+
+    def is_connected(self):
+        return self.connected
+
+    def rollback(self):
+        self.rolled_back += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(storefront.ConnectionPool):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.made = []
+
+    def _connect(self):
+        conn = FakeConnection()
+        self.made.append(conn)
+        self._count('connects')
+        return conn, storefront.time.monotonic()
+
+
+def test_idle_connections_are_reused():
+    pool = FakePool(size=2, max_overflow=0)
+    first = pool.acquire()
+    raw = first._conn
+    first.release()
+    second = pool.acquire()
+    assert second._conn is raw
+    assert pool.stats()['connects'] == 1
+    second.release()
+    with pytest.raises(storefront.Error):
+        second.cursor()
+
+
+def test_overflow_connections_are_closed_on_release():
+    pool = FakePool(size=1, max_overflow=1, timeout=0.05)
+    conns = [pool.acquire(), pool.acquire()]
+    assert pool.stats()['open'] == 2
+    overflow = conns[1]._conn
+    for conn in conns:
+        conn.release()
+    stats = pool.stats()
+    assert (stats['open'], stats['idle'], stats['in_use']) == (1, 1, 0)
+    assert overflow.closed
+
+
+def test_acquire_times_out_when_exhausted():
+    pool = FakePool(size=1, max_overflow=0, timeout=0.05)
+    held = pool.acquire()
+    with pytest.raises(storefront.PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    held.release()
+    pool.acquire().release()
+
+
+def test_waiter_gets_the_released_connection():
+    pool = FakePool(size=1, max_overflow=0, timeout=2)
+    held = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    threading.Timer(0.05, held.release).start()
+    waiter.join(3)
+    assert got and pool.stats()['waits'] == 1
+    got[0].release()
+
+
+def test_stale_and_dead_connections_are_replaced(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(storefront.time, 'monotonic', lambda: now[0])
+    pool = FakePool(size=1, max_overflow=0, recycle=60)
+    conn = pool.acquire()
+    old = conn._conn
+    conn.release()
+    now[0] += 61
+    conn = pool.acquire()
+    assert conn._conn is not old and old.closed
+    dead = conn._conn
+    conn.release()
+    dead.connected = False
+    conn = pool.acquire()
+    assert conn._conn is not dead
+    stats = pool.stats()
+    assert (stats['recycled'], stats['ping_failures'], stats['open']) == (1, 1, 1)
+    conn.release()
+
+
+def test_open_transaction_is_rolled_back_on_release():
+    pool = FakePool(size=1, max_overflow=0)
+    conn = pool.acquire()
+    raw = conn._conn
+    raw.in_transaction = True
+    conn.release()
+    assert raw.rolled_back == 1
+    assert pool.acquire()._conn is raw
+
+
+def test_request_scoped_connection_survives_close():
+    pool = FakePool(size=1, max_overflow=0)
+    conn = pool.acquire(request_scoped=True)
+    conn.close()
+    assert conn._conn is not None
+    conn.release()
+    assert pool.stats()['in_use'] == 0
+
+
+def test_failed_connect_frees_its_slot():
+    pool = FakePool(size=1, max_overflow=0, timeout=0.05)
+
+    def refuse():
+        raise storefront.Error("Can't connect")
+    pool._connect = refuse
+    with pytest.raises(storefront.Error):
+        pool.acquire()
+    assert pool.stats()['open'] == 0
+
+
+def test_dispose_closes_idle_connections():
+    pool = FakePool(size=2, max_overflow=0)
+    assert pool.warm(2) == 2
+    pool.dispose()
+    assert all(conn.closed for conn in pool.made)
+    assert pool.stats()['open'] == 0
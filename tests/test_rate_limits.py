@@ -0,0 +1,75 @@
+import secrets
+
+import pytest
+
+import app as storefront
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    limiter = storefront.TokenBucketLimiter({'global_ip': '2/60', 'cart_client': '1/60'})
+    monkeypatch.setattr(storefront, 'rate_limiter', limiter)
+    monkeypatch.setitem(storefront.app.config, 'RATE_LIMIT_ENABLED', True)
+    return limiter
+
+
+def test_parse_rate():
+    assert storefront.parse_rate('600/60') == (600, 10.0)
+    assert storefront.parse_rate('5/300') == (5, 5 / 300)
+
+
+def test_bucket_refills_at_its_rate(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(storefront.time, 'monotonic', lambda: clock[0])
+    limiter = storefront.TokenBucketLimiter({'login_ip': '2/10'})
+    assert limiter.take('login_ip', '1.2.3.4') == (True, 0.0)
+    assert limiter.take('login_ip', '1.2.3.4') == (True, 0.0)
+    allowed, retry = limiter.take('login_ip', '1.2.3.4')
+    assert not allowed and retry == pytest.approx(5.0)
+    assert limiter.take('login_ip', '5.6.7.8') == (True, 0.0)
+    clock[0] += 5
+    assert limiter.take('login_ip', '1.2.3.4') == (True, 0.0)
+    assert limiter.stats()['policies']['login_ip']['rejected'] == 1
+
+
+def test_full_buckets_are_swept_past_max_keys(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(storefront.time, 'monotonic', lambda: clock[0])
+    limiter = storefront.TokenBucketLimiter({'menu_ip': '10/10'}, max_keys=2)
+    limiter.take('menu_ip', 'a')
+    limiter.take('menu_ip', 'b')
+    clock[0] += 10
+    limiter.take('menu_ip', 'c')
+    assert limiter.stats()['tracked_keys'] == 1
+
+
+def test_rejection_is_a_429_with_retry_after(client, limited):
+    assert client.get('/no-such-page').status_code == 404
+    assert client.get('/no-such-page').status_code == 404
+    response = client.get('/no-such-page')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    assert response.get_json()['success'] is False
+
+
+def test_client_identity_trusts_only_signed_in_sessions():
+    cookie = storefront.app.session_interface.get_cookie_name(storefront.app)
+    sid = secrets.token_urlsafe(32)
+    storefront.session_store.save(sid, {'user_id': 7})
+    with storefront.app.test_request_context(headers={'Cookie': f'{cookie}={sid}'}):
+        assert storefront.client_identity() == 'user:7'
+    for forged in ('some-session-id', secrets.token_urlsafe(32)):
+        with storefront.app.test_request_context(headers={'Cookie': f'{cookie}={forged}'},
+                                                 environ_base={'REMOTE_ADDR': '10.0.0.7'}):
+            assert storefront.client_identity() == 'ip:10.0.0.7'
+    with storefront.app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.7'}):
+        assert storefront.client_identity() == 'ip:10.0.0.7'
+
+
+def test_fresh_cookies_do_not_reset_the_cart_limit(client, monkeypatch):
+    monkeypatch.setattr(storefront, 'rate_limiter', storefront.TokenBucketLimiter({'global_ip': '100/60', 'cart_client': '1/60'}))
+    monkeypatch.setitem(storefront.app.config, 'RATE_LIMIT_ENABLED', True)
+    cookie = storefront.app.session_interface.get_cookie_name(storefront.app)
+    statuses = [client.patch('/api/cart', json={'items': {}}, headers={'Cookie': f'{cookie}={secrets.token_urlsafe(32)}'}).status_code
+                for _ in range(2)]
+    assert statuses[1] == 429
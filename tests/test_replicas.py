@@ -0,0 +1,109 @@
+import pytest
+from flask import g
+
+import app as storefront
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.query = query
+
+    def fetchall(self):
+        return [] if self.pool.lag == 'standalone' else [{'Seconds_Behind_Source': self.pool.lag}]
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.released = False
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.pool)
+
+    def release(self):
+        self.released = True
+
+
+class FakePool:
+    def __init__(self, lag=0):
+        self.lag = lag
+        self.down = False
+        self.handed_out = []
+
+    def acquire(self, request_scoped=False):
+        if self.down:
+            raise storefront.Error("Can't connect to MySQL server")
+        conn = FakeConnection(self)
+        self.handed_out.append(conn)
+        return conn
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(storefront.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def router(*pools, **kwargs):
+    return storefront.ReplicaRouter([(f'replica{i}', pool) for i, pool in enumerate(pools)], **kwargs)
+
+
+def test_reads_rotate_across_healthy_replicas(clock):
+    first, second = FakePool(), FakePool(lag='standalone')
+    replicas = router(first, second)
+    assert [replicas.acquire().replica for _ in range(4)] == ['replica0', 'replica1', 'replica0', 'replica1']
+    assert replicas.stats()['replica_reads'] == 4
+
+
+def test_lagging_or_stopped_replica_is_skipped_until_it_recovers(clock):
+    lagging, stopped = FakePool(lag=30), FakePool(lag=None)
+    replicas = router(lagging, stopped, max_lag=5, check_interval=2, retry_interval=10)
+    assert replicas.acquire() is None
+    status = {r['name']: r['error'] for r in replicas.stats()['replicas']}
+    assert status == {'replica0': 'lagging 30s', 'replica1': 'replication stopped'}
+
+    lagging.lag = 1
+    clock[0] += 5
+    assert replicas.acquire() is None
+    clock[0] += 10
+    assert replicas.acquire().replica == 'replica0'
+
+
+def test_unreachable_replica_fails_over(clock):
+    broken, healthy = FakePool(), FakePool()
+    replicas = router(broken, healthy)
+    replicas.acquire()
+    replicas.acquire()
+    broken.down = True
+    clock[0] += 3
+    assert replicas.acquire().replica == 'replica1'
+    assert not replicas.replicas[0]['healthy']
+    assert replicas.acquire().replica == 'replica1'
+
+
+def test_writers_read_from_the_primary(clock, monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(storefront, 'replica_router', router(pool))
+    with storefront.app.test_request_context():
+        conn = storefront.get_read_connection()
+        assert conn.replica == 'replica0'
+        assert storefront.get_read_connection() is conn
+        g.db_wrote = True
+        assert storefront.get_read_connection() is None
+    assert conn.released
+    assert storefront.replica_router.stats()['pinned_reads'] == 1
+    with storefront.app.test_request_context(headers={'Cookie': f'{storefront.PRIMARY_PIN_COOKIE}=9e18'}):
+        assert storefront.get_read_connection() is not None
@@ -0,0 +1,78 @@
+import pytest
+
+import app as storefront
+
+PRODUCTS = [
+    {'product_id': 1, 'name': 'Paneer Butter Masala', 'category': 'mains', 'badge': None,
+     'description': 'Cottage cheese in a tomato gravy'},
+    {'product_id': 2, 'name': 'Chicken Biryani', 'category': 'mains', 'badge': 'Spicy',
+     'description': 'Basmati rice layered with chicken'},
+    {'product_id': 3, 'name': 'Masala Chai', 'category': 'beverages', 'badge': None,
+     'description': 'Milk tea with spices'},
+    {'product_id': 4, 'name': 'Gulab Jamun', 'category': 'desserts', 'badge': None,
+     'description': 'Milk dumplings in syrup'},
+]
+
+
+@pytest.fixture
+def index():
+    index = storefront.SearchIndex()
+    index.rebuild(1, PRODUCTS)
+    return index
+
+
+def ids(index, query, **kwargs):
+    return [product_id for product_id, _ in index.search(query, **kwargs)[0]]
+
+
+def test_fold_term_meets_romanized_spellings():
+    assert storefront.fold_term('paneer') == storefront.fold_term('panir')
+    assert storefront.fold_term('chawal') == storefront.fold_term('chaval')
+    assert storefront.fold_term('phirni') == storefront.fold_term('firni')
+
+
+def test_search_terms_drop_stopwords_and_transliterate():
+    assert storefront.search_terms('The Paneer and Rice') == ['panir', 'rice']
+    assert storefront.search_terms('पनीर') == storefront.search_terms('paneer')
+    assert storefront.search_terms('చికెన్') == ['chiken']
+
+
+def test_exact_prefix_and_typo_matches(index):
+    assert ids(index, 'biryani') == [2]
+    assert ids(index, 'masa') == [1, 3]
+    assert ids(index, 'biriyani') == [2]
+    assert ids(index, 'chiken') == [2]
+
+
+def test_name_matches_outrank_description_matches(index):
+    assert ids(index, 'milk') == [3, 4]
+    assert ids(index, 'chicken rice') == [2]
+    assert ids(index, 'chicken') == [2]
+    assert ids(index, 'masala chai')[0] == 3
+
+
+def test_every_word_must_match(index):
+    assert ids(index, 'paneer biryani') == []
+
+
+def test_synonyms_reach_english_menu_words(index):
+    assert ids(index, 'murgh') == [2]
+    assert ids(index, 'doodh') == [3, 4]
+    assert ids(index, 'meetha') == [4]
+
+
+def test_where_and_limit(index):
+    assert ids(index, 'masala', where=lambda pid: pid != 1) == [3]
+    assert ids(index, 'milk', limit=1) == [3]
+
+
+def test_catalog_changes_are_applied_in_order(index):
+    index.on_catalog_change('upsert', 2, {'product_id': 5, 'name': 'Mango Lassi', 'category': 'beverages',
+                                          'badge': None, 'description': 'Curd and mango'})
+    assert ids(index, 'lassi') == [5]
+    index.on_catalog_change('delete', 3, 2)
+    assert ids(index, 'biryani') == []
+    # A gap in versions means a change was missed; wait for the next rebuild.
+    index.on_catalog_change('delete', 5, 1)
+    assert ids(index, 'paneer') == [1]
+    assert index.version == 3
@@ -0,0 +1,113 @@
+import time
+
+from flask import g
+
+import app as storefront
+
+interface = storefront.app.session_interface
+COOKIE = interface.get_cookie_name(storefront.app)
+
+
+def open_session(sid=None):
+    headers = {'Cookie': f'{COOKIE}={sid}'} if sid else {}
+    with storefront.app.test_request_context(headers=headers) as ctx:
+        return interface.open_session(storefront.app, ctx.request)
+
+
+def save_session(session):
+    response = storefront.app.response_class()
+    interface.save_session(storefront.app, session, response)
+    return response
+
+
+def new_session(**data):
+    session = open_session()
+    session.update(data)
+    response = save_session(session)
+    assert COOKIE in response.headers['Set-Cookie']
+    return session.sid
+
+
+def stored(sid):
+    record = storefront.session_store.load(sid)
+    return record[0] if record else None
+
+
+def test_cookie_holds_only_the_id_and_data_stays_server_side():
+    sid = new_session(cart={'3': 2})
+    assert len(sid) < 64 and 'cart' not in sid
+    assert stored(sid) == {'cart': {'3': 2}}
+
+
+def test_unread_session_is_not_written():
+    sid = new_session(username='alice')
+    session = open_session(sid)
+    response = save_session(session)
+    assert not session.loaded
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_concurrent_requests_keep_each_others_changes():
+    sid = new_session(cart={'3': 2}, username='alice')
+    first, second = open_session(sid), open_session(sid)
+    assert first['cart'] == second['cart']
+    first['cart'] = {'3': 2, '5': 1}
+    second['username'] = 'Alice A.'
+    del second['cart']
+    save_session(first)
+    save_session(second)
+    assert stored(sid) == {'username': 'Alice A.'}
+
+    first, second = open_session(sid), open_session(sid)
+    first['theme'] = 'dark'
+    second['lang'] = 'hi'
+    save_session(first)
+    save_session(second)
+    assert stored(sid) == {'username': 'Alice A.', 'theme': 'dark', 'lang': 'hi'}
+
+
+def test_session_deleted_elsewhere_is_not_revived():
+    sid = new_session(user_id=1)
+    stale = open_session(sid)
+    assert stale['user_id'] == 1
+    logout = open_session(sid)
+    logout.clear()
+    save_session(logout)
+    stale['cart'] = {'1': 1}
+    response = save_session(stale)
+    assert stored(sid) is None
+    assert f'{COOKIE}=;' in response.headers['Set-Cookie']
+
+
+def test_unknown_or_oversized_cookie_is_cleared():
+    session = open_session('no-such-session')
+    assert session.get('user_id') is None
+    assert f'{COOKIE}=;' in save_session(session).headers['Set-Cookie']
+    session = open_session('x' * 65)
+    assert f'{COOKIE}=;' in save_session(session).headers['Set-Cookie']
+
+
+def test_login_rotates_the_session_id():
+    sid = new_session(cart={'3': 1})
+    session = open_session(sid)
+    session['user_id'] = 7
+    save_session(session)
+    assert session.sid != sid
+    assert stored(sid) is None
+    assert stored(session.sid) == {'cart': {'3': 1}, 'user_id': 7}
+
+
+def test_writers_are_pinned_with_a_cookie_not_the_session(monkeypatch):
+    monkeypatch.setattr(storefront.replica_router, 'replicas', ['replica'])
+    with storefront.app.test_request_context():
+        g.db_wrote = True
+        response = storefront.pin_writers_to_primary(storefront.app.response_class())
+        assert not storefront.session.loaded
+    cookie = response.headers['Set-Cookie']
+    assert cookie.startswith(f'{storefront.PRIMARY_PIN_COOKIE}=')
+    until = float(cookie.split(';')[0].split('=')[1])
+    with storefront.app.test_request_context(headers={'Cookie': f'{storefront.PRIMARY_PIN_COOKIE}={until}'}):
+        assert storefront.pinned_to_primary()
+    forged = time.time() + 3600
+    with storefront.app.test_request_context(headers={'Cookie': f'{storefront.PRIMARY_PIN_COOKIE}={forged}'}):
+        assert not storefront.pinned_to_primary()
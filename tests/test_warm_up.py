@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import app as storefront
+
+PRODUCT = {'product_id': 1, 'name': 'Dosa', 'category': 'mains', 'type': 'veg', 'description': 'Crisp',
+           'price': 40, 'image': '/static/images/dosa.jpg', 'stock': 5, 'badge': None}
+
+
+@pytest.fixture
+def fresh_caches(monkeypatch):
+    monkeypatch.setattr(storefront, '_menu_bodies', {'version': None, 'bodies': None})
+    monkeypatch.setattr(storefront, 'search_index', storefront.SearchIndex())
+
+
+def test_warm_up_builds_menu_bodies_without_server_name(fresh_caches, monkeypatch):
+    monkeypatch.setitem(storefront.app.config, 'SERVER_NAME', None)
+    monkeypatch.setattr(storefront.catalog, 'snapshot', lambda: (7, [PRODUCT]))
+    monkeypatch.setattr(storefront.images, 'variants', lambda url: [('store/ab/dosa-320.webp', 320)])
+    result = storefront.warm_up()
+    assert result['products'] == 1
+    assert result['templates'] > 0
+    items = json.loads(storefront._menu_bodies['bodies']['identity'])
+    assert items[0]['image_srcset'] == '/static/store/ab/dosa-320.webp 320w'
+    assert storefront.search_index.version == 7
+
+
+def test_failed_warm_up_step_does_not_abort_boot(fresh_caches, monkeypatch):
+    def unavailable():
+        raise storefront.Error("Can't connect to MySQL server")
+    monkeypatch.setattr(storefront.catalog, 'snapshot', unavailable)
+    result = storefront.warm_up()
+    assert result['products'] is None
+    assert result['templates'] > 0
+    assert storefront.create_app(warm=True) is storefront.app
+
+
+def test_start_up_work_runs_in_create_app_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(storefront, '_app_started', False)
+    monkeypatch.setitem(storefront.app.config, 'ASSET_PIPELINE', True)
+    monkeypatch.setattr(storefront, 'build_static_assets', lambda: calls.append('assets'))
+    monkeypatch.setattr(storefront, 'enable_template_cache', lambda: calls.append('templates'))
+    assert storefront.create_app(warm=False) is storefront.app
+    assert storefront.create_app(warm=False) is storefront.app
+    assert calls == ['templates', 'assets']